@@ -0,0 +1,72 @@
+import json
+
+from ae_query import frame_to_records
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow is only needed for the Arrow export
+    pa = None
+
+DEFAULT_BATCH_ROWS = 5000
+ARROW_STREAM_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+
+def _batches(index, rows, columns, batch_rows):
+    """Yields the selected rows as frames of at most batch_rows rows."""
+    for start in range(0, len(rows), batch_rows):
+        yield index.frame(rows[start:start + batch_rows], columns)
+
+
+def iter_ndjson(index, rows, columns=None, batch_rows=DEFAULT_BATCH_ROWS):
+    """Streams the selected rows as newline-delimited JSON, one batch per chunk."""
+    for frame in _batches(index, rows, columns, batch_rows):
+        lines = [json.dumps(record, default=str) for record in frame_to_records(frame)]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class _ChunkSink:
+    """File-like object that collects what the Arrow writer emits until drained."""
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def arrow_schema(index):
+    """Infers (once per loaded dataset) the Arrow schema of the whole frame."""
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+    if getattr(index, "_arrow_schema", None) is None:
+        index._arrow_schema = pa.Schema.from_pandas(index.df, preserve_index=False)
+    return index._arrow_schema
+
+
+def iter_arrow_ipc(index, rows, columns=None, batch_rows=DEFAULT_BATCH_ROWS):
+    """Streams the selected rows in the Arrow IPC stream format, one record batch per chunk."""
+    schema = arrow_schema(index)
+    if columns:
+        schema = pa.schema([schema.field(column) for column in columns])
+
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        yield sink.drain()
+        for frame in _batches(index, rows, columns, batch_rows):
+            batch = pa.RecordBatch.from_pandas(frame, schema=schema, preserve_index=False)
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()
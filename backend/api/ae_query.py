@@ -0,0 +1,283 @@
+import numpy as np
+import pandas as pd
+
+MONTH_ORDER = ["January", "February", "March", "April", "May", "June",
+               "July", "August", "September", "October", "November", "December"]
+MONTH_NUMBERS = {name.upper(): number for number, name in enumerate(MONTH_ORDER, start=1)}
+
+MAX_PAGE_LIMIT = 10000
+MAX_FORECAST_HORIZON = 60
+DEFAULT_FORECAST_HORIZON = 12
+
+
+class QueryError(ValueError):
+    """Raised when the query string of a data request cannot be parsed."""
+
+
+def month_number(value):
+    """Returns 1-12 for a month name ('July'), abbreviation ('Jul') or number, else None."""
+    if value is None:
+        return None
+    text = str(value).strip()
+    if text.isdigit():
+        number = int(text)
+        return number if 1 <= number <= 12 else None
+    text = text.upper()
+    if text in MONTH_NUMBERS:
+        return MONTH_NUMBERS[text]
+    for name, number in MONTH_NUMBERS.items():
+        if len(text) >= 3 and name.startswith(text):
+            return number
+    return None
+
+
+def normalize_name(value):
+    """Upper-cases and collapses whitespace so org names match regardless of formatting."""
+    return " ".join(str(value).upper().split())
+
+
+def period_key(year, month):
+    """Encodes a (year, month) pair as a sortable integer, e.g. 2023-07 -> 202307."""
+    return int(year) * 100 + int(month)
+
+
+def parse_period(value, end=False):
+    """Parses 'YYYY' or 'YYYY-MM' into a period key. A bare year covers the whole year."""
+    text = str(value).strip()
+    try:
+        if "-" in text:
+            year, month = text.split("-", 1)
+            month = month_number(month)
+            if month is None:
+                raise ValueError
+            return period_key(year, month)
+        return period_key(text, 12 if end else 1)
+    except ValueError:
+        raise QueryError(f"Invalid period '{value}', expected YYYY or YYYY-MM")
+
+
+def _split_values(args, name):
+    """Collects repeated and comma-separated values of a query parameter."""
+    values = []
+    for raw in args.getlist(name):
+        values.extend(part.strip() for part in raw.split(",") if part.strip())
+    return values
+
+
+def _parse_int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise QueryError(f"Parameter '{name}' must be an integer")
+
+
+def parse_query_args(args):
+    """Turns the request's query string into keyword arguments for AEQueryIndex.query."""
+    query = {
+        "org_codes": _split_values(args, "org_code"),
+        "org_names": _split_values(args, "org_name"),
+        "columns": _split_values(args, "columns"),
+        "years": [_parse_int(year, "year") for year in _split_values(args, "year")],
+        "months": [],
+        "start": None,
+        "end": None,
+        "cursor": None,
+        "limit": None,
+    }
+
+    for month in _split_values(args, "month"):
+        number = month_number(month)
+        if number is None:
+            raise QueryError(f"Invalid month '{month}'")
+        query["months"].append(number)
+
+    if args.get("from"):
+        query["start"] = parse_period(args["from"])
+    if args.get("to"):
+        query["end"] = parse_period(args["to"], end=True)
+
+    if args.get("cursor"):
+        query["cursor"] = _parse_int(args["cursor"], "cursor")
+    if args.get("limit"):
+        limit = _parse_int(args["limit"], "limit")
+        if not 1 <= limit <= MAX_PAGE_LIMIT:
+            raise QueryError(f"Parameter 'limit' must be between 1 and {MAX_PAGE_LIMIT}")
+        query["limit"] = limit
+
+    return query
+
+
+def parse_stats_args(args):
+    """Turns the request's query string into filters for OrgMonthTable.chart."""
+    return {
+        "org_codes": tuple(_split_values(args, "org_code")),
+        "org_names": tuple(_split_values(args, "org_name")),
+        "regions": tuple(_split_values(args, "region")),
+        "start": parse_period(args["from"]) if args.get("from") else None,
+        "end": parse_period(args["to"], end=True) if args.get("to") else None,
+    }
+
+
+def parse_anomaly_args(args):
+    """Turns the request's query string into filters for the anomaly detector.
+
+    all=1 returns every scored month instead of only the flagged ones.
+    """
+    query = {
+        "org_codes": _split_values(args, "org_code"),
+        "org_names": _split_values(args, "org_name"),
+        "start": parse_period(args["from"]) if args.get("from") else None,
+        "end": parse_period(args["to"], end=True) if args.get("to") else None,
+        "threshold": None,
+        "include_all": args.get("all", "").strip().lower() in ("1", "true", "yes"),
+    }
+    if args.get("threshold"):
+        try:
+            query["threshold"] = float(args["threshold"])
+        except ValueError:
+            raise QueryError("Parameter 'threshold' must be a number")
+        if not query["threshold"] > 0:
+            raise QueryError("Parameter 'threshold' must be positive")
+    return query
+
+
+def parse_forecast_args(args):
+    """Turns the request's query string into (org_names, horizon) for ForecastService.forecast."""
+    org_names = _split_values(args, "org_name")
+    if not org_names:
+        raise QueryError("Parameter 'org_name' is required")
+    horizon = _parse_int(args.get("horizon", DEFAULT_FORECAST_HORIZON), "horizon")
+    if not 1 <= horizon <= MAX_FORECAST_HORIZON:
+        raise QueryError(f"Parameter 'horizon' must be between 1 and {MAX_FORECAST_HORIZON}")
+    return org_names, horizon
+
+
+def parse_lookup_args(args):
+    """Turns the request's query string into keyword arguments for the hospital lookup.
+
+    org (name, code or prefix) or text (a free-text question) picks the
+    trust; month=YYYY-MM or year=YYYY narrows the answer.
+    """
+    lookup = {"org": args.get("org", "").strip() or None, "text": args.get("text", "").strip() or None,
+              "year": None, "month": None}
+    if not lookup["org"] and not lookup["text"]:
+        raise QueryError("Parameter 'org' or 'text' is required")
+    if args.get("month"):
+        if "-" not in args["month"]:
+            raise QueryError(f"Invalid month '{args['month']}', expected YYYY-MM")
+        key = parse_period(args["month"])
+        lookup["year"], lookup["month"] = key // 100, key % 100
+    elif args.get("year"):
+        lookup["year"] = _parse_int(args["year"], "year")
+    return lookup
+
+
+def frame_to_records(frame):
+    """Converts a frame to JSON-ready records, turning NaN into null."""
+    return frame.astype(object).where(frame.notna(), None).to_dict(orient="records")
+
+
+class AEQueryIndex:
+    """Per-org and per-period row indexes over the merged A&E frame.
+
+    Built once when the dataset loads, so each request only gathers and
+    serializes the rows and columns it actually asked for.
+    """
+
+    def __init__(self, df):
+        self.df = df.reset_index(drop=True)
+        self.columns = list(self.df.columns)
+
+        if "year" in self.df and "month" in self.df:
+            # float64, not the frame's narrow nullable int, so year * 100 cannot overflow
+            years = pd.to_numeric(self.df["year"], errors="coerce").astype("float64")
+            months = pd.to_numeric(self.df["month"].map(month_number), errors="coerce").astype("float64")
+            keys = (years * 100 + months).fillna(0)
+        else:
+            keys = pd.Series(0, index=self.df.index)
+        self.period_keys = keys.to_numpy(dtype=np.int64)
+
+        # Row positions sorted by period, so a date range is one contiguous slice
+        self._period_order = np.argsort(self.period_keys, kind="stable")
+        self._sorted_keys = self.period_keys[self._period_order]
+
+        self.by_org_code = self._build_index("org_code", lambda codes: codes.astype(str).str.strip().str.upper())
+        self.by_org_name = self._build_index("org_name", lambda names: names.astype(str).map(normalize_name))
+
+    def _build_index(self, column, normalize):
+        if column not in self.df:
+            return {}
+        keys = normalize(self.df[column])
+        return {key: np.asarray(rows, dtype=np.int64)
+                for key, rows in keys.groupby(keys, sort=False).indices.items()}
+
+    def _lookup(self, index, keys):
+        matches = [index[key] for key in keys if key in index]
+        if not matches:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(matches))
+
+    def rows_for_periods(self, start=None, end=None):
+        """Sorted row positions whose period key lies in [start, end]."""
+        lo = 0 if start is None else np.searchsorted(self._sorted_keys, start, side="left")
+        hi = len(self._sorted_keys) if end is None else np.searchsorted(self._sorted_keys, end, side="right")
+        return np.sort(self._period_order[lo:hi])
+
+    def select(self, org_codes=None, org_names=None, start=None, end=None, years=None, months=None):
+        """Returns the sorted row positions matching every given filter."""
+        rows = None
+
+        def narrow(current, candidates):
+            return candidates if current is None else np.intersect1d(current, candidates, assume_unique=True)
+
+        if org_codes:
+            rows = narrow(rows, self._lookup(self.by_org_code, [code.strip().upper() for code in org_codes]))
+        if org_names:
+            rows = narrow(rows, self._lookup(self.by_org_name, [normalize_name(name) for name in org_names]))
+        if start is not None or end is not None:
+            rows = narrow(rows, self.rows_for_periods(start, end))
+        if rows is None:
+            rows = np.arange(len(self.df), dtype=np.int64)
+
+        if years or months:
+            keys = self.period_keys[rows]
+            mask = np.ones(len(rows), dtype=bool)
+            if years:
+                mask &= np.isin(keys // 100, years)
+            if months:
+                mask &= np.isin(keys % 100, months)
+            rows = rows[mask]
+
+        return rows
+
+    def check_columns(self, columns):
+        unknown = [column for column in columns or [] if column not in self.columns]
+        if unknown:
+            raise QueryError(f"Unknown columns: {', '.join(unknown)}")
+
+    def select_page(self, cursor=None, limit=None, **filters):
+        """Applies the filters and cursor pagination, returning (rows, next_cursor).
+
+        The cursor is the row position of the last record on the previous
+        page; next_cursor is None on the last page.
+        """
+        rows = self.select(**filters)
+        if cursor is not None:
+            rows = rows[np.searchsorted(rows, cursor, side="right"):]
+
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = int(rows[-1])
+        return rows, next_cursor
+
+    def frame(self, rows, columns=None):
+        """Gathers the given row positions, projected onto columns if given."""
+        frame = self.df.iloc[rows]
+        return frame[columns] if columns else frame
+
+    def query(self, columns=None, **filters):
+        """Runs a filtered, column-projected query, returning (records, next_cursor)."""
+        self.check_columns(columns)
+        rows, next_cursor = self.select_page(**filters)
+        return frame_to_records(self.frame(rows, columns)), next_cursor
@@ -1,32 +1,438 @@
-from flask import Flask, jsonify
+import os
+import sys
+import threading
+from collections import namedtuple
+
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from flask_cors import CORS  # ✅ Import CORS
-import pandas as pd
+
+# ✅ Make the shared backend modules (src/...) importable when run from api/
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from src.data_analysis.ae_aggregates import CHARTS, OrgMonthTable
+from src.data_analysis.anomaly_state import AnomalyDetector
+from src.data_preprocessing.ae_dataset import manifest_path, read_stage, stage_exists
+from src.data_preprocessing.ae_schema import compact_frame, load_ae_csv, memory_report
+from src.modelling.prediction_export import MANIFEST_NAME, SHARD_DIR_NAME
+from src.utils.profiling import (PROFILE_ENABLED, RequestMetrics, RequestTiming, current_run, peak_rss_bytes,
+                                 profile_stage, rss_bytes)
+
+from ae_export import ARROW_STREAM_MIMETYPE, DEFAULT_BATCH_ROWS, iter_arrow_ipc, iter_ndjson
+from ae_query import (AEQueryIndex, QueryError, parse_anomaly_args, parse_forecast_args, parse_lookup_args,
+                      parse_query_args, parse_stats_args)
+from forecast_service import ForecastService
+from hospital_index import HospitalIndex, load_predictions, org_codes
+from response_cache import FileVersion, ResponseCache
 
 app = Flask(__name__)
-CORS(app)  # ✅ Enable CORS for all routes
+# ✅ Enable CORS for all routes
+CORS(app, expose_headers=["X-Next-Cursor", "X-Row-Count", "ETag", "Server-Timing", "X-Response-Time-Ms"])
 
-# ✅ Load the cleaned NHS dataset
+# ✅ Load the cleaned NHS dataset: the partitioned Parquet stage when built, else the CSV
 DATASET_PATH = "nhs_ae_merged.csv"
+DATASET_STAGE = os.getenv("AE_DATASET_STAGE", "merged")
+# ✅ Optional oldest period to serve (YYYY-MM); older partitions are never read
+HISTORY_START = os.getenv("AE_HISTORY_START")
+
+# ✅ Pre-encoded responses, dropped whenever the dataset file changes
+RESPONSE_CACHE_MB = int(os.getenv("RESPONSE_CACHE_MB", "256"))
+response_cache = ResponseCache(max_bytes=RESPONSE_CACHE_MB * 1024 * 1024)
+
+dataset_version = FileVersion(manifest_path(DATASET_STAGE) if stage_exists(DATASET_STAGE) else DATASET_PATH)
+dataset_lock = threading.Lock()
+# ✅ One load's frame, indexes and content digest, swapped in together so no request mixes two versions
+LoadedDataset = namedtuple("LoadedDataset", ["digest", "data", "index", "table", "detector"])
+dataset = None
+
+
+def load_dataset():
+    """Reads the dataset, pushing the history cut-off down into the Parquet scan."""
+    if not stage_exists(DATASET_STAGE):
+        return load_ae_csv(DATASET_PATH)
+    start = None
+    if HISTORY_START:
+        year, _, month = HISTORY_START.partition("-")
+        start = (int(year), int(month or 1))
+    return compact_frame(read_stage(DATASET_STAGE, start=start))  # ✅ Categoricals and narrow ints
+
+
+def refresh_dataset():
+    """(Re)loads the dataset and its indexes if the file's content has changed; returns the loaded dataset.
+
+    The new version is only committed once everything built, so a half-written
+    file is retried on the next request while the previous load keeps serving.
+    """
+    global dataset
+    with dataset_lock:
+        if not dataset_version.changed():
+            return dataset
+        try:
+            with profile_stage("load_dataset") as stage:
+                data = load_dataset()
+                stage.rows = len(data)
+            with profile_stage("build_indexes", rows=len(data)):
+                index = AEQueryIndex(data)  # ✅ Build org/period indexes once per load
+                table = OrgMonthTable.from_frame(data)  # ✅ Pre-aggregate org x month for the charts
+                detector = AnomalyDetector.from_table(table.table)  # ✅ Per-org rolling anomaly scores
+        except Exception as e:
+            print(f"❌ Failed to load NHS dataset: {e}")
+            return dataset
+        dataset_version.commit()
+        dataset = LoadedDataset(dataset_version.digest, data, index, table, detector)
+        response_cache.clear()
+        print("✅ NHS Data Loaded Successfully!")
+        return dataset
+
+
+refresh_dataset()
+
+# ✅ Trust name/code index over the prediction shards the frontend reads, rebuilt when the manifest changes
+PREDICTIONS_DIR = os.getenv("PREDICTIONS_DIR",
+                            os.path.join(BACKEND_DIR, "models", "public", "data", SHARD_DIR_NAME))
+predictions_version = FileVersion(os.path.join(PREDICTIONS_DIR, MANIFEST_NAME))
+hospital_lock = threading.Lock()
+hospital_index = None
+hospital_codes_digest = None
+
+
+def refresh_hospital_index():
+    """(Re)builds the hospital lookup index if the prediction manifest or the loaded dataset has changed.
+
+    Org codes come from the dataset, so a newly loaded dataset rebuilds the index too.
+    """
+    global hospital_index, hospital_codes_digest
+    current = refresh_dataset()
+    digest = current.digest if current else None
+    with hospital_lock:
+        stale_codes = hospital_index is not None and digest != hospital_codes_digest
+        if not predictions_version.changed() and not stale_codes:
+            return
+        try:
+            with profile_stage("hospital_index"):
+                index = HospitalIndex(load_predictions(PREDICTIONS_DIR), codes=org_codes(current and current.data))
+        except Exception as e:
+            print(f"❌ Failed to build hospital index: {e}")
+            return
+        predictions_version.commit()
+        hospital_index, hospital_codes_digest = index, digest
+        print(f"✅ Hospital index built ({len(index)} trusts)")
+
+
+refresh_hospital_index()
+
+# ✅ Model and scaler are loaded once (and again only when a new artifact is deployed)
+forecast_service = ForecastService()
+forecast_service.refresh()
+
+
+# ✅ Per-request timing headers and /api/metrics when AE_PROFILE=1
+request_metrics = RequestMetrics()
+
+
+@app.before_request
+def start_request_timing():
+    if PROFILE_ENABLED:
+        g.request_timing = RequestTiming()
+
+
+@app.after_request
+def add_timing_headers(response):
+    """Adds Server-Timing (total, cpu and each stage the request ran) and records the request."""
+    timing = g.pop("request_timing", None)
+    if timing is not None:
+        timing.stop()
+        endpoint = request.url_rule.rule if request.url_rule else "<unmatched>"
+        request_metrics.record(endpoint, response.status_code, timing)
+        response.headers["Server-Timing"] = timing.server_timing()
+        response.headers["X-Response-Time-Ms"] = f"{timing.seconds * 1000:.2f}"
+    return response
+
+
+def cached_json(build, version):
+    """Serves build()'s (payload, headers) from the response cache for this request.
+
+    version is the digest of the dataset build() reads from.
+    """
+    def encode():
+        with profile_stage("build_response"):
+            payload, headers = build()
+            return app.json.dumps(payload).encode("utf-8"), headers
+
+    key = ResponseCache.make_key(version, request.path, request.args)
+    return response_cache.get_or_build(key, encode).to_response(request)
 
-try:
-    nhs_data = pd.read_csv(DATASET_PATH)
-    print("✅ NHS Data Loaded Successfully!")
-except Exception as e:
-    print(f"❌ Failed to load NHS dataset: {e}")
-    nhs_data = None
 
 @app.route("/api/ae_data", methods=["GET"])
 def get_ae_data():
-    """API Endpoint to fetch NHS A&E attendance data"""
+    """API Endpoint to fetch NHS A&E attendance data.
+
+    Optional query parameters:
+        org_code, org_name  one or more (comma-separated or repeated)
+        from, to            period range as YYYY or YYYY-MM (inclusive)
+        year, month         exact years / months (names or numbers)
+        columns             columns to return
+        limit, cursor       page size and the X-Next-Cursor value of the previous page
+    """
+    try:
+        current = refresh_dataset()
+        if current is None:
+            raise Exception("Dataset not available")
+
+        index = current.index
+        query = parse_query_args(request.args)
+
+        def build():
+            # ✅ Only the matching rows and columns are serialized
+            records, next_cursor = index.query(**query)
+            headers = {} if next_cursor is None else {"X-Next-Cursor": str(next_cursor)}
+            return records, headers
+
+        return cached_json(build, current.digest)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def stream_ae_data(encode, mimetype):
+    """Streams the filtered dataset in record batches using the given encoder."""
+    try:
+        current = refresh_dataset()
+        if current is None:
+            raise Exception("Dataset not available")
+
+        index = current.index
+        query = parse_query_args(request.args)
+        columns = query.pop("columns")
+        index.check_columns(columns)
+        rows, _ = index.select_page(**query)
+        batch_rows = int(request.args.get("batch_rows", DEFAULT_BATCH_ROWS))
+        if batch_rows < 1:
+            raise QueryError("Parameter 'batch_rows' must be positive")
+    except (QueryError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    # ✅ Batches are encoded lazily, so memory stays flat and the first bytes go out immediately
+    body = stream_with_context(encode(index, rows, columns, batch_rows))
+    return Response(body, mimetype=mimetype, headers={"X-Row-Count": str(len(rows))})
+
+
+@app.route("/api/ae_data.ndjson", methods=["GET"])
+def export_ae_data_ndjson():
+    """API Endpoint to stream A&E data as newline-delimited JSON (same filters as /api/ae_data)"""
+    return stream_ae_data(iter_ndjson, "application/x-ndjson")
+
+
+@app.route("/api/ae_data.arrow", methods=["GET"])
+def export_ae_data_arrow():
+    """API Endpoint to stream A&E data as an Apache Arrow IPC stream (same filters as /api/ae_data)"""
+    return stream_ae_data(iter_arrow_ipc, ARROW_STREAM_MIMETYPE)
+
+
+@app.route("/api/stats/<chart>", methods=["GET"])
+def get_stats(chart):
+    """API Endpoint serving the dashboard aggregations on demand.
+
+    chart is one of the JSON files get_statistics.py writes (summary,
+    monthly_attendance, seasonal_attendance, performance_trend,
+    regional_comparison, funnel_data, zscore_anomalies).
+
+    Optional query parameters:
+        org_code, org_name  restrict to these organisations
+        region              restrict to these parent_org regions
+        from, to            period range as YYYY or YYYY-MM (inclusive)
+    """
+    if chart not in CHARTS:
+        return jsonify({"error": f"Unknown chart '{chart}'", "charts": CHARTS}), 404
+
     try:
-        if nhs_data is None:
+        current = refresh_dataset()
+        if current is None:
             raise Exception("Dataset not available")
 
-        # ✅ Convert DataFrame to JSON
-        ae_json = nhs_data.to_dict(orient="records")
-        return jsonify(ae_json)
+        table = current.table
+        filters = parse_stats_args(request.args)
+
+        def build():
+            result = table.chart(chart, **filters)
+            if result is None:
+                raise QueryError("No data matches the given filters")
+            return result, {}
+
+        return cached_json(build, current.digest)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/anomalies", methods=["GET"])
+def get_anomalies():
+    """API Endpoint listing per-trust attendance anomalies from the streaming detector.
+
+    Optional query parameters:
+        org_code, org_name  restrict to these organisations
+        from, to            period range as YYYY or YYYY-MM (inclusive)
+        threshold           |z| over which a month is flagged (default: the detector's)
+        all                 1 to return every scored month, not only the flagged ones
+    """
+    try:
+        current = refresh_dataset()
+        if current is None:
+            raise Exception("Dataset not available")
+
+        detector = current.detector
+        query = parse_anomaly_args(request.args)
+        slots = None
+        if query["org_codes"] or query["org_names"]:
+            slots, unknown = detector.resolve(query["org_codes"], query["org_names"])
+            if unknown:
+                raise QueryError(f"Unknown organisations: {', '.join(unknown)}")
+
+        def build():
+            anomalies = detector.anomalies(slots, query["start"], query["end"], query["threshold"],
+                                           query["include_all"])
+            return dict(detector.params(), threshold=query["threshold"] or detector.threshold,
+                        anomalies=anomalies), {}
+
+        return cached_json(build, current.digest)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/predict", methods=["GET"])
+def predict():
+    """API Endpoint forecasting monthly attendances from the deployed model.
+
+    Query parameters:
+        org_name  one or more organisations (comma-separated or repeated)
+        horizon   months to forecast after each org's last report (default 12)
+
+    Concurrent requests are micro-batched into one forecast run, and
+    results are cached per (model version, org, horizon).
+    """
+    try:
+        org_names, horizon = parse_forecast_args(request.args)
+        return jsonify(forecast_service.forecast(org_names, horizon))
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+
+@app.route("/api/predict/stats", methods=["GET"])
+def get_predict_stats():
+    """API Endpoint to inspect the forecast cache and micro-batching"""
+    return jsonify(forecast_service.stats())
+
+
+@app.route("/api/hospitals", methods=["GET"])
+def get_hospitals():
+    """API Endpoint listing or searching the trusts that have predictions.
+
+    Optional query parameters:
+        q      name or org code prefix (any word of the name)
+        text   a free-text question; returns the trust it mentions
+        limit  maximum number of matches (default 10 when searching)
+    """
+    try:
+        refresh_hospital_index()
+        if hospital_index is None:
+            raise Exception("Predictions not available")
+
+        index = hospital_index
+        if request.args.get("text"):
+            found = index.find_in_text(request.args["text"])
+            positions = [] if found is None else [found]
+        elif request.args.get("q"):
+            positions = index.search(request.args["q"], limit=int(request.args.get("limit", 10)))
+        else:
+            positions = range(len(index))
+        return jsonify({"hospitals": [index.hospital(position) for position in positions],
+                        "mse": index.mse, "r2": index.r2})
+    except ValueError:
+        return jsonify({"error": "Parameter 'limit' must be an integer"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/hospitals/lookup", methods=["GET"])
+def lookup_hospital():
+    """API Endpoint answering "trust X in month Y" from the hospital index.
+
+    Query parameters:
+        org or text   the trust (name, code or prefix) or a question mentioning it
+        month         YYYY-MM: that month's actual and predicted attendances
+        year          YYYY: that year's months
+    Without month or year the trust's whole series is returned.
+    """
+    try:
+        refresh_hospital_index()
+        if hospital_index is None:
+            raise Exception("Predictions not available")
+
+        index = hospital_index
+        lookup = parse_lookup_args(request.args)
+        position = index.resolve(lookup["org"]) if lookup["org"] else index.find_in_text(lookup["text"])
+        if position is None:
+            return jsonify({"error": "No matching trust"}), 404
+
+        result = index.hospital(position)
+        if lookup["month"] is not None:
+            record = index.point(position, lookup["year"], lookup["month"])
+            if record is None:
+                return jsonify(dict(result, error="No data for that month")), 404
+            return jsonify(dict(result, **record))
+        if lookup["year"] is not None:
+            return jsonify(dict(result, year=lookup["year"], months=index.year(position, lookup["year"])))
+        return jsonify(dict(result, months=index.series[position]))
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/cache_stats", methods=["GET"])
+def get_cache_stats():
+    """API Endpoint to inspect the response cache"""
+    return jsonify(response_cache.stats())
+
+
+@app.route("/api/metrics", methods=["GET"])
+def get_metrics():
+    """API Endpoint with per-endpoint request timings and per-stage totals (needs AE_PROFILE=1)"""
+    if not PROFILE_ENABLED:
+        return jsonify({"enabled": False, "error": "Set AE_PROFILE=1 to collect metrics"})
+    return jsonify({
+        "enabled": True,
+        "rss_bytes": rss_bytes(),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "endpoints": request_metrics.snapshot(),
+        "stages": current_run().summary(),
+        "response_cache": response_cache.stats(),
+    })
+
+
+@app.route("/api/memory_stats", methods=["GET"])
+def get_memory_stats():
+    """API Endpoint to inspect the loaded dataset's memory use per column"""
+    current = refresh_dataset()
+    if current is None:
+        return jsonify({"error": "Dataset not available"}), 500
+    report = memory_report(current.data)
+    return jsonify({
+        "rows": len(current.data),
+        "total_bytes": int(report.loc["TOTAL", "bytes"]),
+        "columns": {column: {"dtype": row["dtype"], "bytes": int(row["bytes"])}
+                    for column, row in report.drop(index="TOTAL").iterrows()},
+    })
+
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,302 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from src.data_preprocessing.ae_dataset import manifest_path, read_stage, stage_exists
+from src.data_preprocessing.ae_schema import compact_frame, load_ae_csv
+from src.data_preprocessing.gap_fill import SYNTHETIC_FLAG
+from src.modelling.forecast import TARGET, batch_predictor, forecast_block, org_states
+from src.modelling.model_registry import ModelRegistry
+
+from ae_query import QueryError, normalize_name
+from response_cache import FileVersion
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The registered (memory-mapped) model to serve; the joblib pickles below are used until it is registered
+FORECAST_MODEL_NAME = os.getenv("FORECAST_MODEL_NAME", "random_forest_best")
+# The artifacts the notebook (and the pipeline's train stage) publish
+MODEL_PATH = os.getenv("FORECAST_MODEL_PATH", os.path.join(BACKEND_DIR, "models", "random_forest_best_model.pkl"))
+SCALER_PATH = os.getenv("FORECAST_SCALER_PATH", os.path.join(BACKEND_DIR, "models", "scaler.pkl"))
+HISTORY_STAGE = os.getenv("FORECAST_HISTORY_STAGE", "final_for_ml")
+HISTORY_CSV = os.getenv("FORECAST_HISTORY_CSV", os.path.join(BACKEND_DIR, "raw", "nhs_ae_final_for_ml.csv"))
+# is_synthetic (when the history has it) keeps gap-filled months after an org's last report out of its state
+HISTORY_COLUMNS = ["date", "org_name", TARGET, SYNTHETIC_FLAG]
+
+# Requests arriving within this window share one forecast run
+BATCH_WINDOW_MS = float(os.getenv("FORECAST_BATCH_WINDOW_MS", "5"))
+MAX_BATCH_REQUESTS = int(os.getenv("FORECAST_MAX_BATCH", "256"))
+FORECAST_CACHE_ENTRIES = int(os.getenv("FORECAST_CACHE_ENTRIES", "4096"))
+FORECAST_TIMEOUT = 30
+
+
+def history_source():
+    """The file whose changes mean the history must be reloaded."""
+    return manifest_path(HISTORY_STAGE) if stage_exists(HISTORY_STAGE) else HISTORY_CSV
+
+
+def load_history():
+    """Reads each org's attendance history: the Parquet stage when built, else the CSV."""
+    if stage_exists(HISTORY_STAGE):
+        return compact_frame(read_stage(HISTORY_STAGE, columns=HISTORY_COLUMNS))
+    return load_ae_csv(HISTORY_CSV, usecols=lambda column: column in HISTORY_COLUMNS)
+
+
+class ForecastModel:
+    """A loaded model and scaler plus every org's recursive forecast state.
+
+    Built once per deployed artifact; the forest is compiled once here
+    instead of on every request.
+    """
+
+    def __init__(self, model, scaler, history, version):
+        self.model = model
+        self.scaler = scaler
+        self.version = version
+        self.predict = batch_predictor(model)
+        self.orgs, last_dates, self.last_values, self.windows = org_states(history)
+        self.last_months = pd.DatetimeIndex(last_dates).to_period("M")
+        self.positions = {normalize_name(org): position for position, org in enumerate(self.orgs)}
+
+    def resolve(self, org_names):
+        """Org positions for the requested names (case and whitespace insensitive), duplicates dropped."""
+        positions, unknown = [], []
+        for name in org_names:
+            position = self.positions.get(normalize_name(name))
+            if position is None:
+                unknown.append(name)
+            elif position not in positions:
+                positions.append(position)
+        if unknown:
+            raise QueryError(f"Unknown organisations: {', '.join(unknown)}")
+        return positions
+
+    def run(self, positions, horizons):
+        """Forecasts horizons[i] months for org positions[i]; one predict call per month ahead."""
+        positions, steps = np.asarray(positions), np.asarray(horizons)
+        factors = np.ones((len(positions), int(steps.max())))
+        return forecast_block(self.model, self.scaler, self.last_values[positions], self.windows[positions],
+                              steps, factors, predict=self.predict)
+
+    def records(self, position, values):
+        """predictions.json style rows for one org's forecast values."""
+        months = self.last_months[position] + np.arange(1, len(values) + 1)
+        dates = pd.PeriodIndex(months, freq="M").to_timestamp().strftime("%Y-%m-%d")
+        return [{"date": date, "org_name": self.orgs[position], "Actual": None, "Predicted": int(round(value))}
+                for date, value in zip(dates, values.tolist())]
+
+
+class MicroBatcher:
+    """Collects calls that arrive within window seconds and runs them as one batch.
+
+    run_batch(items) gets every queued item and returns one result per item.
+    """
+
+    def __init__(self, run_batch, window=BATCH_WINDOW_MS / 1000, max_items=MAX_BATCH_REQUESTS):
+        self.run_batch = run_batch
+        self.window = window
+        self.max_items = max_items
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, item, timeout=FORECAST_TIMEOUT):
+        """Queues item and waits for its result."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="forecast-batcher", daemon=True)
+                self._thread.start()
+        future = Future()
+        self._queue.put((item, future))
+        return future.result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_items:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._collect()
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                results = self.run_batch([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+class ForecastCache:
+    """LRU of per-org forecast rows keyed on (model version, org, horizon)."""
+
+    def __init__(self, max_entries=FORECAST_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses}
+
+
+class ForecastService:
+    """Serves org forecasts from the deployed model, batching concurrent requests.
+
+    The model comes from the model registry when model_name is
+    registered, else from the joblib pickles; this is decided on every
+    refresh, so a model registered after startup is picked up. The model,
+    scaler and history are reloaded (and the cache dropped) whenever one
+    of their files (or the registry's LATEST pointer) changes, so
+    deploying a new artifact takes effect on the next request. A file
+    only counts as seen once a load from it succeeded, so a failed load
+    is retried on the next request.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, scaler_path=SCALER_PATH, model_name=FORECAST_MODEL_NAME,
+                 registry=None):
+        self.model_path = model_path
+        self.scaler_path = scaler_path
+        self.model_name = model_name
+        self.registry = registry or ModelRegistry()
+        self.versions = {}
+        self.loaded_paths = None
+        self.current = None
+        self.cache = ForecastCache()
+        self.batcher = MicroBatcher(self._run_batch)
+        self._lock = threading.Lock()
+
+    def sources(self):
+        """(use_registry, the files the model, scaler and history are loaded from)."""
+        latest = self.registry.latest_path(self.model_name)
+        use_registry = os.path.exists(latest)
+        artifacts = [latest] if use_registry else [self.model_path, self.scaler_path]
+        return use_registry, artifacts + [history_source()]
+
+    def refresh(self):
+        """(Re)loads the model, scaler and history if any of their files has changed."""
+        with self._lock:
+            use_registry, paths = self.sources()
+            versions = [self.versions.setdefault(path, FileVersion(path)) for path in paths]
+            changed = [version.changed() for version in versions]
+            if not any(changed) and paths == self.loaded_paths:
+                return
+            try:
+                if use_registry:
+                    # ✅ Only metadata is read here; the forest is memory-mapped on the first forecast
+                    model = self.registry.get(self.model_name)
+                    scaler = model.scaler
+                else:
+                    model = joblib.load(self.model_path)
+                    scaler = joblib.load(self.scaler_path)
+                current = ForecastModel(model, scaler, load_history(), version=None)
+            except Exception as e:
+                print(f"❌ Failed to load forecast model: {e}")
+                return
+            for version in versions:
+                version.commit()
+            digests = "".join(version.digest or "" for version in versions)
+            current.version = hashlib.sha256(digests.encode("utf-8")).hexdigest()[:16]
+            self.current, self.loaded_paths = current, paths
+            self.cache.clear()
+            print(f"✅ Forecast model {current.version} loaded ({len(current.orgs)} orgs)")
+
+    def _run_batch(self, items):
+        """One forecast run per model for every (model, positions, horizon) request in the batch."""
+        results = [None] * len(items)
+        for model in {id(model): model for model, _, _ in items}.values():
+            mine = [i for i, (other, _, _) in enumerate(items) if other is model]
+            # Each org is forecast once, as far as the longest horizon asked for it
+            horizons = {}
+            for i in mine:
+                _, positions, horizon = items[i]
+                for position in positions:
+                    horizons[position] = max(horizons.get(position, 0), horizon)
+            positions = list(horizons)
+            values = model.run(positions, [horizons[position] for position in positions])
+            row = {position: values[i] for i, position in enumerate(positions)}
+            for i in mine:
+                _, wanted, horizon = items[i]
+                results[i] = {position: model.records(position, row[position][:horizon]) for position in wanted}
+        return results
+
+    def forecast(self, org_names, horizon):
+        """Forecast rows for each org for the horizon months after its last report."""
+        self.refresh()
+        model = self.current
+        if model is None:
+            raise RuntimeError("Forecast model not available")
+
+        positions = model.resolve(org_names)
+        rows, missing = {}, []
+        for position in positions:
+            cached = self.cache.get((model.version, model.orgs[position], horizon))
+            if cached is None:
+                missing.append(position)
+            else:
+                rows[position] = cached
+        if missing:
+            computed = self.batcher.submit((model, missing, horizon))
+            for position, records in computed.items():
+                self.cache.put((model.version, model.orgs[position], horizon), records)
+                rows[position] = records
+
+        return {
+            "model_version": model.version,
+            "horizon": horizon,
+            "predictions": [record for position in positions for record in rows[position]],
+        }
+
+    def stats(self):
+        return {
+            "model_version": self.current.version if self.current else None,
+            "cache": self.cache.stats(),
+            "batches": self.batcher.batches,
+            "batched_requests": self.batcher.items,
+            "registered_models": self.registry.report(),
+        }
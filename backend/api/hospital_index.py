@@ -0,0 +1,132 @@
+import bisect
+import re
+
+import pandas as pd
+
+from src.modelling.prediction_export import read_prediction_shards
+
+from ae_query import MONTH_NUMBERS, normalize_name
+
+# Words that never start a trust mention in a chatbot question
+STOP_WORDS = {
+    "THE", "AND", "FOR", "WHAT", "WHAT'S", "WHATS", "SHOW", "GIVE", "TELL", "ABOUT", "FROM", "WITH",
+    "PREDICTION", "PREDICTIONS", "PREDICTED", "FORECAST", "FORECASTS", "TREND", "TRENDS", "ACTUAL",
+    "ATTENDANCE", "ATTENDANCES", "HOSPITAL", "HOSPITALS", "TRUST", "TRUSTS", "NHS", "FOUNDATION",
+    "UNIVERSITY", "GENERAL", "YEAR", "MONTH",
+} | set(MONTH_NUMBERS) | {name[:3] for name in MONTH_NUMBERS}
+
+WORD_PATTERN = re.compile(r"[A-Z0-9][A-Z0-9'&-]*")
+
+
+def load_predictions(path):
+    """The predictions the frontend reads: the shard manifest and per-org shards in the directory path."""
+    records, mse, r2 = read_prediction_shards(path)
+    return {"predictions": records, "mse": mse, "r2": r2}
+
+
+def org_codes(df):
+    """Normalized org name -> org code, from a frame with org_name and org_code (most frequent code wins)."""
+    if df is None or "org_name" not in df or "org_code" not in df:
+        return {}
+    pairs = pd.DataFrame({"name": df["org_name"].astype(object), "code": df["org_code"].astype(object)}).dropna()
+    counts = pairs.groupby(["name", "code"], sort=False).size().sort_values(ascending=False, kind="stable")
+    codes = {}
+    for name, code in counts.index:
+        codes.setdefault(normalize_name(name), str(code).strip().upper())
+    return codes
+
+
+class HospitalIndex:
+    """Trust names and org codes mapped to each org's actual and predicted monthly series.
+
+    Built once per published prediction manifest. Exact names and codes are dict
+    lookups, partial names a binary search over the sorted word-boundary
+    suffixes of every name ("NEWCASTLE" finds "THE NEWCASTLE UPON TYNE
+    HOSPITALS ..."), and a (trust, month) value one dict lookup, so no
+    question scans the predictions.
+    """
+
+    def __init__(self, predictions, codes=None):
+        codes = codes or {}
+        self.mse = predictions.get("mse")
+        self.r2 = predictions.get("r2")
+
+        rows = pd.DataFrame.from_records(predictions["predictions"],
+                                         columns=["date", "org_name", "Actual", "Predicted"])
+        rows = rows.dropna(subset=["org_name", "date"]).sort_values(["org_name", "date"], kind="stable")
+        dates = pd.to_datetime(rows["date"])
+        rows["period"] = dates.dt.year * 100 + dates.dt.month
+
+        self.names, self.codes, self.series = [], [], []
+        self.points, self.years = {}, {}
+        for position, (name, org_rows) in enumerate(rows.groupby("org_name", sort=True)):
+            self.names.append(name)
+            self.codes.append(codes.get(normalize_name(name)))
+            records = [{"date": date, "Actual": None if pd.isna(actual) else int(actual),
+                        "Predicted": None if pd.isna(predicted) else int(predicted)}
+                       for date, actual, predicted in zip(org_rows["date"], org_rows["Actual"], org_rows["Predicted"])]
+            self.series.append(records)
+            for record, period in zip(records, org_rows["period"].tolist()):
+                self.points[(position, period)] = record
+                self.years.setdefault((position, period // 100), []).append(record)
+
+        self.by_name = {normalize_name(name): position for position, name in enumerate(self.names)}
+        self.by_code = {code: position for position, code in enumerate(self.codes) if code}
+
+        # Sorted (key, word offset, position): every word-boundary suffix of every name, plus the codes
+        entries = []
+        for position, name in enumerate(self.names):
+            words = normalize_name(name).split()
+            entries.extend((" ".join(words[offset:]), offset, position) for offset in range(len(words)))
+        entries.extend((code, 0, position) for code, position in self.by_code.items())
+        entries.sort()
+        self._keys = [key for key, _, _ in entries]
+        self._entries = [(offset, position) for _, offset, position in entries]
+
+    def __len__(self):
+        return len(self.names)
+
+    def hospital(self, position):
+        return {"org_name": self.names[position], "org_code": self.codes[position]}
+
+    def search(self, prefix, limit=10):
+        """Positions of trusts with a word (or code) starting with prefix; names starting with it first."""
+        prefix = normalize_name(prefix)
+        if not prefix:
+            return []
+        lo = bisect.bisect_left(self._keys, prefix)
+        hi = bisect.bisect_left(self._keys, prefix + "\uffff")
+        ranked = sorted(self._entries[lo:hi], key=lambda entry: (entry[0] > 0, len(self.names[entry[1]]), entry[1]))
+        return list(dict.fromkeys(position for _, position in ranked))[:limit]
+
+    def resolve(self, org):
+        """A trust by exact code, exact name, else best prefix match; None when nothing matches."""
+        key = normalize_name(org)
+        if key in self.by_code:
+            return self.by_code[key]
+        if key in self.by_name:
+            return self.by_name[key]
+        matches = self.search(key, limit=1)
+        return matches[0] if matches else None
+
+    def find_in_text(self, text):
+        """The trust a free-text question mentions: the longest run of words that prefixes a trust name."""
+        words = WORD_PATTERN.findall(str(text).upper())
+        best, best_length = None, 0
+        for start, word in enumerate(words):
+            if len(word) < 3 or word in STOP_WORDS:
+                continue
+            end = start + 1
+            while end <= len(words) and self.search(" ".join(words[start:end]), limit=1):
+                end += 1
+            length = end - 1 - start
+            if length > best_length:
+                best, best_length = self.search(" ".join(words[start:end - 1]), limit=1)[0], length
+        return best
+
+    def point(self, position, year, month):
+        """The (trust, month) record, or None."""
+        return self.points.get((position, year * 100 + month))
+
+    def year(self, position, year):
+        return self.years.get((position, year), [])
@@ -0,0 +1,186 @@
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Returns the sha256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileVersion:
+    """Tracks a source file so its dependants can be rebuilt when it changes.
+
+    The file is only re-hashed when its mtime or size moves, and it only
+    counts as changed when the content hash differs. changed() only looks:
+    the new content becomes current (and digest moves) when commit() is
+    called after the dependants were rebuilt, so a failed rebuild is tried
+    again on the next check instead of waiting for another edit.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.digest = None
+        self._signature = None
+        self._pending = None
+
+    def changed(self):
+        """Returns True the first time and whenever the content differs from the last commit()."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return False
+        # A file that failed to load is not re-hashed on every retry
+        if self._pending is None or self._pending[0] != signature:
+            self._pending = (signature, file_digest(self.path))
+        if self._pending[1] == self.digest:
+            self.commit()  # touched, same content
+            return False
+        return True
+
+    def commit(self):
+        """Marks the content the last changed() saw as current."""
+        if self._pending is not None:
+            self._signature, self.digest = self._pending
+            self._pending = None
+
+
+class CachedResponse:
+    """A pre-encoded response body with its compressed variants and strong ETags."""
+
+    def __init__(self, body, mimetype="application/json", headers=None):
+        self.body = body
+        self.mimetype = mimetype
+        self.headers = dict(headers or {})
+        tag = hashlib.blake2b(body, digest_size=16).hexdigest()
+
+        self.variants = {"identity": (body, f'"{tag}"')}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            self.variants["gzip"] = (gzip.compress(body, compresslevel=6), f'"{tag}-gzip"')
+            if brotli is not None:
+                self.variants["br"] = (brotli.compress(body, quality=5), f'"{tag}-br"')
+
+        self.size = sum(len(data) for data, _ in self.variants.values())
+
+    def negotiate(self, accept_encoding):
+        """Picks the smallest encoding the client accepts."""
+        accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and encoding in accepted:
+                return encoding
+        return "identity"
+
+    def to_response(self, request):
+        """Builds the Flask response, answering 304 when the client's copy is current."""
+        encoding = self.negotiate(request.headers.get("Accept-Encoding"))
+        data, etag = self.variants[encoding]
+
+        headers = dict(self.headers)
+        headers["ETag"] = etag
+        headers["Vary"] = "Accept-Encoding"
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match:
+            # Each encoding has its own tag: only the negotiated variant's tag means the client's copy is current
+            client_tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if "*" in client_tags or etag in client_tags:
+                return Response(status=304, headers=headers)
+
+        return Response(data, mimetype=self.mimetype, headers=headers)
+
+
+class ResponseCache:
+    """LRU cache of pre-serialized responses, bounded by total stored bytes.
+
+    Entries are keyed on endpoint plus normalized query string, and the
+    whole cache is dropped when the underlying dataset is reloaded.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(version, path, args):
+        """Normalizes the query string so parameter order does not split the cache.
+
+        The dataset version is part of the key, so a response built from a
+        dataset that was replaced mid-request can never be served later.
+        """
+        return version, path, tuple(sorted(args.items(multi=True)))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key).size
+            if entry.size > self.max_bytes:
+                return entry
+            self._entries[key] = entry
+            self.current_bytes += entry.size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.size
+        return entry
+
+    def get_or_build(self, key, build):
+        """Returns the cached entry for key, building and storing it on a miss.
+
+        build() returns (body_bytes, extra_headers).
+        """
+        entry = self.get(key)
+        if entry is None:
+            body, headers = build()
+            entry = self.put(key, CachedResponse(body, headers=headers))
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
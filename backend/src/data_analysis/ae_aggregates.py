@@ -0,0 +1,288 @@
+"""Org x month aggregation of the A&E data and the dashboard charts derived from it.
+
+The raw frame is reduced once to one row per (org, month) holding every
+measure the charts need; each chart is then a cheap groupby over that
+table, optionally narrowed to some orgs, regions or a date window.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+MONTH_ORDER = ["January", "February", "March", "April", "May", "June",
+               "July", "August", "September", "October", "November", "December"]
+
+MONTH_TO_SEASON = {
+    "January": "Winter", "February": "Winter", "December": "Winter",
+    "March": "Spring", "April": "Spring", "May": "Spring",
+    "June": "Summer", "July": "Summer", "August": "Summer",
+    "September": "Autumn", "October": "Autumn", "November": "Autumn",
+}
+SEASON_LABELS = ["Winter", "Spring", "Summer", "Autumn"]
+
+ATTENDANCE_COLUMN = "total_a&e_attendances"
+
+# Component columns summed when a frame has no usable total (column names changed between releases)
+ATTENDANCE_COMPONENT_COLUMNS = [
+    "a&e_attendances_type_1",
+    "a&e_attendances_type_2",
+    "a&e_attendances_other_a&e_department",
+    "number_of_a&e_attendances_type_1",
+    "number_of_a&e_attendances_type_2",
+    "number_of_a&e_attendances_other_a&e_department",
+]
+
+OVER_4HRS_COLUMNS = [
+    "number_of_attendances_over_4hrs_type_1",
+    "number_of_attendances_over_4hrs_type_2",
+    "number_of_attendances_over_4hrs_other_a&e_department",
+]
+
+ADMISSION_COLUMNS = [
+    "emergency_admissions_via_a&e_-_type_1",
+    "emergency_admissions_via_a&e_-_type_2",
+    "emergency_admissions_via_a&e_-_other_a&e_department",
+    "other_emergency_admissions",
+]
+
+KEY_COLUMNS = ["org_code", "org_name", "parent_org", "date"]
+MEASURE_COLUMNS = ["attendances", "over_4hrs", "admissions", "seen_within_4hrs_pct_sum", "rows"]
+
+CHARTS = ["summary", "monthly_attendance", "seasonal_attendance", "performance_trend",
+          "regional_comparison", "funnel_data", "zscore_anomalies"]
+
+# Dashboard file name per chart (the summary keeps its historical name)
+CHART_FILES = {chart: f"{chart}.json" for chart in CHARTS}
+CHART_FILES["summary"] = "ae_summary.json"
+
+
+def normalize_label(values):
+    """Upper-cases and collapses whitespace in a Series of org names, codes or regions.
+
+    Categoricals are normalized once per category rather than once per row.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        labels = normalize_label(pd.Series(values.cat.categories, dtype=object))
+        codes = values.cat.codes.to_numpy()
+        return pd.Series(np.where(codes >= 0, labels.to_numpy()[codes], None), index=values.index, dtype=object)
+    return values.astype(str).str.split().str.join(" ").str.upper()
+
+
+def _numeric(df, column):
+    """Returns a column as float with inf/unparseable values as NaN (all NaN if absent)."""
+    if column not in df.columns:
+        return pd.Series(np.nan, index=df.index)
+    values = pd.to_numeric(df[column], errors="coerce").astype(float)
+    return values.replace([np.inf, -np.inf], np.nan)
+
+
+def _sum_columns(df, columns):
+    total = pd.Series(0.0, index=df.index)
+    for column in columns:
+        total += _numeric(df, column).fillna(0)
+    return total
+
+
+def row_dates(df):
+    """Month-start dates from the 'date' column, or from 'year' + month name if it is missing."""
+    if "date" in df.columns:
+        return pd.to_datetime(df["date"], errors="coerce")
+    text = df["year"].astype(str) + "-" + df["month"].astype(str)
+    return pd.to_datetime(text, format="%Y-%B", errors="coerce")
+
+
+def row_measures(df):
+    """Vectorized per-row measures: attendances, breaches, admissions and % seen in 4 hours."""
+    attendances = _numeric(df, ATTENDANCE_COLUMN)
+    if attendances.isna().all():
+        attendances = _sum_columns(df, ATTENDANCE_COMPONENT_COLUMNS)
+    attendances = attendances.fillna(attendances.median())
+
+    over_4hrs = _sum_columns(df, OVER_4HRS_COLUMNS)
+    admissions = _sum_columns(df, ADMISSION_COLUMNS)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        seen_pct = (100 - over_4hrs / attendances * 100).clip(0, 100)
+    seen_pct = seen_pct.where(attendances > 0, 0.0)
+
+    return pd.DataFrame({
+        "attendances": attendances,
+        "over_4hrs": over_4hrs,
+        "admissions": admissions,
+        "seen_within_4hrs_pct_sum": seen_pct,
+        "rows": 1,
+    }, index=df.index)
+
+
+def build_org_month_table(df):
+    """Reduces the raw A&E frame to one row per (org, month) with summed measures."""
+    keys = pd.DataFrame({column: df[column] if column in df.columns else np.nan
+                         for column in KEY_COLUMNS[:-1]}, index=df.index)
+    keys["date"] = row_dates(df).dt.to_period("M").dt.to_timestamp()
+    measures = row_measures(df)
+
+    table = (pd.concat([keys, measures], axis=1)
+             .groupby(KEY_COLUMNS, dropna=False, sort=False, observed=True)[MEASURE_COLUMNS]
+             .sum()
+             .reset_index())
+    table["region"] = normalize_label(table["parent_org"])
+    table["year"] = table["date"].dt.year
+    table["month"] = table["date"].dt.month
+    table["period_key"] = (table["year"] * 100 + table["month"]).fillna(0).astype(np.int64)
+    return table
+
+
+def _dated(table):
+    return table[table["date"].notna()]
+
+
+def summary(table):
+    dated = _dated(table)
+    start, end = dated["date"].min(), dated["date"].max()
+    result = {
+        "total_attendances": round(float(table["attendances"].sum()), 1),
+        "hospital_systems": int(table["org_name"].nunique()),
+    }
+    if pd.notna(start):
+        result["date_range"] = f"{start.strftime('%B %Y')} to {end.strftime('%B %Y')}"
+        result["months_analyzed"] = int(((end - start).days // 30) + 1)
+    return result
+
+
+def monthly_pivot(table):
+    """Month x year totals, with gaps interpolated the way the dashboard expects."""
+    dated = _dated(table)
+    monthly = dated.groupby([dated["year"].astype(int), dated["month"].astype(int)])["attendances"].sum()
+    pivot = monthly.unstack("year")
+    pivot.index = pd.CategoricalIndex([MONTH_ORDER[month - 1] for month in pivot.index],
+                                      categories=MONTH_ORDER, ordered=True, name="month_name")
+    pivot.columns.name = "year"
+    return pivot.interpolate(method="linear", axis=0).bfill().ffill().round(2)
+
+
+def monthly_attendance(table):
+    pivot = monthly_pivot(table)
+    return {
+        "labels": [str(month) for month in pivot.index],
+        "datasets": [
+            {"label": str(year), "data": [round(val / 1_000_000, 2) for val in pivot[year]]}
+            for year in pivot.columns
+        ],
+    }
+
+
+def seasonal_attendance(table):
+    pivot = monthly_pivot(table)
+    seasons = pd.Series([MONTH_TO_SEASON[str(month)] for month in pivot.index], index=pivot.index)
+    averages = pivot.groupby(seasons.to_numpy()).mean().reindex(SEASON_LABELS).fillna(0)
+    return {
+        "labels": SEASON_LABELS,
+        "datasets": [
+            {"label": str(year), "data": [round(val / 1_000_000, 2) for val in averages[year]]}
+            for year in sorted(pivot.columns)
+        ],
+    }
+
+
+def performance_trend(table):
+    dated = _dated(table)
+    by_year = dated.groupby(dated["year"].astype(int))[["seen_within_4hrs_pct_sum", "rows"]].sum()
+    percent = (by_year["seen_within_4hrs_pct_sum"] / by_year["rows"]).round(2)
+    return {
+        "labels": [str(year) for year in percent.index],
+        "datasets": [{
+            "label": "% Patients Seen Within 4 Hours",
+            "data": percent.tolist(),
+            "backgroundColor": "#3366CC",
+        }],
+    }
+
+
+def regional_comparison(table, top_n=5):
+    totals = table.groupby("org_name", observed=True)["attendances"].sum()
+    totals = totals[totals.index.astype(str).str.strip().str.upper() != "TOTAL"].sort_values(ascending=False)
+    return {
+        "top_5": [{"org_name": name, "attendances": int(val)} for name, val in totals.head(top_n).items()],
+        "bottom_5": [{"org_name": name, "attendances": int(val)} for name, val in totals.tail(top_n).items()],
+    }
+
+
+def funnel_data(table):
+    total = table["attendances"].sum()
+    seen_within = total - table["over_4hrs"].sum()
+    admitted = table["admissions"].sum()
+    return {
+        "stages": ["Total Attendances", "Seen Within 4 Hours", "Admitted to Hospital"],
+        "values": [int(round(total)), int(round(seen_within)), int(round(admitted))],
+    }
+
+
+def anomaly_chart(monthly, is_outlier):
+    """Chart of monthly totals (a date-indexed Series) with the is_outlier months highlighted."""
+    return {
+        "labels": monthly.index.strftime("%b %Y").tolist(),
+        "datasets": [{
+            "label": "Monthly A&E Attendances",
+            "data": monthly.tolist(),
+            "borderColor": "#3366CC",
+            "backgroundColor": "transparent",
+            "tension": 0.3,
+            "pointBackgroundColor": ["#DC3912" if outlier else "#3366CC" for outlier in is_outlier],
+            "pointRadius": [6 if outlier else 2 for outlier in is_outlier],
+        }],
+    }
+
+
+def zscore_anomalies(table):
+    """National totals flagged by the streaming detector (anomaly_state) run over the table's months."""
+    from src.data_analysis.anomaly_state import AnomalyDetector
+
+    return AnomalyDetector.from_table(table).chart()
+
+
+CHART_BUILDERS = {
+    "summary": summary,
+    "monthly_attendance": monthly_attendance,
+    "seasonal_attendance": seasonal_attendance,
+    "performance_trend": performance_trend,
+    "regional_comparison": regional_comparison,
+    "funnel_data": funnel_data,
+    "zscore_anomalies": zscore_anomalies,
+}
+
+
+class OrgMonthTable:
+    """In-memory org x month table with memoized, filterable chart aggregations."""
+
+    def __init__(self, table):
+        self.table = table
+        self._org_codes = normalize_label(table["org_code"])
+        self._org_names = normalize_label(table["org_name"])
+        self.chart = lru_cache(maxsize=512)(self._chart)
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(build_org_month_table(df))
+
+    def filter(self, org_codes=(), org_names=(), regions=(), start=None, end=None):
+        """Rows of the table for the given orgs, regions and inclusive period-key window."""
+        mask = np.ones(len(self.table), dtype=bool)
+        if org_codes or org_names:
+            mask &= (self._org_codes.isin(normalize_label(pd.Series(org_codes, dtype=object)))
+                     | self._org_names.isin(normalize_label(pd.Series(org_names, dtype=object)))).to_numpy()
+        if regions:
+            mask &= self.table["region"].isin(normalize_label(pd.Series(regions, dtype=object))).to_numpy()
+        if start is not None:
+            mask &= (self.table["period_key"] >= start).to_numpy()
+        if end is not None:
+            mask &= (self.table["period_key"] <= end).to_numpy()
+        return self.table[mask]
+
+    def _chart(self, name, org_codes=(), org_names=(), regions=(), start=None, end=None):
+        if name not in CHART_BUILDERS:
+            raise KeyError(name)
+        table = self.filter(org_codes, org_names, regions, start, end)
+        if table.empty:
+            return None
+        return CHART_BUILDERS[name](table)
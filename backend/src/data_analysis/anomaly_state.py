@@ -0,0 +1,264 @@
+"""Streaming per-org anomaly detection over monthly A&E attendances.
+
+Every org, and the national total, keeps an exponentially weighted mean
+and variance of its monthly attendances in flat arrays (one slot per
+org). A new month is scored against each org's statistics from the
+months before it,
+
+    z = (attendances - mean) / std
+
+and flagged when |z| is over the threshold once the org has
+WARMUP_MONTHS of history. The month is then folded into the statistics
+clipped to mean +/- threshold * std, so one bad month does not inflate
+the baseline later months are judged against. A month costs O(orgs)
+array operations; nothing is recomputed from history.
+
+Every (org, month) score is kept, so flags can be queried by org, date
+range and threshold, and the zscore_anomalies chart is the national
+series' scores. StatisticsState saves the detector next to its other
+aggregates as one .npz file.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.data_analysis.ae_aggregates import anomaly_chart, normalize_label
+
+ANOMALY_ALPHA = float(os.getenv("ANOMALY_ALPHA", "0.2"))
+ANOMALY_WARMUP_MONTHS = int(os.getenv("ANOMALY_WARMUP_MONTHS", "6"))
+ANOMALY_THRESHOLD = float(os.getenv("ANOMALY_THRESHOLD", "3.0"))
+
+# The std never drops below this fraction of the mean, so a near-flat series does not flag small wobbles
+MIN_RELATIVE_STD = 0.01
+
+LOG_COLUMNS = {"slot": np.int32, "period": np.int32, "value": np.float64, "expected": np.float64,
+               "zscore": np.float64}
+
+
+class EwmaStats:
+    """Exponentially weighted mean and variance of many series, one array slot per series."""
+
+    def __init__(self, size=0):
+        self.mean = np.zeros(size)
+        self.var = np.zeros(size)
+        self.count = np.zeros(size, dtype=np.int32)
+
+    def grow(self, size):
+        extra = size - len(self.mean)
+        if extra > 0:
+            self.mean = np.concatenate([self.mean, np.zeros(extra)])
+            self.var = np.concatenate([self.var, np.zeros(extra)])
+            self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int32)])
+
+    def step(self, slots, values, alpha, warmup, threshold):
+        """Scores values against the slots' statistics, then folds them in; returns (expected, zscore)."""
+        mean, var, count = self.mean[slots], self.var[slots], self.count[slots]
+        std = np.maximum(np.sqrt(var), MIN_RELATIVE_STD * np.abs(mean))
+        scored = (count >= warmup) & (std > 0)
+        zscore = np.where(scored, (values - mean) / np.where(scored, std, 1.0), np.nan)
+        expected = np.where(count > 0, mean, np.nan)
+
+        clipped = np.where(scored, np.clip(values, mean - threshold * std, mean + threshold * std), values)
+        # A plain running mean while an org warms up, then the fixed smoothing factor
+        weight = np.maximum(alpha, 1.0 / (count + 1))
+        delta = clipped - mean
+        self.mean[slots] = mean + weight * delta
+        self.var[slots] = (1 - weight) * (var + weight * delta ** 2)
+        self.count[slots] = count + 1
+        return expected, zscore
+
+
+class ScoreLog:
+    """Append-only (slot, period, value, expected, zscore) columns, kept as per-month chunks until read."""
+
+    def __init__(self, columns=None):
+        self._chunks = {name: [np.asarray(columns[name], dtype=dtype)] if columns else []
+                        for name, dtype in LOG_COLUMNS.items()}
+
+    def append(self, **columns):
+        for name, dtype in LOG_COLUMNS.items():
+            self._chunks[name].append(np.asarray(columns[name], dtype=dtype))
+
+    def columns(self):
+        for name, dtype in LOG_COLUMNS.items():
+            chunks = self._chunks[name]
+            if len(chunks) != 1:
+                self._chunks[name] = [np.concatenate(chunks) if chunks else np.empty(0, dtype=dtype)]
+        return {name: chunks[0] for name, chunks in self._chunks.items()}
+
+
+class AnomalyDetector:
+    """Rolling per-org (and national) attendance statistics and every month's anomaly score."""
+
+    def __init__(self, alpha=ANOMALY_ALPHA, warmup=ANOMALY_WARMUP_MONTHS, threshold=ANOMALY_THRESHOLD):
+        self.alpha = alpha
+        self.warmup = warmup
+        self.threshold = threshold
+        self.names = []     # org name per slot
+        self.slots = {}     # normalized org name -> slot
+        self.codes = {}     # normalized org code -> slot
+        self.orgs = EwmaStats()
+        self.national = EwmaStats(1)
+        self.org_log = ScoreLog()
+        self.national_log = ScoreLog()
+        self.last_period = 0
+
+    @classmethod
+    def from_table(cls, table, **params):
+        """A detector fed every month of an org x month table (build_org_month_table output)."""
+        detector = cls(**params)
+        detector.update(table)
+        return detector
+
+    def params(self):
+        return {"alpha": self.alpha, "warmup": self.warmup, "threshold": self.threshold}
+
+    # ------------------------
+    # Updating
+    # ------------------------
+
+    def _add_orgs(self, names, codes):
+        """Gives each new (normalized) org name a slot and maps its codes to it."""
+        pairs = pd.DataFrame({"name": names, "key": normalize_label(names),
+                              "code": normalize_label(codes.astype(object).fillna(""))}).drop_duplicates()
+        for name, key, code in pairs.itertuples(index=False):
+            if key not in self.slots:
+                self.slots[key] = len(self.names)
+                self.names.append(str(name))
+            if code:
+                self.codes.setdefault(code, self.slots[key])
+        self.orgs.grow(len(self.names))
+
+    def update(self, table):
+        """Scores and folds in org x month rows for months after the last one seen.
+
+        Returns the period keys (YYYYMM) added. A month at or before
+        last_period raises ValueError; rebuild with from_table instead.
+        """
+        dated = table[table["period_key"] > 0]
+        if dated.empty:
+            return []
+        periods = np.sort(dated["period_key"].unique())
+        if periods[0] <= self.last_period:
+            raise ValueError(f"❌ Month {periods[0]} is not after the last scored month {self.last_period}")
+
+        # Org series leave out the TOTAL rows; the national series is every row, as in the monthly charts
+        names = dated["org_name"].astype(object)
+        named = (names.notna() & (normalize_label(names) != "TOTAL")).to_numpy()
+        org_rows = dated[named]
+        org_names = org_rows["org_name"].astype(object)
+        self._add_orgs(org_names, org_rows["org_code"])
+        per_org = (pd.DataFrame({"period": org_rows["period_key"].to_numpy(),
+                                 "slot": normalize_label(org_names).map(self.slots).to_numpy(),
+                                 "value": org_rows["attendances"].astype(float).to_numpy()})
+                   .groupby(["period", "slot"], sort=True)["value"].sum())
+        national = dated.groupby("period_key")["attendances"].sum().astype(float)
+
+        org_months = dict(iter(per_org.groupby(level="period", sort=True)))
+        for period in periods.tolist():
+            month = org_months.get(period)
+            if month is not None:
+                slots = month.index.get_level_values("slot").to_numpy(dtype=np.int64)
+                values = month.to_numpy()
+                expected, zscore = self.orgs.step(slots, values, self.alpha, self.warmup, self.threshold)
+                self.org_log.append(slot=slots, period=np.full(len(slots), period), value=values,
+                                    expected=expected, zscore=zscore)
+            total = np.array([national[period]])
+            expected, zscore = self.national.step(np.zeros(1, dtype=np.int64), total, self.alpha, self.warmup,
+                                                  self.threshold)
+            self.national_log.append(slot=[0], period=[period], value=total, expected=expected, zscore=zscore)
+        self.last_period = int(periods[-1])
+        return periods.tolist()
+
+    # ------------------------
+    # Queries
+    # ------------------------
+
+    def resolve(self, org_codes=(), org_names=()):
+        """(slots, unknown) for the given org codes and names (case and whitespace insensitive)."""
+        slots, unknown = [], []
+        for lookup, values in ((self.codes, org_codes), (self.slots, org_names)):
+            for value, key in zip(values, normalize_label(pd.Series(list(values), dtype=object))):
+                slot = lookup.get(key)
+                if slot is None:
+                    unknown.append(value)
+                elif slot not in slots:
+                    slots.append(slot)
+        return slots, unknown
+
+    def anomalies(self, slots=None, start=None, end=None, threshold=None, include_all=False):
+        """Scored org-months, oldest first: only those over threshold unless include_all.
+
+        slots restricts to those orgs, start and end (inclusive period keys) to a window.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        log = self.org_log.columns()
+        mask = np.ones(len(log["slot"]), dtype=bool)
+        if slots is not None:
+            mask &= np.isin(log["slot"], slots)
+        if start is not None:
+            mask &= log["period"] >= start
+        if end is not None:
+            mask &= log["period"] <= end
+        flagged = np.abs(np.nan_to_num(log["zscore"])) > threshold
+        if not include_all:
+            mask &= flagged
+
+        return [{
+            "org_name": self.names[slot],
+            "date": f"{period // 100}-{period % 100:02d}-01",
+            "attendances": int(round(value)),
+            "expected": None if np.isnan(expected) else round(expected, 1),
+            "zscore": None if np.isnan(zscore) else round(zscore, 2),
+            "is_anomaly": bool(is_anomaly),
+        } for slot, period, value, expected, zscore, is_anomaly in zip(
+            log["slot"][mask].tolist(), log["period"][mask].tolist(), log["value"][mask].tolist(),
+            log["expected"][mask].tolist(), log["zscore"][mask].tolist(), flagged[mask].tolist())]
+
+    def chart(self, threshold=None):
+        """The zscore_anomalies chart: national monthly totals with the flagged months highlighted."""
+        threshold = self.threshold if threshold is None else threshold
+        log = self.national_log.columns()
+        dates = pd.to_datetime({"year": log["period"] // 100, "month": log["period"] % 100, "day": 1})
+        monthly = pd.Series(log["value"], index=pd.DatetimeIndex(dates, name="date"))
+        return anomaly_chart(monthly, np.abs(np.nan_to_num(log["zscore"])) > threshold)
+
+    # ------------------------
+    # Persistence
+    # ------------------------
+
+    def save(self, path):
+        org_log, national_log = self.org_log.columns(), self.national_log.columns()
+        codes = sorted(self.codes.items())
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f,
+                     params=np.array([self.alpha, self.warmup, self.threshold, self.last_period], dtype=float),
+                     names=np.array(self.names, dtype=str),
+                     code_keys=np.array([code for code, _ in codes], dtype=str),
+                     code_slots=np.array([slot for _, slot in codes], dtype=np.int32),
+                     **{f"orgs_{name}": getattr(self.orgs, name) for name in ("mean", "var", "count")},
+                     **{f"national_{name}": getattr(self.national, name) for name in ("mean", "var", "count")},
+                     **{f"org_log_{name}": column for name, column in org_log.items()},
+                     **{f"national_log_{name}": column for name, column in national_log.items()})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """The saved detector, or None if nothing has been saved at path."""
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as saved:
+            alpha, warmup, threshold, last_period = saved["params"].tolist()
+            detector = cls(alpha, int(warmup), threshold)
+            detector.last_period = int(last_period)
+            detector.names = saved["names"].tolist()
+            detector.slots = dict(zip(normalize_label(pd.Series(detector.names, dtype=object)),
+                                      range(len(detector.names))))
+            detector.codes = dict(zip(saved["code_keys"].tolist(), saved["code_slots"].tolist()))
+            for stats, prefix in ((detector.orgs, "orgs"), (detector.national, "national")):
+                stats.mean, stats.var, stats.count = (saved[f"{prefix}_{name}"] for name in ("mean", "var", "count"))
+            detector.org_log = ScoreLog({name: saved[f"org_log_{name}"] for name in LOG_COLUMNS})
+            detector.national_log = ScoreLog({name: saved[f"national_log_{name}"] for name in LOG_COLUMNS})
+        return detector
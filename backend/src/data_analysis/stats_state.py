@@ -0,0 +1,214 @@
+"""Persisted running aggregates behind the dashboard charts.
+
+A monthly NHS release adds one month, so instead of re-reducing all of
+history the charts are kept up to date from a small saved state:
+
+- months: one row per month with summed attendances, breaches,
+  admissions and % seen within 4 hours (what the monthly, seasonal,
+  performance and funnel charts read)
+- orgs: running attendance total and row count per org (the rankings)
+- anomalies.npz: the per-org and national anomaly detector
+  (anomaly_state), which scores each new month in O(orgs)
+- slices/<period_key>.parquet: the org x month rows each month
+  contributed, so a re-released month can be subtracted and replaced
+
+merge() reduces only the new rows, folds them in month by month and
+returns the months it touched; write_charts() rewrites only the chart
+files whose content changed. A month is treated as complete: merging
+rows for a month that is already in the state replaces it (and replays
+the anomaly detector over the saved slices, since its statistics depend
+on the order months arrive in).
+
+Missing attendance totals are filled with the median of the rows being
+merged (see ae_aggregates.row_measures), so a month merged on its own can
+differ slightly from a full rebuild when its totals have gaps.
+"""
+import glob
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+
+from src.data_analysis.ae_aggregates import (CHART_FILES, funnel_data, monthly_attendance, performance_trend,
+                                             regional_comparison, seasonal_attendance, build_org_month_table)
+from src.data_analysis.anomaly_state import AnomalyDetector
+
+RAW_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "raw"))
+STATE_DIR = os.getenv("STATS_STATE_DIR", os.path.join(RAW_DIR, "stats_state"))
+STATE_NAME = "state.json"
+ANOMALIES_NAME = "anomalies.npz"
+
+SUMMED_COLUMNS = ["attendances", "over_4hrs", "admissions", "seen_within_4hrs_pct_sum", "rows"]
+MONTH_COLUMNS = ["date", "year", "month"] + SUMMED_COLUMNS
+ORG_COLUMNS = ["attendances", "rows"]
+
+# The summary has always been written with a wider indent
+JSON_INDENT = {"summary": 4}
+
+
+def chart_bytes(chart, data):
+    """The exact bytes written for a chart file."""
+    return json.dumps(data, indent=JSON_INDENT.get(chart, 2)).encode("utf-8")
+
+
+def write_charts(charts, output_dir, previous=None):
+    """Writes each chart whose content differs from the digest in previous.
+
+    Returns ({chart: digest} for every chart, [charts written]).
+    """
+    previous = previous or {}
+    os.makedirs(output_dir, exist_ok=True)
+    digests, written = {}, []
+    for chart, data in charts.items():
+        payload = chart_bytes(chart, data)
+        digests[chart] = hashlib.sha256(payload).hexdigest()
+        output_file = os.path.join(output_dir, CHART_FILES[chart])
+        if previous.get(chart) == digests[chart] and os.path.exists(output_file):
+            continue
+        with open(output_file, "wb") as f:
+            f.write(payload)
+        written.append(chart)
+    return digests, written
+
+
+class StatisticsState:
+    """Running per-month and per-org aggregates, loaded from and saved to state_dir."""
+
+    def __init__(self, state_dir=STATE_DIR):
+        self.state_dir = state_dir
+        self.months = pd.DataFrame(columns=MONTH_COLUMNS, index=pd.Index([], dtype="int64", name="period_key"))
+        self.orgs = pd.DataFrame(columns=ORG_COLUMNS, index=pd.Index([], dtype=object, name="org_name"))
+        self.anomalies = AnomalyDetector()
+        self.outputs = {}
+
+    @classmethod
+    def load(cls, state_dir=STATE_DIR):
+        """The saved state, or an empty one if nothing has been saved yet."""
+        state = cls(state_dir)
+        if not os.path.exists(os.path.join(state_dir, STATE_NAME)):
+            return state
+        with open(os.path.join(state_dir, STATE_NAME)) as f:
+            saved = json.load(f)
+        state.outputs = saved["outputs"]
+        state.months = pd.read_parquet(os.path.join(state_dir, "months.parquet"))
+        state.orgs = pd.read_parquet(os.path.join(state_dir, "orgs.parquet"))
+        # States saved before the detector existed (or with other detector settings) replay it from the slices
+        state.anomalies = AnomalyDetector.load(os.path.join(state_dir, ANOMALIES_NAME))
+        if state.anomalies is None or state.anomalies.params() != AnomalyDetector().params():
+            state.anomalies = state.replay_anomalies()
+        return state
+
+    def reset(self):
+        """Forgets everything (used before a full rebuild)."""
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+        self.__init__(self.state_dir)
+
+    def save(self):
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.months.to_parquet(os.path.join(self.state_dir, "months.parquet"))
+        self.orgs.to_parquet(os.path.join(self.state_dir, "orgs.parquet"))
+        self.anomalies.save(os.path.join(self.state_dir, ANOMALIES_NAME))
+        with open(os.path.join(self.state_dir, STATE_NAME), "w") as f:
+            json.dump({"outputs": self.outputs}, f, indent=2)
+
+    def _slice_path(self, period_key):
+        return os.path.join(self.state_dir, "slices", f"{period_key}.parquet")
+
+    def replay_anomalies(self):
+        """A fresh anomaly detector fed every saved month slice."""
+        paths = sorted(glob.glob(os.path.join(self.state_dir, "slices", "*.parquet")))
+        if not paths:
+            return AnomalyDetector()
+        return AnomalyDetector.from_table(pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True))
+
+    # ------------------------
+    # Merging
+    # ------------------------
+
+    def merge(self, df):
+        """Folds raw A&E rows into the state; returns the period keys (YYYYMM) that changed."""
+        return self.merge_table(build_org_month_table(df))
+
+    def merge_table(self, table):
+        """Like merge, for rows already reduced by build_org_month_table."""
+        changed = sorted(int(key) for key in table["period_key"].unique())
+        replaced = [pd.read_parquet(self._slice_path(key)) for key in changed
+                    if os.path.exists(self._slice_path(key))]
+        if replaced:
+            self._apply(pd.concat(replaced, ignore_index=True), sign=-1)
+        self._apply(table, sign=1)
+
+        os.makedirs(os.path.join(self.state_dir, "slices"), exist_ok=True)
+        for key, month_slice in table.groupby("period_key", sort=True):
+            month_slice.to_parquet(self._slice_path(int(key)), index=False)
+
+        # New months are scored in O(orgs) each; replacing an already scored month replays the history
+        dated = [key for key in changed if key]
+        if dated and dated[0] > self.anomalies.last_period:
+            self.anomalies.update(table)
+        elif dated:
+            self.anomalies = self.replay_anomalies()
+        return changed
+
+    def _apply(self, table, sign):
+        """Adds (sign=1) or removes (sign=-1) org x month rows, month by month."""
+        by_month = table.groupby("period_key")
+        deltas = by_month[SUMMED_COLUMNS].sum().astype(float) * sign
+        months = self.months.reindex(self.months.index.union(deltas.index))
+        months[SUMMED_COLUMNS] = months[SUMMED_COLUMNS].astype(float).add(deltas, fill_value=0)
+        labels = by_month[["date", "year", "month"]].first()
+        new_keys = labels.index.difference(self.months.index)
+        months.loc[new_keys, ["date", "year", "month"]] = labels.loc[new_keys].to_numpy()
+        self.months = months[months["rows"] > 0]
+
+        by_org = (table[table["org_name"].notna()]
+                  .assign(org_name=lambda rows: rows["org_name"].astype(str))
+                  .groupby("org_name")[ORG_COLUMNS].sum())
+        self.orgs = self.orgs.astype(float).add(sign * by_org.astype(float), fill_value=0)
+        self.orgs = self.orgs[self.orgs["rows"] > 0]
+
+    # ------------------------
+    # Charts
+    # ------------------------
+
+    def month_table(self):
+        """The months as a table the ae_aggregates chart builders accept."""
+        table = self.months.reset_index()
+        table["date"] = pd.to_datetime(table["date"])
+        return table
+
+    def summary(self):
+        dated = self.months[self.months["date"].notna()]
+        result = {
+            "total_attendances": round(float(self.months["attendances"].sum()), 1),
+            "hospital_systems": int(len(self.orgs)),
+        }
+        if len(dated):
+            start, end = pd.to_datetime(dated["date"]).min(), pd.to_datetime(dated["date"]).max()
+            result["date_range"] = f"{start.strftime('%B %Y')} to {end.strftime('%B %Y')}"
+            result["months_analyzed"] = int(((end - start).days // 30) + 1)
+        return result
+
+    def zscore_anomalies(self):
+        return self.anomalies.chart()
+
+    def charts(self):
+        """Every dashboard chart, computed from the state alone."""
+        table = self.month_table()
+        orgs = self.orgs.rename_axis("org_name").reset_index()
+        return {
+            "summary": self.summary(),
+            "monthly_attendance": monthly_attendance(table),
+            "seasonal_attendance": seasonal_attendance(table),
+            "performance_trend": performance_trend(table),
+            "regional_comparison": regional_comparison(orgs),
+            "funnel_data": funnel_data(table),
+            "zscore_anomalies": self.zscore_anomalies(),
+        }
+
+    def write_charts(self, output_dir):
+        """Writes the charts that changed since the last write; returns their names."""
+        self.outputs, written = write_charts(self.charts(), output_dir, self.outputs)
+        return written
@@ -1,46 +1,54 @@
 import os
+import random
+import sys
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from bs4 import BeautifulSoup
-from azure.storage.blob import BlobServiceClient
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 import re  # Import regex to clean filenames
 
+# ✅ Make the shared backend modules (src/...) importable when run as a script
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from src.utils.storage import get_storage
+
 # ✅ Load environment variables
 load_dotenv()
 
-# ✅ Azure Storage Account details from .env
-AZURE_CONNECTION_STRING = os.getenv("AZURE_CONNECTION_STRING")
-AZURE_CONTAINER_NAME = os.getenv("AZURE_CONTAINER_NAME")
-
-# ✅ Ensure the Azure connection string is correct
-if not AZURE_CONNECTION_STRING or "AccountName" not in AZURE_CONNECTION_STRING:
-    raise ValueError("❌ Azure Connection String is missing or malformed! Check your .env file.")
-
-# ✅ Initialize Azure Blob Service Client
-try:
-    blob_service_client = BlobServiceClient.from_connection_string(AZURE_CONNECTION_STRING)
-    print("✅ Successfully connected to Azure Blob Storage!")
-except Exception as e:
-    raise RuntimeError(f"❌ Failed to connect to Azure: {e}")
-
-# ✅ Ensure Azure Blob Container exists
-try:
-    container_client = blob_service_client.get_container_client(AZURE_CONTAINER_NAME)
-    container_client.get_container_properties()
-    print(f"📂 Container '{AZURE_CONTAINER_NAME}' found!")
-except Exception:
-    container_client = blob_service_client.create_container(AZURE_CONTAINER_NAME)
-    print(f"📂 Container '{AZURE_CONTAINER_NAME}' created!")
+BASE_URL = "https://www.england.nhs.uk/statistics/statistical-work-areas/ae-waiting-times-and-activity/"
+
+# ✅ Mirror tuning: files in flight, bytes per streamed chunk / uploaded block, retries
+MIRROR_CONCURRENCY = int(os.getenv("MIRROR_CONCURRENCY", "8"))
+CHUNK_SIZE = 4 * 1024 * 1024
+MAX_ATTEMPTS = 4
+BACKOFF_SECONDS = 1.0
+
+# ✅ Blob metadata keys remembering which source version a blob was mirrored from
+SOURCE_ETAG_KEY = "source_etag"
+SOURCE_SIZE_KEY = "source_size"
+
+class PermanentDownloadError(RuntimeError):
+    """A download failure that retrying will not fix (e.g. 404)."""
+
+# ✅ Shared HTTP session so concurrent downloads reuse pooled connections
+def make_session(pool_size=MIRROR_CONCURRENCY):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 # ✅ Function to scrape NHS Monthly A&E CSV file links from multiple years
-def get_ae_file_links():
+def get_ae_file_links(session=requests, base_url=BASE_URL):
     """Scrape NHS website and return Monthly A&E CSV file links."""
-    BASE_URL = "https://www.england.nhs.uk/statistics/statistical-work-areas/ae-waiting-times-and-activity/"
-    
     try:
-        response = requests.get(BASE_URL)
+        response = session.get(base_url)
         if response.status_code != 200:
-            print(f"⚠️ Could not access {BASE_URL} (Status Code: {response.status_code})")
+            print(f"⚠️ Could not access {base_url} (Status Code: {response.status_code})")
             return {}
 
         soup = BeautifulSoup(response.text, 'html.parser')
@@ -53,7 +61,7 @@ def get_ae_file_links():
             match = re.search(r"Monthly A&E (\w+) (\d{4})", text)
             if match and (href.endswith('.csv') or href.endswith('.xls') or href.endswith('.xlsx')):
                 month_year = f"Monthly_AE_{match.group(1)}_{match.group(2)}.csv"
-                files[month_year] = href if href.startswith("http") else BASE_URL + href
+                files[month_year] = href if href.startswith("http") else base_url + href
 
         return files
 
@@ -61,36 +69,109 @@ def get_ae_file_links():
         print(f"❌ Error scraping NHS website: {e}")
         return {}
 
-# ✅ Function to download and upload files to Azure
-def download_and_upload_files():
-    """Download NHS A&E files and upload to Azure."""
-    file_links = get_ae_file_links()
-
-    for file_name, file_url in file_links.items():
+def existing_blobs(storage):
+    """List the store once: {blob name: (size, metadata)}."""
+    return {blob.name: (blob.size, blob.metadata)
+            for blob in storage.list(include_metadata=True)}
+
+def is_up_to_date(remote_etag, remote_size, existing):
+    """True if the blob already holds this remote file.
+
+    When both sides have a source ETag they decide alone (a revision can change
+    the numbers without changing the byte count); the size is only compared
+    when either ETag is missing.
+    """
+    if existing is None:
+        return False
+    blob_size, metadata = existing
+    stored_etag = metadata.get(SOURCE_ETAG_KEY)
+    if remote_etag and stored_etag:
+        return stored_etag == remote_etag
+    return remote_size is not None and remote_size == blob_size
+
+def mirror_file(session, storage, file_name, file_url, existing=None):
+    """Stream one file from the NHS site straight into a block-blob upload.
+
+    Returns "skipped" or "uploaded"; raises on failure so the caller can retry.
+    """
+    head = session.head(file_url, allow_redirects=True)
+    remote_etag = head.headers.get("ETag") if head.ok else None
+    remote_size = int(head.headers["Content-Length"]) if head.ok and "Content-Length" in head.headers else None
+    if is_up_to_date(remote_etag, remote_size, existing):
+        return "skipped"
+
+    with session.get(file_url, stream=True) as response:
+        if response.status_code != 200:
+            message = f"Failed to download: {file_url} (Status Code: {response.status_code})"
+            if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                raise PermanentDownloadError(message)
+            raise RuntimeError(message)
+
+        remote_etag = response.headers.get("ETag", remote_etag)
+        length = response.headers.get("Content-Length")
+        metadata = {SOURCE_ETAG_KEY: remote_etag or "", SOURCE_SIZE_KEY: length or ""}
+
+        # ✅ Chunks go from the HTTP response to storage as they arrive, nothing is buffered whole
+        storage.put_stream(
+            file_name,
+            response.iter_content(chunk_size=CHUNK_SIZE),
+            length=int(length) if length and "Content-Encoding" not in response.headers else None,
+            overwrite=True,
+            metadata=metadata,
+        )
+    return "uploaded"
+
+def mirror_with_retry(session, storage, file_name, file_url, existing=None,
+                      max_attempts=MAX_ATTEMPTS, backoff=BACKOFF_SECONDS):
+    """Run mirror_file, retrying transient failures with exponential backoff and jitter."""
+    for attempt in range(1, max_attempts + 1):
         try:
-            response = requests.get(file_url, stream=True)
-            if response.status_code == 200:
-                with open(file_name, "wb") as file:
-                    for chunk in response.iter_content(chunk_size=1024):
-                        file.write(chunk)
-                print(f"✅ Downloaded: {file_name}")
-
-                # ✅ Upload to Azure Blob Storage
-                blob_client = blob_service_client.get_blob_client(AZURE_CONTAINER_NAME, file_name)
-                with open(file_name, "rb") as data:
-                    blob_client.upload_blob(data, overwrite=True)
-                print(f"🚀 Uploaded to Azure: {file_name}")
-
-                # ✅ Remove local file after successful upload
-                os.remove(file_name)
-            else:
-                print(f"❌ Failed to download: {file_url} (Status Code: {response.status_code})")
-
+            return mirror_file(session, storage, file_name, file_url, existing)
+        except PermanentDownloadError:
+            raise
         except Exception as e:
-            print(f"⚠️ Error processing {file_name}: {e}")
+            if attempt == max_attempts:
+                raise
+            delay = backoff * 2 ** (attempt - 1) * (1 + random.random())
+            print(f"🔁 Retrying {file_name} in {delay:.1f}s (attempt {attempt} failed: {e})")
+            time.sleep(delay)
+
+# ✅ Function to mirror the NHS files into blob storage
+def download_and_upload_files(storage=None, session=None, base_url=BASE_URL,
+                              concurrency=MIRROR_CONCURRENCY):
+    """Mirror NHS A&E files into storage, many at a time, skipping ones already uploaded."""
+    if storage is None:
+        storage = get_storage()
+        storage.ensure_container()
+    session = session or make_session(concurrency)
+    file_links = get_ae_file_links(session, base_url)
+    existing = existing_blobs(storage)
+    results = {"uploaded": 0, "skipped": 0, "failed": 0}
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {
+            pool.submit(mirror_with_retry, session, storage, file_name, file_url,
+                        existing.get(file_name)): file_name
+            for file_name, file_url in file_links.items()
+        }
+        for future in as_completed(futures):
+            file_name = futures[future]
+            try:
+                status = future.result()
+                results[status] += 1
+                if status == "uploaded":
+                    print(f"🚀 Uploaded: {file_name}")
+                else:
+                    print(f"⏭️ Already up to date: {file_name}")
+            except Exception as e:
+                results["failed"] += 1
+                print(f"⚠️ Error processing {file_name}: {e}")
+
+    return results
 
 # ✅ Run the script
 if __name__ == "__main__":
     print("🚀 Starting NHS A&E Data Uploading Process...")
-    download_and_upload_files()
-    print("✅ All NHS A&E files uploaded to Azure!")
+    results = download_and_upload_files()
+    print(f"✅ NHS A&E files mirrored to storage! "
+          f"({results['uploaded']} uploaded, {results['skipped']} skipped, {results['failed']} failed)")
@@ -0,0 +1,274 @@
+"""Canonical on-disk dataset for every pipeline stage.
+
+Each stage (merged, merged_fixed, final_for_ml, features, ...) is written
+once as a Parquet dataset partitioned by year and month
+(``<root>/<stage>/year=2024/month_num=1/part-0.parquet``) with an explicit
+schema, instead of another full CSV snapshot. Readers push column
+projection and org/date predicates down into the scan, so only the
+partitions and row groups a caller needs are read and nothing is
+re-parsed from text.
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+RAW_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "raw"))
+DATASET_ROOT = os.getenv("AE_DATASET_ROOT", os.path.join(RAW_DIR, "datasets"))
+MANIFEST_NAME = "_manifest.json"
+SCHEMA_NAME = "_common_metadata"
+
+MONTH_ORDER = ["January", "February", "March", "April", "May", "June",
+               "July", "August", "September", "October", "November", "December"]
+MONTH_NUMBERS = {name: number for number, name in enumerate(MONTH_ORDER, start=1)}
+
+# Partition columns; month_num is 0 when a row's month is unknown
+PARTITION_SCHEMA = pa.schema([("year", pa.int16()), ("month_num", pa.int8())])
+
+# Columns with a fixed type; every other numeric column is float64, everything else string
+KEY_FIELDS = {
+    "period": pa.string(),
+    "org_code": pa.string(),
+    "parent_org": pa.string(),
+    "org_name": pa.string(),
+    "month": pa.string(),
+    "date": pa.timestamp("ms"),
+}
+
+ROW_GROUP_ROWS = 64_000
+
+# The CSV snapshots each stage replaces (relative to backend/raw)
+LEGACY_STAGE_FILES = {
+    "merged": "nhs_ae_merged.csv",
+    "merged_fixed": "nhs_ae_merged_fixed.csv",
+    "no_outliers": "nhs_ae_merged_no_outliers.csv",
+    "preprocessed": "nhs_ae_preprocessed_fixed.csv",
+    "outliers_flagged": "nhs_ae_outliers_flagged.csv",
+    "final_for_ml": "nhs_ae_final_for_ml.csv",
+    "features": "nhs_ae_features.csv",
+}
+
+
+def stage_dir(stage, root=DATASET_ROOT):
+    return os.path.join(root, stage)
+
+
+def manifest_path(stage, root=DATASET_ROOT):
+    """The stage's manifest, rewritten on every write (watch it to detect new data)."""
+    return os.path.join(stage_dir(stage, root), MANIFEST_NAME)
+
+
+def stage_exists(stage, root=DATASET_ROOT):
+    return os.path.exists(manifest_path(stage, root))
+
+
+def partition_keys(df):
+    """Year and month number for every row, from date when present, else year/month columns."""
+    year = pd.Series(np.nan, index=df.index)
+    month_num = pd.Series(np.nan, index=df.index)
+    if "date" in df:
+        dates = pd.to_datetime(df["date"], errors="coerce")
+        year, month_num = dates.dt.year, dates.dt.month
+    if "year" in df:
+        year = year.fillna(pd.to_numeric(df["year"], errors="coerce"))
+    if "month" in df:
+        names = df["month"].astype(str).str.strip().str.capitalize().map(MONTH_NUMBERS)
+        month_num = month_num.fillna(names).fillna(pd.to_numeric(df["month"], errors="coerce"))
+    month_num = month_num.where(month_num.between(1, 12))
+    return year.fillna(0).astype("int16"), month_num.fillna(0).astype("int8")
+
+
+def dataset_schema(df):
+    """Explicit Arrow schema for a stage frame (partition columns included)."""
+    fields = []
+    for column in df.columns:
+        if column in ("year", "month_num"):
+            continue
+        if column in KEY_FIELDS:
+            fields.append(pa.field(column, KEY_FIELDS[column]))
+        elif pd.api.types.is_bool_dtype(df[column]) or pd.api.types.is_numeric_dtype(df[column]):
+            fields.append(pa.field(column, pa.float64()))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields + list(PARTITION_SCHEMA))
+
+
+def to_table(df, schema):
+    """Casts a stage frame to the explicit schema."""
+    frame = df.copy()
+    frame["year"], frame["month_num"] = partition_keys(df)
+    if "date" in frame:
+        frame["date"] = pd.to_datetime(frame["date"], errors="coerce")
+    for field in schema:
+        if pa.types.is_string(field.type):
+            values = frame[field.name]
+            frame[field.name] = values.where(values.isna(), values.astype(str))
+        elif pa.types.is_floating(field.type):
+            frame[field.name] = pd.to_numeric(frame[field.name], errors="coerce").astype("float64")
+    return pa.Table.from_pandas(frame[schema.names], schema=schema, preserve_index=False)
+
+
+def write_stage(df, stage, root=DATASET_ROOT):
+    """Writes a pipeline stage as a year/month-partitioned Parquet dataset, replacing any previous version."""
+    schema = dataset_schema(df)
+    table = to_table(df, schema)
+    # Rows of one org sit together, so row-group statistics can skip other orgs
+    sort_keys = [(name, "ascending") for name in ("org_code", "date") if name in schema.names]
+    if sort_keys:
+        table = table.sort_by(sort_keys)
+
+    path = stage_dir(stage, root)
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    ds.write_dataset(
+        table, tmp_path, format="parquet",
+        partitioning=ds.partitioning(PARTITION_SCHEMA, flavor="hive"),
+        max_rows_per_group=ROW_GROUP_ROWS, min_rows_per_group=min(ROW_GROUP_ROWS, 1024),
+        basename_template="part-{i}.parquet",
+    )
+    pq.write_metadata(schema, os.path.join(tmp_path, SCHEMA_NAME))
+    with open(os.path.join(tmp_path, MANIFEST_NAME), "w") as f:
+        json.dump({"stage": stage, "rows": table.num_rows, "columns": schema.names,
+                   "written_at": time.time()}, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def write_partitions(df, stage, root=DATASET_ROOT):
+    """Replaces only the year/month partitions that df has rows for, keeping the rest of the stage.
+
+    The stage's existing schema is kept (missing columns are written as null,
+    extra ones dropped); a stage that does not exist yet is written whole.
+    """
+    if not stage_exists(stage, root):
+        return write_stage(df, stage, root)
+    path = stage_dir(stage, root)
+    schema = pq.read_schema(os.path.join(path, SCHEMA_NAME))
+    frame = df.copy()
+    for name in schema.names:
+        if name not in frame and name not in PARTITION_SCHEMA.names:
+            frame[name] = np.nan if pa.types.is_floating(schema.field(name).type) else None
+    table = to_table(frame, schema)
+    sort_keys = [(name, "ascending") for name in ("org_code", "date") if name in schema.names]
+    if sort_keys:
+        table = table.sort_by(sort_keys)
+
+    ds.write_dataset(
+        table, path, format="parquet",
+        partitioning=ds.partitioning(PARTITION_SCHEMA, flavor="hive"),
+        max_rows_per_group=ROW_GROUP_ROWS, min_rows_per_group=min(ROW_GROUP_ROWS, 1024),
+        basename_template="part-{i}.parquet", existing_data_behavior="delete_matching",
+    )
+    with open(os.path.join(path, MANIFEST_NAME), "w") as f:
+        json.dump({"stage": stage, "rows": open_stage(stage, root).count_rows(), "columns": schema.names,
+                   "written_at": time.time()}, f, indent=2)
+    return path
+
+
+def _period_filter(start, end):
+    """Partition predicate for an inclusive (year, month) range; either end may be None."""
+    year, month_num = ds.field("year"), ds.field("month_num")
+    expression = None
+    if start is not None:
+        start_year, start_month = start
+        expression = (year > start_year) | ((year == start_year) & (month_num >= start_month))
+    if end is not None:
+        end_year, end_month = end
+        before_end = (year < end_year) | ((year == end_year) & (month_num <= end_month))
+        expression = before_end if expression is None else expression & before_end
+    return expression
+
+
+def stage_filter(org_codes=None, org_names=None, start=None, end=None):
+    """Builds the pushed-down scan predicate (None when nothing is filtered)."""
+    expressions = []
+    if org_codes:
+        expressions.append(ds.field("org_code").isin(list(org_codes)))
+    if org_names:
+        # Org names are matched case-insensitively, as in the API
+        upper = [name.strip().upper() for name in org_names]
+        expressions.append(pc.is_in(pc.utf8_upper(pc.utf8_trim_whitespace(ds.field("org_name"))),
+                                    value_set=pa.array(upper)))
+    period = _period_filter(start, end)
+    if period is not None:
+        expressions.append(period)
+    if not expressions:
+        return None
+    expression = expressions[0]
+    for other in expressions[1:]:
+        expression = expression & other
+    return expression
+
+
+def open_stage(stage, root=DATASET_ROOT):
+    """Opens a stage as a pyarrow dataset with its explicit schema."""
+    path = stage_dir(stage, root)
+    schema = pq.read_schema(os.path.join(path, SCHEMA_NAME))
+    return ds.dataset(path, schema=schema, format="parquet",
+                      partitioning=ds.partitioning(PARTITION_SCHEMA, flavor="hive"),
+                      exclude_invalid_files=False, ignore_prefixes=["_", "."])
+
+
+def read_stage_table(stage, columns=None, org_codes=None, org_names=None, start=None, end=None,
+                     root=DATASET_ROOT):
+    """Scans a stage, reading only the requested columns and the partitions/row groups that match.
+
+    start/end are inclusive (year, month) tuples.
+    """
+    dataset = open_stage(stage, root)
+    wanted = dataset.schema.names if columns is None else [c for c in columns if c in dataset.schema.names]
+    scanned = wanted + [name for name in PARTITION_SCHEMA.names if name not in wanted]
+    table = dataset.to_table(columns=scanned, filter=stage_filter(org_codes, org_names, start, end))
+
+    # Partitions come back in directory order; restore chronological order
+    order = [("year", "ascending"), ("month_num", "ascending")]
+    if "org_code" in table.column_names:
+        order.append(("org_code", "ascending"))
+    return table.sort_by(order).select(wanted)
+
+
+def read_stage(stage, columns=None, org_codes=None, org_names=None, start=None, end=None,
+               root=DATASET_ROOT):
+    """Like read_stage_table, as a pandas frame without the month_num partition column."""
+    table = read_stage_table(stage, columns, org_codes, org_names, start, end, root)
+    if "month_num" in table.column_names and (columns is None or "month_num" not in columns):
+        table = table.drop_columns("month_num")
+    return table.to_pandas()
+
+
+def convert_legacy_csvs(raw_dir=RAW_DIR, root=DATASET_ROOT, stages=None):
+    """Writes each legacy CSV snapshot in raw/ as its Parquet stage dataset."""
+    written = {}
+    for stage, filename in LEGACY_STAGE_FILES.items():
+        if stages and stage not in stages:
+            continue
+        csv_path = os.path.join(raw_dir, filename)
+        if not os.path.exists(csv_path):
+            print(f"⚠ {filename} not found, skipping stage '{stage}'")
+            continue
+        df = pd.read_csv(csv_path, low_memory=False)
+        written[stage] = write_stage(df, stage, root)
+        print(f"✅ {filename} → {written[stage]} ({len(df)} rows)")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the raw/ CSV snapshots into partitioned Parquet stage datasets")
+    parser.add_argument("stages", nargs="*", help=f"stages to convert (default: all of {', '.join(LEGACY_STAGE_FILES)})")
+    parser.add_argument("--root", default=DATASET_ROOT, help="dataset root directory")
+    args = parser.parse_args()
+    convert_legacy_csvs(root=args.root, stages=args.stages)
+
+
+if __name__ == "__main__":
+    main()
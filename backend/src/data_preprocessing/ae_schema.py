@@ -0,0 +1,113 @@
+"""Shared in-memory schema for the A&E frame.
+
+Every entry point loads the data through load_ae_csv / compact_frame so
+the same frame costs a fraction of the RAM of pandas' default dtypes:
+
+- org and region columns (org_code, parent_org, org_name, period, month)
+  are categoricals, so each distinct name is stored once
+- whole-number counts use the narrowest nullable integer (Int8..Int64)
+  that holds their range, keeping missing values as <NA>
+- year is Int32 (wide enough for year * 100 + month period keys) and
+  date a real datetime64 column
+
+memory_report() prints the per-column cost so the budget can be checked.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+CATEGORY_COLUMNS = ["org_code", "parent_org", "org_name", "period", "month", "region", "season"]
+YEAR_COLUMN = "year"
+DATE_COLUMN = "date"
+
+# Smallest first; the first one whose range holds the column wins
+INTEGER_DTYPES = ["Int8", "Int16", "Int32", "Int64"]
+
+
+def _integer_dtype(values):
+    """Narrowest nullable integer dtype for a float column of whole numbers, or None."""
+    finite = values[np.isfinite(values)]
+    if len(finite) != values.notna().sum() or not np.array_equal(finite, np.round(finite)):
+        return None
+    if finite.empty:
+        return None
+    low, high = finite.min(), finite.max()
+    for dtype in INTEGER_DTYPES:
+        info = np.iinfo(dtype.lower())
+        if info.min <= low and high <= info.max:
+            return dtype
+    return None
+
+
+def compact_frame(df):
+    """Returns df with the compact dtypes: categoricals, narrow nullable ints, real dates."""
+    df = df.copy()
+    for column in df.columns:
+        values = df[column]
+        if column in CATEGORY_COLUMNS:
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                df[column] = values.astype("category")
+        elif column == YEAR_COLUMN:
+            df[column] = pd.to_numeric(values, errors="coerce").round().astype("Int32")
+        elif column == DATE_COLUMN:
+            df[column] = pd.to_datetime(values, errors="coerce")
+        elif pd.api.types.is_bool_dtype(values):
+            continue
+        elif pd.api.types.is_numeric_dtype(values):
+            dtype = _integer_dtype(values.astype("float64"))
+            if dtype is not None:
+                df[column] = values.astype("float64").astype(dtype)
+    return df
+
+
+def load_ae_csv(path, **kwargs):
+    """Reads an A&E CSV straight into the compact schema."""
+    header = pd.read_csv(path, nrows=0, **kwargs).columns
+    dtype = {column: "category" for column in CATEGORY_COLUMNS if column in header}
+    return compact_frame(pd.read_csv(path, dtype=dtype, low_memory=False, **kwargs))
+
+
+def memory_report(df, baseline=None):
+    """Per-column memory use in bytes (deep), optionally next to a baseline frame's.
+
+    Returns a frame indexed by column with dtype and bytes (and baseline_bytes
+    and ratio when a baseline is given), plus a TOTAL row.
+    """
+    report = pd.DataFrame({
+        "dtype": df.dtypes.astype(str),
+        "bytes": df.memory_usage(deep=True, index=False),
+    })
+    if baseline is not None:
+        report["baseline_bytes"] = baseline.memory_usage(deep=True, index=False).reindex(report.index)
+    total = {"dtype": "", "bytes": report["bytes"].sum()}
+    if baseline is not None:
+        total["baseline_bytes"] = report["baseline_bytes"].sum()
+    report.loc["TOTAL"] = total
+    if baseline is not None:
+        report["ratio"] = (report["baseline_bytes"] / report["bytes"]).round(1)
+    return report
+
+
+def print_memory_report(df, baseline=None):
+    report = memory_report(df, baseline)
+    print("📊 Memory use per column (MB):")
+    shown = report.copy()
+    for column in ("bytes", "baseline_bytes"):
+        if column in shown:
+            shown[column] = (shown[column] / 1e6).round(3)
+    print(shown.to_string())
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare default and compact memory use of an A&E CSV")
+    parser.add_argument("csv", help="path to an A&E CSV, e.g. raw/nhs_ae_merged.csv")
+    args = parser.parse_args()
+    baseline = pd.read_csv(args.csv, low_memory=False)
+    report = print_memory_report(load_ae_csv(args.csv), baseline)
+    print(f"✅ {report.loc['TOTAL', 'ratio']}x smaller than pandas' default dtypes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import codecs
+import io
+import multiprocessing
+import resource
+import sys
+import time
+
+import chardet
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # fall back to the pandas C parser
+    pa = None
+
+# detect_encoding.py showed the first 10 KB is enough to identify the encoding
+ENCODING_SAMPLE_BYTES = 10_000
+DEFAULT_ENCODING = "ISO-8859-1"
+
+# Below this size the pandas C parser beats pyarrow's thread start-up cost. A monthly NHS
+# release is about 40 KB, so production files never take the Arrow path: on those, Arrow
+# was about 40% slower than the C parser reading the same bytes
+ARROW_MIN_BYTES = 1_000_000
+
+# Last encoding detected per source (e.g. per container), reused while it still fits
+_encoding_cache = {}
+
+
+def _sample_fits(sample, encoding):
+    """True if the sample decodes cleanly with encoding and isn't better read as UTF-8."""
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+    except (UnicodeDecodeError, LookupError):
+        return False
+    if sample.isascii() or codecs.lookup(encoding).name == "utf-8":
+        return True
+    # Single-byte encodings accept any bytes, so check the sample isn't really UTF-8
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return False
+    except UnicodeDecodeError:
+        return True
+
+
+def detect_encoding(blob_data, source=None):
+    """Detects encoding of a file from a sample of its first bytes.
+
+    The result is cached per source and reused as long as the next file's
+    sample still decodes with it. Defaults to 'ISO-8859-1' if detection fails.
+    """
+    sample = bytes(memoryview(blob_data)[:ENCODING_SAMPLE_BYTES])
+    cached = _encoding_cache.get(source)
+    if cached and _sample_fits(sample, cached):
+        return cached
+
+    encoding = chardet.detect(sample)["encoding"] or DEFAULT_ENCODING
+    _encoding_cache[source] = encoding
+    return encoding
+
+
+def read_csv_legacy(blob_data, encoding):
+    """The original path: decode to str, wrap in StringIO and parse with pandas."""
+    csv_stream = io.StringIO(blob_data.decode(encoding, errors="replace"))
+    return pd.read_csv(csv_stream, low_memory=False)
+
+
+def read_csv_bytes(blob_data, encoding):
+    """Parses the bytes with the pandas C parser, decoding inside the parser (no str copy)."""
+    return pd.read_csv(io.BytesIO(blob_data), encoding=encoding, encoding_errors="replace", low_memory=False)
+
+
+def read_csv_fast(blob_data, encoding):
+    """Parses the downloaded bytes in place with pyarrow's multithreaded CSV reader.
+
+    The bytes are wrapped in a zero-copy Arrow buffer (no decoded str or
+    StringIO copy), and the result matches read_csv_legacy's frame. Small
+    files, where Arrow's setup cost dominates, go through the pandas C
+    parser on the same bytes instead, as does anything pyarrow rejects.
+    """
+    if pa is None or len(blob_data) < ARROW_MIN_BYTES:
+        return read_csv_bytes(blob_data, encoding)
+
+    # ASCII is a subset of UTF-8, which Arrow reads natively without transcoding
+    arrow_encoding = "utf8" if codecs.lookup(encoding).name in ("ascii", "utf-8") else encoding
+    try:
+        table = pa_csv.read_csv(
+            pa.BufferReader(pa.py_buffer(blob_data)),
+            read_options=pa_csv.ReadOptions(encoding=arrow_encoding, use_threads=True),
+            convert_options=pa_csv.ConvertOptions(strings_can_be_null=True),
+        )
+    except (pa.ArrowInvalid, UnicodeDecodeError):
+        return read_csv_bytes(blob_data, encoding)
+
+    # All-empty columns come back as Arrow nulls; pandas reads them as float NaN
+    schema = pa.schema([pa.field(field.name, pa.float64()) if pa.types.is_null(field.type) else field
+                        for field in table.schema])
+    return table.cast(schema).to_pandas()
+
+
+def _peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _measure(reader, payloads, queue):
+    """Runs one decode path over every payload in a fresh process, reporting time and peak RSS growth."""
+    baseline = _peak_rss_bytes()
+    start = time.perf_counter()
+    rows = 0
+    for blob_data in payloads:
+        encoding = detect_encoding(blob_data, source="benchmark")
+        rows += len(reader(blob_data, encoding))
+    queue.put({
+        "seconds": time.perf_counter() - start,
+        "rows": rows,
+        "peak_memory_bytes": _peak_rss_bytes() - baseline,
+    })
+
+
+def benchmark_decode(payloads):
+    """Compares the legacy and fast decode paths on a list of CSV payloads (bytes).
+
+    Each path runs in its own process so peak memory is measured cleanly.
+    Returns {"legacy": {...}, "fast": {...}, "speedup": x, "memory_ratio": x, "arrow_files": n}.
+    memory_ratio is the fast path's peak RSS growth over the legacy path's
+    (below 1 is a saving, above 1 an increase); arrow_files counts the
+    payloads big enough for the Arrow reader (the rest use the pandas C parser).
+    """
+    total_bytes = sum(len(blob_data) for blob_data in payloads)
+    context = multiprocessing.get_context("fork" if sys.platform != "win32" else "spawn")
+    report = {}
+
+    for name, reader in (("legacy", read_csv_legacy), ("fast", read_csv_fast)):
+        queue = context.Queue()
+        process = context.Process(target=_measure, args=(reader, payloads, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        result["mb_per_second"] = total_bytes / 1e6 / result["seconds"] if result["seconds"] else None
+        report[name] = result
+
+    report["speedup"] = report["legacy"]["seconds"] / report["fast"]["seconds"]
+    report["memory_ratio"] = (report["fast"]["peak_memory_bytes"] / report["legacy"]["peak_memory_bytes"]
+                              if report["legacy"]["peak_memory_bytes"] > 0 else None)
+    report["arrow_files"] = sum(pa is not None and len(blob_data) >= ARROW_MIN_BYTES for blob_data in payloads)
+    return report
@@ -0,0 +1,169 @@
+"""Per-org lag, rolling and seasonal features for the attendance model.
+
+The notebook computed attendance_lag_1 and attendance_rolling_avg over
+the whole date-sorted frame, so each hospital's first months borrowed
+another hospital's numbers. Here every feature is computed within one
+org over its rows sorted by date, with grouped vectorized operations
+(sorted-key lookups for the lags, cumulative sums for the windows):
+
+- attendance_lag_<k>: the org's attendances k months earlier (its latest
+  report before then if that month is missing; NaN when the org has no
+  report that far back)
+- attendance_rolling_avg (3 months) and attendance_rolling_avg_<w>:
+  mean of the org's reports in the w months before this one. The current
+  month is left out (the notebook included it, which leaked the target),
+  matching what forecast.py feeds the model; NaN with no earlier report
+
+The notebook back-filled the missing lags and averages of an org's first
+months, which copied each row's own target into its features. Those rows
+are left NaN here, and training and backtests drop them.
+- month, year, season and month_sin/month_cos for the seasonal cycle
+
+Features are stored in the partitioned "features" stage, keyed by
+(org_code, date). append_month() computes a new month's rows from the
+stored lookback window only and rewrites just that month's partition.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Make the shared backend modules (src/...) importable when run as a script
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from src.data_preprocessing.ae_dataset import read_stage, stage_exists, write_partitions, write_stage
+from src.data_preprocessing.ae_schema import load_ae_csv
+
+FEATURE_STAGE = os.getenv("FEATURE_STAGE", "features")
+TARGET = "total_a&e_attendances"
+
+LAGS = {"attendance_lag_1": 1, "attendance_lag_12": 12}
+ROLLING_WINDOWS = {"attendance_rolling_avg": 3, "attendance_rolling_avg_12": 12}
+SEASONAL_COLUMNS = ["month", "year", "season", "month_sin", "month_cos"]
+FEATURE_COLUMNS = SEASONAL_COLUMNS + list(LAGS) + list(ROLLING_WINDOWS)
+KEY_COLUMNS = ["org_code", "org_name", "date"]
+
+# Months of history a new month's features depend on
+LOOKBACK_MONTHS = max(max(LAGS.values()), max(ROLLING_WINDOWS.values()))
+
+MONTH_TO_SEASON = {12: "Winter", 1: "Winter", 2: "Winter",
+                   3: "Spring", 4: "Spring", 5: "Spring",
+                   6: "Summer", 7: "Summer", 8: "Summer",
+                   9: "Autumn", 10: "Autumn", 11: "Autumn"}
+
+
+def org_keys(df):
+    """The grouping key: org_code, falling back to org_name when the code is missing."""
+    codes = df["org_code"].astype(object) if "org_code" in df else pd.Series(None, index=df.index, dtype=object)
+    if "org_name" in df:
+        codes = codes.where(codes.notna(), df["org_name"].astype(object))
+    return codes
+
+
+def build_features(df, target=TARGET):
+    """Returns df (same rows, same order) with the per-org feature columns added."""
+    df = df.copy()
+    df["date"] = pd.to_datetime(df["date"])
+    df["month"] = df["date"].dt.month
+    df["year"] = df["date"].dt.year
+    df["season"] = df["month"].map(MONTH_TO_SEASON)
+    angle = 2 * np.pi * (df["month"] - 1) / 12
+    df["month_sin"], df["month_cos"] = np.sin(angle), np.cos(angle)
+
+    # One pass over the rows sorted by org, then month: key = org index * 10^6 + months since year 0
+    keys = org_keys(df)
+    period = (df["year"] * 12 + df["month"] - 1).fillna(0).to_numpy(dtype=np.int64)
+    key = pd.factorize(keys)[0].astype(np.int64) * 1_000_000 + period
+    order = np.argsort(key, kind="stable")
+    key = key[order]
+    values = pd.to_numeric(df[target], errors="coerce").to_numpy(dtype=float)[order]
+    starts = np.flatnonzero(np.r_[True, key[1:] // 1_000_000 != key[:-1] // 1_000_000])
+    org_start = np.repeat(starts, np.diff(np.r_[starts, len(key)]))
+
+    features = {}
+    for name, lag in LAGS.items():
+        # The org's value k months back (or its latest report before then), else NaN
+        source = np.searchsorted(key, key - lag, side="right") - 1
+        features[name] = np.where(source >= org_start, values[np.maximum(source, 0)], np.nan)
+
+    # Rolling means over the w calendar months before each row (key - w .. key - 1), from
+    # cumulative sums; NaNs are skipped and the row's own month is never included
+    sums = np.r_[0, np.cumsum(np.nan_to_num(values))]
+    counts = np.r_[0, np.cumsum(~np.isnan(values))]
+    end = np.searchsorted(key, key, side="left")
+    for name, window in ROLLING_WINDOWS.items():
+        begin = np.searchsorted(key, key - window - 1, side="right")
+        window_count = counts[end] - counts[begin]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            features[name] = np.where(window_count > 0, (sums[end] - sums[begin]) / window_count, np.nan)
+
+    inverse = np.empty_like(order)
+    inverse[order] = np.arange(len(order))
+    for name, column in features.items():
+        df[name] = column[inverse]
+    return df
+
+
+def feature_frame(df, target=TARGET):
+    """The stored columns: org/date keys, the target and every feature."""
+    features = build_features(df, target)
+    columns = [c for c in KEY_COLUMNS + ["parent_org", target] if c in features] + FEATURE_COLUMNS
+    return features[columns]
+
+
+def write_features(df, stage=FEATURE_STAGE):
+    """Computes features for the full history and writes the feature stage."""
+    return write_stage(feature_frame(df), stage)
+
+
+def read_features(stage=FEATURE_STAGE, columns=None, org_codes=None, start=None, end=None):
+    """Reads stored features, pushing org and (year, month) filters down into the scan."""
+    return read_stage(stage, columns=columns, org_codes=org_codes, start=start, end=end)
+
+
+def append_month(new_rows, stage=FEATURE_STAGE, target=TARGET):
+    """Adds (or replaces) the month(s) in new_rows, touching only their partitions.
+
+    Only the last LOOKBACK_MONTHS of stored history before the new month are read.
+    Returns the new rows' features.
+    """
+    new_rows = new_rows.copy()
+    new_rows["date"] = pd.to_datetime(new_rows["date"])
+    if not stage_exists(stage):
+        raise RuntimeError(f"❌ Feature stage '{stage}' does not exist; build it with write_features first")
+
+    first_month = new_rows["date"].min()
+    lookback = first_month - pd.DateOffset(months=LOOKBACK_MONTHS)
+    last_stored = first_month - pd.DateOffset(months=1)
+    history = read_features(stage, columns=KEY_COLUMNS + [target],
+                            start=(lookback.year, lookback.month), end=(last_stored.year, last_stored.month))
+
+    combined = pd.concat([history.assign(_new=False), new_rows.assign(_new=True)], ignore_index=True)
+    features = feature_frame(combined.drop(columns="_new"), target)
+    appended = features[combined["_new"].to_numpy()]
+    write_partitions(appended, stage)
+    return appended
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or extend the per-org feature store")
+    parser.add_argument("csv", help="A&E rows with org_code, org_name, date and total_a&e_attendances")
+    parser.add_argument("--append", action="store_true",
+                        help="treat the CSV as new month(s) and update only their partitions")
+    args = parser.parse_args()
+
+    df = load_ae_csv(args.csv)
+    if args.append:
+        appended = append_month(df)
+        print(f"✅ Appended features for {len(appended)} org-months to stage '{FEATURE_STAGE}'")
+    else:
+        path = write_features(df)
+        print(f"✅ Feature stage written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Seeded, vectorized gap filling for the merged A&E data.
+
+Every org is expected to report every month between its first and last
+report, so by default only gaps inside an org's own history are filled
+and no synthetic row is ever earlier than an org's first real one.
+months lists extra months to fill for every org, and start/end widen
+every org's span; both are opt-in back-fills that invent history. find_gaps() lists the (org, month)
+cells that are missing, and fill_gaps() generates all of them in one
+batched draw from a seeded numpy Generator:
+
+    value ~ Normal(org's mean for that calendar month, org's std for it * noise)
+
+falling back to the org's all-month mean/std, then to the all-org mean
+for that calendar month, when an org has no history for the month.
+Each fill row copies the org's latest code, name and region, so the
+synthetic rows are consistent with the real ones, and all fills are
+appended in a single concat. Cost is linear in orgs x months.
+"""
+import numpy as np
+import pandas as pd
+
+MONTH_ORDER = ["January", "February", "March", "April", "May", "June",
+               "July", "August", "September", "October", "November", "December"]
+MONTH_NUMBERS = {name: number for number, name in enumerate(MONTH_ORDER, start=1)}
+
+IDENTITY_COLUMNS = ["org_code", "org_name", "parent_org"]
+KEY_COLUMNS = IDENTITY_COLUMNS + ["year", "month", "period", "date"]
+SYNTHETIC_FLAG = "is_synthetic"
+
+DEFAULT_SEED = 42
+# Spread of the fills relative to the org's own month-to-month spread
+DEFAULT_NOISE = 0.1
+
+
+def _period_index(df):
+    """Months since year 0 (year * 12 + month - 1) per row, or -1 where the month is unknown."""
+    year = (pd.to_numeric(df["year"], errors="coerce").astype("float64") if "year" in df
+            else pd.Series(np.nan, index=df.index))
+    month = (df["month"].astype(str).str.strip().str.capitalize().map(MONTH_NUMBERS)
+             if "month" in df else pd.Series(np.nan, index=df.index))
+    if "date" in df:
+        dates = pd.to_datetime(df["date"], errors="coerce")
+        year, month = year.fillna(dates.dt.year), month.fillna(dates.dt.month)
+    period = year * 12 + month - 1
+    return period.fillna(-1).astype(np.int64).to_numpy()
+
+
+def _parse_month(value):
+    """'YYYY-MM' (or a Timestamp) -> period index."""
+    stamp = pd.Timestamp(value)
+    return stamp.year * 12 + stamp.month - 1
+
+
+def value_columns(df):
+    """Numeric measure columns to fill (everything numeric except the keys and flags)."""
+    return [column for column in df.columns
+            if column not in KEY_COLUMNS and column != SYNTHETIC_FLAG
+            and pd.api.types.is_numeric_dtype(df[column]) and not pd.api.types.is_bool_dtype(df[column])]
+
+
+def find_gaps(df, start=None, end=None, months=None):
+    """Missing (org, month) cells inside each org's span, plus the given months ('YYYY-MM') for every org.
+
+    Returns (org_codes, org_idx, periods): the org code categories, and one
+    org index and period index per missing cell.
+    """
+    periods = _period_index(df)
+    known = df["org_code"].notna().to_numpy() & (periods >= 0)
+    codes = pd.Categorical(df["org_code"][known].astype(str))
+    org_idx, periods = codes.codes.astype(np.int64), periods[known]
+    if len(org_idx) == 0:
+        return codes.categories, np.empty(0, np.int64), np.empty(0, np.int64)
+
+    first = np.full(len(codes.categories), np.iinfo(np.int64).max)
+    last = np.full(len(codes.categories), -1)
+    np.minimum.at(first, org_idx, periods)
+    np.maximum.at(last, org_idx, periods)
+    if start is not None:
+        first = np.minimum(first, _parse_month(start))
+    if end is not None:
+        last = np.maximum(last, _parse_month(end))
+
+    extra = np.array([_parse_month(month) for month in months or []], dtype=np.int64)
+
+    # Orgs x months grid of what was reported, offset from the earliest month
+    origin = min(first.min(), extra.min()) if len(extra) else first.min()
+    top = max(last.max(), extra.max()) if len(extra) else last.max()
+    observed = np.zeros((len(first), top - origin + 1), dtype=bool)
+    observed[org_idx, periods - origin] = True
+
+    expected = np.arange(observed.shape[1]) >= (first - origin)[:, None]
+    expected &= np.arange(observed.shape[1]) <= (last - origin)[:, None]
+    expected[:, extra - origin] = True
+    gap_org, gap_offset = np.nonzero(expected & ~observed)
+    return codes.categories, gap_org, gap_offset + origin
+
+
+def _group_stats(frame, group, n_groups):
+    """Mean and std (ddof=0) of every column per integer group id, NaN for empty groups."""
+    grouped = frame.groupby(group)
+    mean = np.full((n_groups, frame.shape[1]), np.nan)
+    std = np.full((n_groups, frame.shape[1]), np.nan)
+    means = grouped.mean()
+    mean[means.index.to_numpy()] = means.to_numpy()
+    std[means.index.to_numpy()] = grouped.std(ddof=0).to_numpy()
+    return mean, std
+
+
+def _seasonal_stats(values, org_idx, month_idx, n_orgs):
+    """Per (org, calendar month) and per-org mean/std arrays for every value column."""
+    frame = pd.DataFrame(values)
+    mean, std = _group_stats(frame, org_idx * 12 + month_idx, n_orgs * 12)
+    org_mean, org_std = _group_stats(frame, org_idx, n_orgs)
+    month_mean, _ = _group_stats(frame, month_idx, 12)
+    n_cols = values.shape[1]
+    return (mean.reshape(n_orgs, 12, n_cols), std.reshape(n_orgs, 12, n_cols),
+            org_mean, org_std, month_mean)
+
+
+def fill_gaps(df, seed=DEFAULT_SEED, noise=DEFAULT_NOISE, start=None, end=None, months=None):
+    """Returns df with a synthetic row appended for every missing (org, month) cell.
+
+    Synthetic rows have is_synthetic=True (real rows False). months
+    ('YYYY-MM' list) are filled for every org; start/end ('YYYY-MM') widen
+    every org's expected span and are opt-in, since they invent history.
+    """
+    df = df.reset_index(drop=True)
+    codes, gap_org, gap_period = find_gaps(df, start, end, months)
+    real = df.assign(**{SYNTHETIC_FLAG: False})
+    if len(gap_org) == 0:
+        return real
+
+    columns = value_columns(df)
+    periods = _period_index(df)
+    known = df["org_code"].notna().to_numpy() & (periods >= 0)
+    org_idx = pd.Categorical(df["org_code"][known].astype(str), categories=codes).codes.astype(np.int64)
+    month_idx = periods[known] % 12
+    values = df.loc[known, columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float, copy=True)
+    values[~np.isfinite(values)] = np.nan
+
+    mean, std, org_mean, org_std, month_mean = _seasonal_stats(values, org_idx, month_idx, len(codes))
+
+    # Look up every gap's statistics at once, falling back org-wide, then all orgs
+    gap_month = gap_period % 12
+    gap_mean = mean[gap_org, gap_month]
+    gap_std = std[gap_org, gap_month]
+    gap_mean = np.where(np.isnan(gap_mean), org_mean[gap_org], gap_mean)
+    gap_mean = np.where(np.isnan(gap_mean), month_mean[gap_month], gap_mean)
+    gap_std = np.where(np.isnan(gap_std), org_std[gap_org], gap_std)
+    gap_std = np.nan_to_num(gap_std)
+
+    # One batched draw for every cell and column
+    rng = np.random.default_rng(seed)
+    draws = gap_mean + rng.standard_normal(gap_mean.shape) * gap_std * noise
+    draws = np.clip(draws, 0, None)
+    whole = [np.allclose(values[:, i][~np.isnan(values[:, i])] % 1, 0) for i in range(len(columns))]
+    draws[:, whole] = np.round(draws[:, whole])
+
+    # Each org keeps the identity of its most recent real row
+    latest = (df.loc[known, IDENTITY_COLUMNS]
+              .assign(_org=org_idx, _period=periods[known])
+              .sort_values("_period", kind="stable")
+              .drop_duplicates("_org", keep="last")
+              .set_index("_org"))
+
+    years = gap_period // 12
+    months = np.array(MONTH_ORDER)[gap_month]
+    fills = latest.loc[gap_org, IDENTITY_COLUMNS].reset_index(drop=True)
+    fills[columns] = draws
+    if "year" in df:
+        fills["year"] = years.astype(str) if not pd.api.types.is_numeric_dtype(df["year"]) else years
+    if "month" in df:
+        fills["month"] = months
+    if "period" in df:
+        fills["period"] = [f"MSitAE-{month.upper()}-{year}" for month, year in zip(months, years)]
+    if "date" in df:
+        dates = pd.to_datetime(pd.DataFrame({"year": years, "month": gap_month + 1, "day": 1}))
+        fills["date"] = dates if pd.api.types.is_datetime64_any_dtype(df["date"]) else dates.dt.strftime("%Y-%m-%d")
+    fills[SYNTHETIC_FLAG] = True
+
+    return pd.concat([real, fills[[c for c in real.columns if c in fills]]], ignore_index=True)
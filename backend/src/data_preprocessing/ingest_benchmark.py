@@ -0,0 +1,101 @@
+import calendar
+import glob
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+# Make the shared backend modules (src/...) importable when run as a script
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from src.utils.storage import LocalStorage
+
+# Same layout the notebooks use to read the monthly NHS Excel files in data/
+EXCEL_SKIPROWS = 17
+EXCEL_HEADERS = [
+    'Code', 'System', 'Type 1 Departments', 'Type 2 Departments', 'Type 3 Departments',
+    'Total A&E attendances', 'Attendances < 4 hours (Type 1)', 'Attendances < 4 hours (Type 2)',
+    'Attendances < 4 hours (Type 3)', 'Total Attendances < 4 hours', 'Attendances > 4 hours (Type 1)',
+    'Attendances > 4 hours (Type 2)', 'Attendances > 4 hours (Type 3)', 'Total Attendances > 4 hours',
+    'Percentage in 4 hours (all)', 'Percentage in 4 hours (Type 1)', 'Percentage in 4 hours (Type 2)',
+    'Percentage in 4 hours (Type 3)', 'Emergency Admissions Type 1', 'Emergency Admissions Type 2',
+    'Emergency Admissions Type 3 and 4', 'Total Emergency Admissions via A&E',
+    'Other Emergency Admissions (not via A&E)', 'Total Emergency Admissions',
+    'Patients spending >4 hours from decision to admit', 'Patients spending >12 hours from decision to admit'
+]
+
+
+def read_monthly_file(path):
+    """Reads one data/ monthly file (Excel or CSV) into a frame."""
+    if path.endswith(".csv"):
+        return pd.read_csv(path)
+    data = pd.read_excel(path, engine="xlrd", skiprows=EXCEL_SKIPROWS, header=None, names=EXCEL_HEADERS)
+    return data[data["System"].notna() & (data["System"] != "-")]
+
+
+def stage_monthly_files(data_dir, storage, copies=1):
+    """Writes data/<month>_<year>_ae_data.* into storage as Monthly_AE_<Month>_<Year>.csv blobs.
+
+    With copies > 1 the months are replayed under earlier years so the
+    ingest sees a larger container. Returns the years that were staged.
+    """
+    paths = sorted(glob.glob(os.path.join(data_dir, "*_ae_data.xls")) + glob.glob(os.path.join(data_dir, "*_ae_data.csv")))
+    if not paths:
+        raise RuntimeError(f"❌ No monthly files found in {data_dir}")
+
+    years = set()
+    for path in paths:
+        match = re.match(r"([a-z]+)_(\d{4})_ae_data", os.path.basename(path), re.IGNORECASE)
+        if not match:
+            continue
+        month, year = match.group(1).capitalize(), int(match.group(2))
+        if month not in calendar.month_name:  # e.g. combined_2024_ae_data.csv
+            continue
+        payload = read_monthly_file(path).to_csv(index=False).encode("utf-8")
+        for copy in range(copies):
+            years.add(str(year - copy))
+            storage.put_stream(f"Monthly_AE_{month}_{year - copy}.csv", [payload], length=len(payload))
+    return sorted(years, reverse=True)
+
+
+def benchmark_ingest(data_dir, copies=1, download_concurrency=None, parse_workers=None):
+    """Replays the data/ monthly files through the full ingest from a local store.
+
+    The files are staged into a temporary LocalStorage and loaded with an
+    empty Parquet cache, so every file is listed, downloaded, decoded,
+    parsed, combined and merged. Returns files, bytes, seconds, files/s and MB/s.
+    """
+    from src.data_preprocessing import load_nhs_data
+
+    workdir = tempfile.mkdtemp(prefix="ingest_benchmark_")
+    try:
+        storage = LocalStorage(os.path.join(workdir, "blobs"))
+        years = stage_monthly_files(data_dir, storage, copies)
+        blobs = list(storage.list())
+        total_bytes = sum(blob.size for blob in blobs)
+
+        start = time.perf_counter()
+        datasets = load_nhs_data.load_all_years(
+            storage, years=years, cache_dir=os.path.join(workdir, "cache"),
+            download_concurrency=download_concurrency or load_nhs_data.DOWNLOAD_CONCURRENCY,
+            parse_workers=parse_workers or load_nhs_data.PARSE_WORKERS,
+        )
+        nhs_all = load_nhs_data.merge_years(datasets)
+        seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "files": len(blobs),
+        "bytes": total_bytes,
+        "rows": len(nhs_all),
+        "seconds": seconds,
+        "files_per_second": len(blobs) / seconds,
+        "mb_per_second": total_bytes / 1e6 / seconds,
+    }
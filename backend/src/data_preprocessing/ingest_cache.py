@@ -0,0 +1,72 @@
+import json
+import os
+
+import pandas as pd
+
+# Local cache of parsed monthly files, next to the raw data by default
+DEFAULT_CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "raw", "ingest_cache"))
+MANIFEST_NAME = "manifest.json"
+
+
+def blob_fingerprint(blob):
+    """The properties that identify one version of a blob."""
+    last_modified = getattr(blob, "last_modified", None)
+    return {
+        "etag": getattr(blob, "etag", None),
+        "size": getattr(blob, "size", None),
+        "last_modified": last_modified.isoformat() if hasattr(last_modified, "isoformat") else last_modified,
+    }
+
+
+class IngestManifest:
+    """Records which blob versions have already been parsed into local Parquet parts.
+
+    Each entry maps a blob name to its etag, size, last-modified time and
+    the Parquet file holding its cleaned, column-normalized frame.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, MANIFEST_NAME)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+
+    def part_path(self, blob_name):
+        stem = os.path.splitext(os.path.basename(blob_name))[0]
+        return os.path.join(self.cache_dir, f"{stem}.parquet")
+
+    def is_current(self, blob):
+        """True if this exact blob version is already cached."""
+        entry = self.entries.get(blob.name)
+        if entry is None or not os.path.exists(entry["part"]):
+            return False
+        fingerprint = blob_fingerprint(blob)
+        return all(entry.get(key) == value for key, value in fingerprint.items())
+
+    def record(self, blob, part_path):
+        self.entries[blob.name] = {**blob_fingerprint(blob), "part": part_path}
+
+    def prune(self, live_blob_names):
+        """Drops entries (and their parts) for blobs no longer in the container."""
+        for blob_name in set(self.entries) - set(live_blob_names):
+            part = self.entries.pop(blob_name)["part"]
+            if os.path.exists(part):
+                os.remove(part)
+
+    def read_part(self, blob_name):
+        return pd.read_parquet(self.entries[blob_name]["part"])
+
+    def save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def write_part(df, part_path):
+    """Writes one parsed monthly frame as a Parquet part."""
+    os.makedirs(os.path.dirname(part_path), exist_ok=True)
+    df.to_parquet(part_path, index=False)
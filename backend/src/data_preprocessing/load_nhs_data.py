@@ -1,120 +1,269 @@
+import argparse
+import glob
 import os
-import chardet
+import sys
 import pandas as pd
-import io
 import re
-from azure.storage.blob import BlobServiceClient
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import numpy as np
 
+# Make the shared backend modules (src/...) importable when run as a script
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from src.data_preprocessing.ae_dataset import write_stage
+from src.data_preprocessing.csv_decode import ARROW_MIN_BYTES, benchmark_decode, detect_encoding, read_csv_fast
+from src.data_preprocessing.ingest_benchmark import benchmark_ingest
+from src.data_preprocessing.ingest_cache import DEFAULT_CACHE_DIR, IngestManifest, write_part
+from src.utils.profiling import profile_stage, profiled
+from src.utils.storage import get_storage
+
 # Load environment variables
 load_dotenv()
 
-# Azure Storage Account details
-AZURE_CONNECTION_STRING = os.getenv("AZURE_CONNECTION_STRING")
-AZURE_CONTAINER_NAME = os.getenv("AZURE_CONTAINER_NAME")
+# Concurrency limits: downloads are I/O bound, parsing is CPU bound
+DOWNLOAD_CONCURRENCY = int(os.getenv("INGEST_DOWNLOAD_CONCURRENCY", "8"))
+PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", str(os.cpu_count() or 1)))
 
-if not AZURE_CONNECTION_STRING:
-    raise RuntimeError("Azure Connection String is missing. Check your .env file.")
+YEARS_TO_LOAD = ["2024", "2023", "2022", "2021", "2020"]
+
+# Parsed monthly files are cached here as Parquet, with a manifest of blob versions
+INGEST_CACHE_DIR = os.getenv("INGEST_CACHE_DIR", DEFAULT_CACHE_DIR)
 
-try:
-    blob_service_client = BlobServiceClient.from_connection_string(AZURE_CONNECTION_STRING)
-    container_client = blob_service_client.get_container_client(AZURE_CONTAINER_NAME)
-    print("✅ Connected to Azure Blob Storage")
-except Exception as e:
-    raise RuntimeError(f"❌ Failed to connect to Azure: {e}")
 
 def extract_month_from_filename(filename):
     """Extracts the month from the filename, assuming format: Monthly_AE_<Month>_<Year>.csv"""
     match = re.search(r'Monthly_AE_([A-Za-z]+)_\d{4}\.csv', filename)
     return match.group(1) if match else None
 
-def detect_encoding(blob_data):
-    """Detects encoding of a file. Defaults to 'ISO-8859-1' if detection fails."""
-    result = chardet.detect(blob_data)
-    encoding = result['encoding']
-    return encoding if encoding else "ISO-8859-1"
+@profiled("list_blobs")
+def list_blobs_by_year(storage, years):
+    """Lists the store once and groups the CSV blobs by year, keeping listing order.
+
+    Returns {year: [(month, blob), ...]} where blob is a BlobInfo (name, etag, size, last_modified).
+    """
+    grouped = defaultdict(list)
+    for blob in storage.list():
+        if ".csv" not in blob.name:
+            continue
+        for year in years:
+            if f"{year}" in blob.name:
+                grouped[year].append((extract_month_from_filename(blob.name), blob))
+                break
+    return grouped
+
+@profiled("blob_fetch")
+def download_blob(storage, blob_name):
+    """Downloads one blob's bytes."""
+    return storage.get(blob_name)
+
+def parse_monthly_csv(blob_name, blob_data, year, encoding):
+    """Parses and cleans one monthly CSV straight from its bytes. Runs in a worker process."""
+    with profile_stage("read_csv") as stage:
+        df = read_csv_fast(blob_data, encoding)
+        stage.rows = len(df)
+
+    df = df.loc[:, ~df.columns.str.contains('Unnamed', case=False)]
+    df.columns = df.columns.str.strip().str.lower().str.replace(" ", "_")
+    df['month'] = extract_month_from_filename(blob_name)
+    df['year'] = int(year)
+    return df
+
+def parse_and_cache(blob_name, blob_data, year, encoding, part_path):
+    """Parses one monthly CSV and stores the cleaned frame as a Parquet part. Runs in a worker process."""
+    df = parse_monthly_csv(blob_name, blob_data, year, encoding)
+    write_part(df, part_path)
+    return df
+
+def fetch_and_parse(storage, blobs_by_year, manifest,
+                    download_concurrency=DOWNLOAD_CONCURRENCY, parse_workers=PARSE_WORKERS):
+    """Loads every blob, reusing cached Parquet parts for blob versions seen before.
+
+    New or changed blobs are downloaded concurrently and parsed in a worker
+    pool as soon as they land. Returns {blob_name: DataFrame} for the blobs
+    that loaded successfully.
+    """
+    frames = {}
+    blobs = {blob.name: blob for year_blobs in blobs_by_year.values() for _, blob in year_blobs}
+    manifest.prune(blobs)
+
+    jobs = []
+    for year, year_blobs in blobs_by_year.items():
+        for _, blob in year_blobs:
+            if manifest.is_current(blob):
+                with profile_stage("read_cached_part"):
+                    frames[blob.name] = manifest.read_part(blob.name)
+            else:
+                jobs.append((year, blob.name))
+    print(f"♻️ {len(frames)} files unchanged (cached), {len(jobs)} new or changed")
+
+    with ThreadPoolExecutor(max_workers=max(1, download_concurrency)) as downloads, \
+            ProcessPoolExecutor(max_workers=max(1, parse_workers)) as parsers:
+        download_futures = {downloads.submit(download_blob, storage, blob_name): (year, blob_name)
+                            for year, blob_name in jobs}
+
+        parse_futures = {}
+        for future in as_completed(download_futures):
+            year, blob_name = download_futures[future]
+            if "July_2021" in blob_name:
+                print(f"⚠ Processing {blob_name} (Fixing Known Issues)...")
+            else:
+                print(f"📂 Loading {blob_name}...")
+            try:
+                blob_data = future.result()
+            except Exception as e:
+                print(f"❌ Error reading {blob_name}: {e}")
+                continue
+            # Sampled detection is cheap, and doing it here lets every file share the encoding cache
+            with profile_stage("detect_encoding"):
+                encoding = detect_encoding(blob_data, source=id(storage))
+            part_path = manifest.part_path(blob_name)
+            parse_futures[parsers.submit(parse_and_cache, blob_name, blob_data, year, encoding, part_path)] = blob_name
 
-def load_nhs_data(year):
-    """Fetches NHS A&E data for a given year from Azure Blob Storage and cleans it."""
-    print(f"\n📡 Fetching data for {year}...")
-    year_files = [blob.name for blob in container_client.list_blobs() if f"{year}" in blob.name and ".csv" in blob.name]
+        for future in as_completed(parse_futures):
+            blob_name = parse_futures[future]
+            try:
+                frames[blob_name] = future.result()
+                manifest.record(blobs[blob_name], manifest.part_path(blob_name))
+            except Exception as e:
+                print(f"❌ Error reading {blob_name}: {e}")
 
-    if not year_files:
+    manifest.save()
+    return frames
+
+@profiled("combine_year", rows=lambda df: 0 if df is None else len(df))
+def combine_year(year, dfs):
+    """Merges one year's monthly frames and applies the per-year cleaning."""
+    if not dfs:
         print(f"⚠ No files found for {year}.")
         return None
 
-    dfs = []
-    for blob_name in year_files:
-        if "July_2021" in blob_name:
-            print(f"⚠ Processing {blob_name} (Fixing Known Issues)...")
-        else:
-            print(f"📂 Loading {blob_name}...")
+    nhs_data = pd.concat(dfs, ignore_index=True)
+    print(f"✅ Loaded {len(dfs)} files for {year}. Shape: {nhs_data.shape}")
+
+    missing_percentage = nhs_data.isnull().sum() / len(nhs_data) * 100
+    columns_to_drop = missing_percentage[missing_percentage > 90].index
+    nhs_data.drop(columns=columns_to_drop, inplace=True)
 
-        blob_client = container_client.get_blob_client(blob_name)
+    # String columns can't hold the integer 0 under pandas' str dtype; "0" writes the same CSV
+    text_columns = nhs_data.select_dtypes(include=["object", "string"]).columns
+    nhs_data[text_columns] = nhs_data[text_columns].fillna("0")
+    nhs_data.fillna(0, inplace=True)
 
-        try:
-            blob_data = blob_client.download_blob().readall()
-            encoding = detect_encoding(blob_data)
-            csv_stream = io.StringIO(blob_data.decode(encoding, errors="replace"))
-            df = pd.read_csv(csv_stream, low_memory=False)
+    return nhs_data
 
-            df = df.loc[:, ~df.columns.str.contains('Unnamed', case=False)]
-            df.columns = df.columns.str.strip().str.lower().str.replace(" ", "_")
-            df['month'] = extract_month_from_filename(blob_name)
-            df['year'] = int(year)
+def load_all_years(storage, years=YEARS_TO_LOAD, cache_dir=INGEST_CACHE_DIR,
+                   download_concurrency=DOWNLOAD_CONCURRENCY, parse_workers=PARSE_WORKERS):
+    """Fetches NHS A&E data for the given years from the blob store and cleans it.
 
-            dfs.append(df)
+    Only blobs that are new or changed since the last run are downloaded;
+    the rest are read back from the local Parquet cache.
+    """
+    print(f"\n📡 Fetching data for {', '.join(years)}...")
+    blobs_by_year = list_blobs_by_year(storage, years)
+    frames = fetch_and_parse(storage, blobs_by_year, IngestManifest(cache_dir),
+                             download_concurrency, parse_workers)
 
-        except Exception as e:
-            print(f"❌ Error reading {blob_name}: {e}")
+    # Merge in listing order so the output matches a sequential load
+    datasets = {}
+    for year in years:
+        dfs = [frames[blob.name] for _, blob in blobs_by_year.get(year, []) if blob.name in frames]
+        datasets[year] = combine_year(year, dfs)
+    return datasets
+
+@profiled("merge_years", rows=len)
+def merge_years(datasets):
+    """Concatenates the yearly frames and patches the known July 2021 gap."""
+    dfs = [df for df in datasets.values() if df is not None]
 
     if dfs:
-        nhs_data = pd.concat(dfs, ignore_index=True)
-        print(f"✅ Loaded {len(dfs)} files for {year}. Shape: {nhs_data.shape}")
+        nhs_all = pd.concat(dfs, ignore_index=True)
+        print(f"✅ Merged {len(dfs)} years of data. Shape: {nhs_all.shape}")
+    else:
+        raise RuntimeError("❌ No data available for analysis.")
 
-        missing_percentage = nhs_data.isnull().sum() / len(nhs_data) * 100
-        columns_to_drop = missing_percentage[missing_percentage > 90].index
-        nhs_data.drop(columns=columns_to_drop, inplace=True)
+    nhs_all["year"] = nhs_all["year"].astype(str)
 
-        nhs_data.fillna(0, inplace=True)
+    # 🔍 **Ensure July 2021 Exists Before Saving**
+    if not ((nhs_all["year"] == "2021") & (nhs_all["month"] == "July")).any():
+        print("⚠ July 2021 is missing! Adding a placeholder row for interpolation...")
+        missing_july_2021 = pd.DataFrame({
+            "year": ["2021"],
+            "month": ["July"],
+            "total_a&e_attendances": np.nan
+        })
+        nhs_all = pd.concat([nhs_all, missing_july_2021], ignore_index=True)
 
-        return nhs_data
-    else:
-        return None
+    # ✅ **Interpolate July 2021 to Fill Missing Values**
+    nhs_all = nhs_all.sort_values(["year", "month"])
+    nhs_all["total_a&e_attendances"] = nhs_all["total_a&e_attendances"].interpolate()
+    return nhs_all
+
+def report_decode_gain(csv_dir):
+    """Prints the throughput and peak-memory change of the fast decode path on local monthly CSVs."""
+    paths = sorted(glob.glob(os.path.join(csv_dir, "*.csv")))
+    if not paths:
+        raise RuntimeError(f"❌ No CSV files found in {csv_dir}")
+    payloads = []
+    for path in paths:
+        with open(path, "rb") as f:
+            payloads.append(f.read())
+
+    report = benchmark_decode(payloads)
+    print(f"📊 Decoded {len(paths)} files ({sum(map(len, payloads)) / 1e6:.1f} MB)")
+    for name in ("legacy", "fast"):
+        result = report[name]
+        print(f"   {name:>6}: {result['seconds']:.2f}s, {result['mb_per_second']:.1f} MB/s, "
+              f"peak +{result['peak_memory_bytes'] / 1e6:.1f} MB")
+    # Signed, so a fast path that uses more memory is reported as an increase
+    ratio = report["memory_ratio"]
+    memory = "peak memory change n/a" if ratio is None else f"peak memory {(ratio - 1) * 100:+.1f}% vs legacy"
+    print(f"✅ Fast path: {report['speedup']:.1f}x throughput, {memory}")
+    print(f"   {report['arrow_files']} of {len(paths)} files used the Arrow reader "
+          f"(files under {ARROW_MIN_BYTES / 1e6:g} MB go through the pandas C parser)")
+    return report
+
+def report_ingest_throughput(data_dir, copies=1):
+    """Prints files/s and MB/s for a full ingest of the data/ monthly files from a local store."""
+    report = benchmark_ingest(data_dir, copies=copies)
+    print(f"📊 Ingested {report['files']} files ({report['bytes'] / 1e6:.1f} MB, {report['rows']} rows) "
+          f"in {report['seconds']:.2f}s")
+    print(f"✅ {report['files_per_second']:.1f} files/s, {report['mb_per_second']:.1f} MB/s")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Load NHS A&E monthly CSVs from blob storage into nhs_ae_merged.csv")
+    parser.add_argument("--benchmark-decode", metavar="CSV_DIR",
+                        help="compare the legacy and fast CSV decode paths on local files and exit")
+    parser.add_argument("--benchmark-ingest", metavar="DATA_DIR",
+                        help="replay the monthly files in DATA_DIR through the full ingest and exit")
+    parser.add_argument("--copies", type=int, default=1,
+                        help="with --benchmark-ingest, replay the files under this many years")
+    args = parser.parse_args()
+    if args.benchmark_decode:
+        report_decode_gain(args.benchmark_decode)
+        return
+    if args.benchmark_ingest:
+        report_ingest_throughput(args.benchmark_ingest, args.copies)
+        return
+
+    nhs_all = merge_years(load_all_years(get_storage()))
+
+    # 📁 Save the Final Cleaned Dataset (partitioned Parquet stage, plus the CSV the notebooks read)
+    with profile_stage("write_stage", rows=len(nhs_all)):
+        stage_path = write_stage(nhs_all, "merged")
+    print(f"\n📁 Merged dataset saved as stage {stage_path}")
+    final_file = "nhs_ae_merged.csv"
+    with profile_stage("write_csv", rows=len(nhs_all)):
+        nhs_all.to_csv(final_file, index=False)
+    print(f"📁 Merged dataset saved as {final_file}")
+
+    # 🔍 Check July 2021 Values
+    july_2021_value = nhs_all[(nhs_all["year"] == "2021") & (nhs_all["month"] == "July")]["total_a&e_attendances"]
+    print(f"\n✅ July 2021 Attendance Value: {july_2021_value.values}")
 
-years_to_load = ["2024", "2023", "2022", "2021", "2020"]
-datasets = {year: load_nhs_data(year) for year in years_to_load}
-
-dfs = [df for df in datasets.values() if df is not None]
-
-if dfs:
-    nhs_all = pd.concat(dfs, ignore_index=True)
-    print(f"✅ Merged {len(dfs)} years of data. Shape: {nhs_all.shape}")
-else:
-    raise RuntimeError("❌ No data available for analysis.")
-
-nhs_all["year"] = nhs_all["year"].astype(str)
-
-# 🔍 **Ensure July 2021 Exists Before Saving**
-if not ((nhs_all["year"] == "2021") & (nhs_all["month"] == "July")).any():
-    print("⚠ July 2021 is missing! Adding a placeholder row for interpolation...")
-    missing_july_2021 = pd.DataFrame({
-        "year": ["2021"],
-        "month": ["July"],
-        "total_a&e_attendances": np.nan
-    })
-    nhs_all = pd.concat([nhs_all, missing_july_2021], ignore_index=True)
-
-# ✅ **Interpolate July 2021 to Fill Missing Values**
-nhs_all = nhs_all.sort_values(["year", "month"])
-nhs_all["total_a&e_attendances"] = nhs_all["total_a&e_attendances"].interpolate()
-
-# 📁 Save the Final Cleaned Dataset
-final_file = "nhs_ae_merged.csv"
-nhs_all.to_csv(final_file, index=False)
-print(f"\n📁 Merged dataset saved as {final_file}")
-
-# 🔍 Check July 2021 Values
-july_2021_value = nhs_all[(nhs_all["year"] == "2021") & (nhs_all["month"] == "July")]["total_a&e_attendances"]
-print(f"\n✅ July 2021 Attendance Value: {july_2021_value.values}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Synthetic NHS A&E monthly releases at any multiple of the real data's size.
+
+The real merged data is the template: every org's mean level for each
+measure column, how often it reports, its code, name and region, which
+months and columns each year's release had (the number_of_* names only
+exist in the older files, July 2021 was never published), and the
+seasonal shape of attendances. A scale of s
+writes about s times the template's rows, by repeating the template's
+years further back in time (up to MAX_YEAR_FACTOR times) and cloning its
+real orgs for the rest (never the TOTAL and "0" placeholder rows);
+clones get a suffixed code and name and a random size factor. Each value is org level x seasonal factor x yearly trend x
+lognormal noise, rounded.
+
+The output is one Monthly_AE_<Month>_<Year>.csv per month, the same
+files load_nhs_data reads from blob storage, so a synthetic run goes
+through the real ingest.
+"""
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.data_analysis.ae_aggregates import MONTH_ORDER
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+TEMPLATE_CSV = os.path.join(BACKEND_DIR, "raw", "nhs_ae_merged.csv")
+
+ORG_COLUMNS = ["org_code", "parent_org", "org_name"]
+ORG_KEY = ["org_code", "org_name"]
+# Years are repeated at most this many times; larger scales add trusts instead
+MAX_YEAR_FACTOR = 10
+YEARLY_GROWTH = 0.02
+NOISE_SIGMA = 0.08
+CLONE_SIZE_SIGMA = 0.3
+DEFAULT_SEED = 42
+
+
+class AETemplate:
+    """What the generator copies from the real merged data."""
+
+    def __init__(self, df):
+        df = df.dropna(subset=["org_code", "org_name"]).sort_values("year", kind="stable")
+        self.measures = [c for c in df.select_dtypes("number").columns if c != "year"]
+        values = df[self.measures].fillna(0)
+
+        # An org is a code and name; regions were renamed over the years, so it keeps its latest one
+        orgs = df.groupby(ORG_KEY, sort=True)
+        self.orgs = orgs["parent_org"].last().reset_index()[ORG_COLUMNS]
+        names = self.orgs["org_name"].astype(str).str.strip().str.upper()
+        self.real = ((self.orgs["org_code"].astype(str) != "0") & (names != "TOTAL")).to_numpy()
+        self.levels = values.groupby([df[c] for c in ORG_KEY], sort=True).mean().to_numpy()
+        months = df.groupby(["year", "month"]).ngroups
+        self.rates = np.clip(orgs.size().to_numpy() / max(months, 1), 0.05, 1.0)
+
+        # A release's columns are the measures it actually filled in
+        self.years = sorted(int(year) for year in df["year"].unique())
+        self.schema = {int(year): [c for c in self.measures if (values.loc[rows.index, c] != 0).any()]
+                       for year, rows in df.groupby("year")}
+        reported = df[self.real[orgs.ngroup().to_numpy()]]
+        self.months = {int(year): [month for month in MONTH_ORDER if month in set(rows["month"])]
+                       for year, rows in reported.groupby("year")}
+
+        # Calendar-month shape of the total, each year normalized to its own mean
+        totals = values.sum(axis=1).groupby([df["year"], df["month"]]).sum()
+        totals = totals / totals.groupby(level="year").transform("mean")
+        shape = totals.groupby(level="month").mean()
+        self.season = {month: float(shape.get(month, 1.0)) for month in MONTH_ORDER}
+
+    @classmethod
+    def from_csv(cls, path=TEMPLATE_CSV):
+        return cls(pd.read_csv(path, low_memory=False))
+
+    def plan(self, scale):
+        """(years, org count) for a scale: more years first, then more trusts."""
+        year_factor = min(max(math.ceil(math.sqrt(scale)), 1), MAX_YEAR_FACTOR)
+        last = self.years[-1]
+        years = list(range(last - len(self.years) * year_factor + 1, last + 1))
+        return years, max(1, round(len(self.orgs) * scale / year_factor))
+
+
+def write_synthetic_months(directory, scale=1, seed=DEFAULT_SEED, template=None):
+    """Writes scale x the template's rows as Monthly_AE_<Month>_<Year>.csv files into directory.
+
+    Returns {"files", "rows", "bytes", "orgs", "years"}; years are newest first (the order load_all_years takes).
+    """
+    template = template or AETemplate.from_csv()
+    rng = np.random.default_rng(seed)
+    years, n_orgs = template.plan(scale)
+    os.makedirs(directory, exist_ok=True)
+
+    # Every template org once, then clones of the real orgs
+    real = np.flatnonzero(template.real)
+    extra = np.arange(max(n_orgs - len(template.orgs), 0))
+    base = np.concatenate([np.arange(len(template.orgs)), real[extra % len(real)]])
+    clone = np.concatenate([np.zeros(len(template.orgs), dtype=int), extra // len(real) + 1])
+    n_orgs = len(base)
+    suffix = np.where(clone == 0, "", clone.astype(str))
+    orgs = pd.DataFrame({
+        "org_code": template.orgs["org_code"].to_numpy()[base].astype(str) + np.where(clone == 0, "", "-") + suffix,
+        "parent_org": template.orgs["parent_org"].to_numpy()[base],
+        "org_name": template.orgs["org_name"].to_numpy()[base].astype(str) + np.where(clone == 0, "", " ") + suffix,
+    })
+    levels = template.levels[base] * np.where(clone == 0, 1.0, rng.lognormal(0, CLONE_SIZE_SIGMA, n_orgs))[:, None]
+    rates = template.rates[base]
+    measure_index = {column: i for i, column in enumerate(template.measures)}
+
+    files, rows, total_bytes = 0, 0, 0
+    for year in years:
+        # Older synthetic years reuse the template's releases in a cycle, newest template year last
+        template_year = template.years[(year - years[-1] - 1) % len(template.years)]
+        columns = template.schema[template_year]
+        index = [measure_index[column] for column in columns]
+        trend = math.exp(YEARLY_GROWTH * (year - years[-1]))
+        for month in template.months[template_year]:
+            present = rng.random(n_orgs) < rates
+            noise = rng.lognormal(0, NOISE_SIGMA, (int(present.sum()), len(index)))
+            values = np.rint(levels[present][:, index] * template.season[month] * trend * noise).astype(np.int64)
+            frame = orgs[present].reset_index(drop=True)
+            frame.insert(0, "period", f"MSitAE-{month.upper()}-{year}")
+            frame = pd.concat([frame, pd.DataFrame(values, columns=columns)], axis=1)
+
+            path = os.path.join(directory, f"Monthly_AE_{month}_{year}.csv")
+            frame.to_csv(path, index=False)
+            files += 1
+            rows += len(frame)
+            total_bytes += os.path.getsize(path)
+
+    return {"files": files, "rows": rows, "bytes": total_bytes, "orgs": n_orgs,
+            "years": [str(year) for year in reversed(years)]}
@@ -0,0 +1,330 @@
+"""Rolling-origin backtest of the attendance models, per org, over many cutoffs.
+
+The notebook compared its models with a single unshuffled 80/20 split
+over all orgs mixed together. Here every model is refitted at each of
+several cutoff months on everything reported before the cutoff, and
+scored on the following horizon months (one step ahead, from the
+actual lag features), overall and per org. The rolling averages cover
+only the months before each row, as at forecast time, so a month's own
+attendances never leak into its inputs:
+
+    python src/modelling/backtest.py                                 # every available model, 12 cutoffs
+    python src/modelling/backtest.py --models linear_regression random_forest_tuned --cutoffs 24 --horizon 3
+
+The model x cutoff grid runs on a process pool. Each fold's fitted model
+and scores are cached on disk under a hash of the model, its
+parameters, the features, the cutoff and the data, so reruns only fit
+new folds. The report gives each model's accuracy next to its fit and
+predict throughput (rows per second).
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# Make the shared backend modules (src/...) importable when run as a script
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from src.data_preprocessing.ae_schema import load_ae_csv
+from src.data_preprocessing.feature_store import FEATURE_STAGE, build_features, read_features
+from src.data_preprocessing.ae_dataset import stage_exists
+from src.modelling.forecast import FEATURES, TARGET
+
+BACKTEST_CSV = os.getenv("BACKTEST_CSV", os.path.join(BACKEND_DIR, "raw", "nhs_ae_final_for_ml.csv"))
+BACKTEST_CACHE_DIR = os.getenv("BACKTEST_CACHE_DIR", os.path.join(BACKEND_DIR, "raw", "backtest_cache"))
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", str(os.cpu_count() or 1)))
+
+# The notebook's candidates: (class path, parameters); optional libraries are skipped when missing
+MODELS = {
+    "linear_regression": ("sklearn.linear_model.LinearRegression", {}),
+    "random_forest": ("sklearn.ensemble.RandomForestRegressor", {"n_estimators": 100, "random_state": 42}),
+    "random_forest_tuned": ("sklearn.ensemble.RandomForestRegressor",
+                            {"max_depth": 5, "min_samples_leaf": 1, "min_samples_split": 10,
+                             "n_estimators": 500, "random_state": 42}),
+    "xgboost": ("xgboost.XGBRegressor", {"n_estimators": 100, "random_state": 42}),
+    "lstm": ("LSTMRegressor", {"units": 50, "epochs": 10, "batch_size": 32}),
+}
+
+# Months of history required before the first cutoff
+MIN_TRAIN_MONTHS = 12
+
+
+class LSTMRegressor:
+    """The notebook's LSTM (each feature as one timestep) behind fit/predict."""
+
+    def __init__(self, units=50, epochs=10, batch_size=32):
+        self.units = units
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.model = None
+
+    def fit(self, X, y):
+        from tensorflow.keras.layers import LSTM, Dense
+        from tensorflow.keras.models import Sequential
+
+        X = np.asarray(X, dtype=float)
+        self.model = Sequential()
+        self.model.add(LSTM(self.units, return_sequences=False, input_shape=(X.shape[1], 1)))
+        self.model.add(Dense(1))
+        self.model.compile(optimizer="adam", loss="mean_squared_error")
+        self.model.fit(X.reshape((len(X), X.shape[1], 1)), np.asarray(y, dtype=float),
+                       epochs=self.epochs, batch_size=self.batch_size, verbose=0)
+        return self
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=float)
+        return self.model.predict(X.reshape((len(X), X.shape[1], 1)), verbose=0).ravel()
+
+
+def model_class(name):
+    """The model's class, or None when its library is not installed."""
+    path, _ = MODELS[name]
+    try:
+        if path == "LSTMRegressor":
+            importlib.import_module("tensorflow")
+            return LSTMRegressor
+        module, _, attribute = path.rpartition(".")
+        return getattr(importlib.import_module(module), attribute)
+    except ImportError:
+        return None
+
+
+def load_backtest_frame(csv_path=BACKTEST_CSV, stage=FEATURE_STAGE, features=FEATURES):
+    """Per-org features and target, from the feature stage's history when built, else from csv_path.
+
+    The features are always recomputed with the current feature_store, so a
+    stage written by an older (leaky) definition cannot skew the scores.
+    """
+    columns = ["org_name", "date", TARGET] + list(features)
+    if stage and stage_exists(stage):
+        print(f"Reading stage dataset: {stage}")
+        history = read_features(stage, columns=["org_code", "org_name", "date", TARGET])
+    else:
+        if not os.path.exists(csv_path):
+            raise FileNotFoundError(f"❌ Dataset not found: {csv_path}")
+        print(f"Reading CSV: {csv_path}")
+        history = load_ae_csv(csv_path)
+    frame = build_features(history)[columns]
+    frame = frame.dropna(subset=["date", TARGET] + list(features)).copy()
+    frame["date"] = pd.to_datetime(frame["date"]).dt.to_period("M").dt.to_timestamp()
+    frame["org_name"] = frame["org_name"].astype(str)
+    return frame.sort_values(["date", "org_name"], kind="stable").reset_index(drop=True)
+
+
+def frame_digest(frame):
+    return hashlib.sha256(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes()).hexdigest()
+
+
+def rolling_cutoffs(dates, count, horizon, step=1):
+    """The latest count cutoff months, step months apart, each followed by horizon months of data."""
+    months = np.sort(pd.unique(dates))
+    last = len(months) - horizon
+    positions = [last - k * step for k in range(count) if last - k * step >= MIN_TRAIN_MONTHS]
+    return [pd.Timestamp(months[position]) for position in sorted(positions)]
+
+
+def fold_key(model, features, cutoff, horizon, data_digest):
+    path, params = MODELS[model]
+    payload = {"model": model, "class": path, "params": params, "features": list(features), "target": TARGET,
+               "cutoff": cutoff.strftime("%Y-%m"), "horizon": horizon, "data": data_digest}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def fold_paths(cache_dir, model, key):
+    directory = os.path.join(cache_dir, model)
+    return os.path.join(directory, f"{key}.json"), os.path.join(directory, f"{key}.joblib")
+
+
+def score(actual, predicted):
+    error = predicted - actual
+    nonzero = actual != 0
+    total = float(((actual - actual.mean()) ** 2).sum())
+    return {
+        "mse": float(np.mean(error ** 2)),
+        "rmse": float(np.sqrt(np.mean(error ** 2))),
+        "mae": float(np.mean(np.abs(error))),
+        "mape": float(np.mean(np.abs(error[nonzero]) / np.abs(actual[nonzero])) * 100) if nonzero.any() else None,
+        "r2": 1 - float((error ** 2).sum()) / total if total > 0 else None,
+    }
+
+
+# The frame is sent to each worker once, not with every fold
+_frame = None
+
+
+def _init_worker(frame):
+    global _frame
+    _frame = frame
+
+
+def run_fold(model, features, cutoff, horizon, cache_dir, key):
+    """Fits model on rows before cutoff and scores it on the next horizon months; caches both."""
+    from sklearn.preprocessing import MinMaxScaler
+
+    frame = _frame
+    end = cutoff + pd.DateOffset(months=horizon)
+    train = frame[frame["date"] < cutoff]
+    test = frame[(frame["date"] >= cutoff) & (frame["date"] < end)]
+
+    scaler = MinMaxScaler()
+    X_train = scaler.fit_transform(train[features])
+    X_test = scaler.transform(test[features])
+    _, params = MODELS[model]
+    estimator = model_class(model)(**params)
+
+    start = time.perf_counter()
+    estimator.fit(X_train, train[TARGET].to_numpy(dtype=float))
+    fit_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    predicted = np.asarray(estimator.predict(X_test), dtype=float).ravel()
+    predict_seconds = time.perf_counter() - start
+
+    actual = test[TARGET].to_numpy(dtype=float)
+    errors = pd.DataFrame({"org_name": test["org_name"].to_numpy(), "abs_error": np.abs(predicted - actual),
+                           "ape": np.where(actual != 0, np.abs(predicted - actual) / np.abs(actual) * 100, np.nan)})
+    by_org = errors.groupby("org_name").agg(abs_error=("abs_error", "sum"), ape=("ape", "sum"),
+                                            ape_rows=("ape", "count"), rows=("abs_error", "size"))
+    result = {
+        "model": model, "cutoff": cutoff.strftime("%Y-%m"), "horizon": horizon, "features": list(features),
+        "train_rows": len(train), "test_rows": len(test),
+        "fit_seconds": fit_seconds, "predict_seconds": predict_seconds,
+        "scores": score(actual, predicted),
+        "orgs": {org: [float(row.abs_error), float(row.ape), int(row.ape_rows), int(row.rows)]
+                 for org, row in by_org.iterrows()},
+    }
+
+    json_path, model_path = fold_paths(cache_dir, model, key)
+    os.makedirs(os.path.dirname(json_path), exist_ok=True)
+    joblib.dump({"model": estimator, "scaler": scaler}, model_path)
+    with open(f"{json_path}.tmp", "w") as f:
+        json.dump(result, f)
+    os.replace(f"{json_path}.tmp", json_path)
+    return result
+
+
+def backtest(frame, models, cutoffs, horizon, features=FEATURES, cache_dir=BACKTEST_CACHE_DIR,
+             workers=BACKTEST_WORKERS):
+    """Every (model, cutoff) fold's result, from the cache when already fitted on the same data."""
+    data_digest = frame_digest(frame)
+    results, pending = [], []
+    for model in models:
+        for cutoff in cutoffs:
+            key = fold_key(model, features, cutoff, horizon, data_digest)
+            json_path, _ = fold_paths(cache_dir, model, key)
+            if os.path.exists(json_path):
+                with open(json_path) as f:
+                    results.append(dict(json.load(f), cached=True))
+            else:
+                pending.append((model, list(features), cutoff, horizon, cache_dir, key))
+
+    print(f"♻️ {len(results)} cached folds, {len(pending)} to fit on {min(workers, len(pending)) or 0} worker(s)")
+    if workers > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)), initializer=_init_worker,
+                                 initargs=(frame,)) as pool:
+            fitted = list(pool.map(run_fold, *zip(*pending)))
+    else:
+        _init_worker(frame)
+        fitted = [run_fold(*task) for task in pending]
+    return results + [dict(result, cached=False) for result in fitted]
+
+
+def summarize(results):
+    """Per model: mean fold scores, the median org MAPE, and fit / predict throughput."""
+    report = {}
+    for model in dict.fromkeys(result["model"] for result in results):
+        folds = [result for result in results if result["model"] == model]
+        scores = pd.DataFrame([fold["scores"] for fold in folds]).astype(float)
+        org_totals = {}
+        for fold in folds:
+            for org, (abs_error, ape, ape_rows, rows) in fold["orgs"].items():
+                totals = org_totals.setdefault(org, [0.0, 0.0, 0, 0])
+                totals[0] += abs_error
+                totals[1] += ape
+                totals[2] += ape_rows
+                totals[3] += rows
+        org_mape = [ape / ape_rows for _, ape, ape_rows, _ in org_totals.values() if ape_rows]
+        fit_seconds = sum(fold["fit_seconds"] for fold in folds)
+        predict_seconds = sum(fold["predict_seconds"] for fold in folds)
+        report[model] = {
+            "folds": len(folds),
+            "cutoffs": [fold["cutoff"] for fold in sorted(folds, key=lambda fold: fold["cutoff"])],
+            # A score no fold could compute (every actual zero, say) is None, not NaN
+            **{name: None if np.isnan(value) else round(float(value), 4) for name, value in scores.mean().items()},
+            "org_mape_median": round(float(np.median(org_mape)), 4) if org_mape else None,
+            "orgs": len(org_totals),
+            "fit_seconds": round(fit_seconds, 4),
+            "fit_rows_per_second": round(sum(fold["train_rows"] for fold in folds) / fit_seconds, 1)
+            if fit_seconds else None,
+            "predict_rows_per_second": round(sum(fold["test_rows"] for fold in folds) / predict_seconds, 1)
+            if predict_seconds else None,
+        }
+    return report
+
+
+def cell(value, width, spec):
+    """value formatted with spec and right-aligned to width, or n/a when it is missing."""
+    return f"{'n/a':>{width}}" if value is None else f"{value:>{width}{spec}}"
+
+
+def print_report(report):
+    print("\n📊 Backtest report (mean over folds):")
+    print(f"   {'model':<22}{'folds':>6}{'rmse':>12}{'mae':>12}{'mape %':>9}{'org mape %':>12}{'r2':>8}"
+          f"{'fit rows/s':>14}{'pred rows/s':>14}")
+    for model, entry in sorted(report.items(), key=lambda item: item[1]["mae"]):
+        print(f"   {model:<22}{entry['folds']:>6}{cell(entry['rmse'], 12, ',.1f')}{cell(entry['mae'], 12, ',.1f')}"
+              f"{cell(entry['mape'], 9, '.2f')}{cell(entry['org_mape_median'], 12, '.2f')}{cell(entry['r2'], 8, '.3f')}"
+              f"{cell(entry['fit_rows_per_second'], 14, ',.0f')}{cell(entry['predict_rows_per_second'], 14, ',.0f')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the attendance models")
+    parser.add_argument("--models", nargs="+", choices=list(MODELS), default=list(MODELS))
+    parser.add_argument("--features", nargs="+", default=FEATURES)
+    parser.add_argument("--cutoffs", type=int, default=12, help="number of cutoff months")
+    parser.add_argument("--step", type=int, default=1, help="months between cutoffs")
+    parser.add_argument("--horizon", type=int, default=1, help="months scored after each cutoff")
+    parser.add_argument("--csv", default=BACKTEST_CSV, help="final_for_ml CSV used when the feature stage is not built")
+    parser.add_argument("--stage", default=FEATURE_STAGE, help="feature stage to read (empty to always use --csv)")
+    parser.add_argument("--cache-dir", default=BACKTEST_CACHE_DIR)
+    parser.add_argument("--workers", type=int, default=BACKTEST_WORKERS)
+    parser.add_argument("--output", help="report JSON (default: <cache-dir>/report.json)")
+    args = parser.parse_args()
+
+    models = []
+    for model in args.models:
+        if model_class(model) is None:
+            print(f"⚠ {model} skipped: its library is not installed")
+        else:
+            models.append(model)
+
+    start = time.perf_counter()
+    frame = load_backtest_frame(args.csv, args.stage, args.features)
+    cutoffs = rolling_cutoffs(frame["date"], args.cutoffs, args.horizon, args.step)
+    if not cutoffs:
+        raise RuntimeError(f"❌ Not enough months for a backtest (need more than {MIN_TRAIN_MONTHS + args.horizon})")
+    print(f"Backtesting {len(models)} model(s) x {len(cutoffs)} cutoffs "
+          f"({cutoffs[0]:%Y-%m} to {cutoffs[-1]:%Y-%m}, horizon {args.horizon})")
+
+    results = backtest(frame, models, cutoffs, args.horizon, args.features, args.cache_dir, args.workers)
+    report = summarize(results)
+    print_report(report)
+
+    output = args.output or os.path.join(args.cache_dir, "report.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"features": args.features, "horizon": args.horizon, "models": report}, f, indent=2)
+    print(f"✅ Saved report to {output} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
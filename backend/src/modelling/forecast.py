@@ -0,0 +1,210 @@
+"""Batched multi-horizon attendance forecasts for every org at once.
+
+The notebook forecast one org and one month at a time: a one-row
+DataFrame, a scaler transform and a RandomForest predict per future
+month, thousands of tiny sklearn calls. Here each org's recursive state
+(its last value and its last three values for the rolling mean) is kept
+in arrays, and every horizon step does one transform and one predict for
+all orgs still inside their horizon. Orgs can also be split across a
+process pool. Optional noise is drawn up front from a seeded generator,
+so the result does not depend on the number of workers.
+
+A random forest's predict still walks its 500 trees one by one in
+Python, so fitted forests are first laid out as flat node arrays
+(CompiledForest) and evaluated for every tree and org in a few numpy
+steps per tree level, giving the same predictions as model.predict.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.data_preprocessing.gap_fill import SYNTHETIC_FLAG
+from src.utils.profiling import profiled
+
+FEATURES = ["attendance_rolling_avg", "attendance_lag_1"]
+TARGET = "total_a&e_attendances"
+ROLLING_WINDOW = 3
+
+FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", "1"))
+
+# Rows evaluated together by CompiledForest (bounds the trees x rows node matrix)
+FOREST_BLOCK_ROWS = 4096
+
+
+class CompiledForest:
+    """A fitted sklearn forest regressor's trees as flat node arrays, evaluated for all trees at once."""
+
+    # The node arrays, as saved and memory-mapped by the model registry
+    ARRAYS = ("feature", "threshold", "left", "right", "value")
+
+    def __init__(self, model):
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        n_nodes = max(tree.node_count for tree in trees)
+        self.n_trees = len(trees)
+        self.depth = max(tree.max_depth for tree in trees)
+        # Node arrays are flat, tree i's nodes starting at i * n_nodes; children hold flat indexes too
+        self.roots = np.arange(self.n_trees, dtype=np.intp)[:, None] * n_nodes
+        self.feature = np.zeros(self.n_trees * n_nodes, dtype=np.intp)
+        self.threshold = np.zeros(self.n_trees * n_nodes)
+        self.left = np.zeros(self.n_trees * n_nodes, dtype=np.intp)
+        self.right = np.zeros(self.n_trees * n_nodes, dtype=np.intp)
+        self.value = np.zeros(self.n_trees * n_nodes)
+        for i, tree in enumerate(trees):
+            offset = i * n_nodes
+            nodes = slice(offset, offset + tree.node_count)
+            own = np.arange(offset, offset + tree.node_count)
+            leaf = tree.children_left == -1
+            # Leaves point at themselves, so extra levels for shallower trees are no-ops
+            self.feature[nodes] = np.where(leaf, 0, tree.feature)
+            self.threshold[nodes] = tree.threshold
+            self.left[nodes] = np.where(leaf, own, tree.children_left + offset)
+            self.right[nodes] = np.where(leaf, own, tree.children_right + offset)
+            self.value[nodes] = tree.value[:, 0, 0]
+
+    @classmethod
+    def from_arrays(cls, arrays, n_trees, depth):
+        """Rebuilds a compiled forest from its saved node arrays (which may be memory-mapped)."""
+        forest = cls.__new__(cls)
+        forest.n_trees, forest.depth = n_trees, depth
+        for name in cls.ARRAYS:
+            setattr(forest, name, arrays[name])
+        forest.roots = np.arange(n_trees, dtype=np.intp)[:, None] * (len(forest.value) // n_trees)
+        return forest
+
+    def arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    def predict(self, X):
+        # sklearn compares float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        result = np.empty(len(X))
+        for start in range(0, len(X), FOREST_BLOCK_ROWS):
+            block = X[start:start + FOREST_BLOCK_ROWS]
+            # Feature-major so (feature, row) pairs are one flat take
+            values = block.T.ravel()
+            rows = np.arange(len(block))
+            node = np.repeat(self.roots, len(block), axis=1)
+            for _ in range(self.depth):
+                go_left = values.take(self.feature.take(node) * len(block) + rows) <= self.threshold.take(node)
+                node = np.where(go_left, self.left.take(node), self.right.take(node))
+            # Trees are summed in order, as the forest accumulates them
+            result[start:start + len(block)] = self.value.take(node).sum(axis=0) / self.n_trees
+        return result
+
+
+def batch_predictor(model):
+    """model.predict, or the equivalent CompiledForest.predict for sklearn random forests."""
+    from sklearn.ensemble import ExtraTreesRegressor, RandomForestRegressor
+
+    if isinstance(model, (RandomForestRegressor, ExtraTreesRegressor)) and model.n_outputs_ == 1:
+        return CompiledForest(model).predict
+    return model.predict
+
+
+def org_states(history, target=TARGET):
+    """Per-org forecast state from history (org_name, date, target).
+
+    Returns (orgs, last_dates, last_values, windows): orgs sorted by name,
+    and windows an (orgs x ROLLING_WINDOW) array of each org's latest
+    values, NaN-padded on the left for orgs with fewer months. When history
+    has an is_synthetic column, each org's state ends at its last real
+    month (gap fills before it still count) and orgs with no real rows
+    are left out.
+    """
+    history = history.dropna(subset=["org_name"]).copy()
+    history["org_name"] = history["org_name"].astype(str)
+    history["date"] = pd.to_datetime(history["date"])
+    if SYNTHETIC_FLAG in history:
+        real_dates = history["date"].where(~history[SYNTHETIC_FLAG].astype(bool))
+        last_real = real_dates.groupby(history["org_name"]).transform("max")
+        history = history[history["date"] <= last_real]
+    history = history.sort_values(["org_name", "date"], kind="stable")
+
+    tail = history.groupby("org_name", sort=True).tail(ROLLING_WINDOW)
+    orgs, org_idx = np.unique(tail["org_name"].to_numpy(), return_inverse=True)
+    from_end = tail.groupby("org_name").cumcount(ascending=False).to_numpy()
+    windows = np.full((len(orgs), ROLLING_WINDOW), np.nan)
+    windows[org_idx, ROLLING_WINDOW - 1 - from_end] = tail[target].to_numpy(dtype=float)
+
+    last = history.groupby("org_name", sort=True).last()
+    return orgs, last["date"].to_numpy(), windows[:, -1].copy(), windows
+
+
+@profiled("forecast_block", rows=len)
+def forecast_block(model, scaler, last_values, windows, steps, factors, predict=None):
+    """Recursive forecast for a block of orgs; one transform and predict per horizon step.
+
+    steps[i] is how many months org i is forecast; returns an (orgs x max(steps)) array.
+    predict defaults to batch_predictor(model) (pass it in to reuse a compiled forest).
+    """
+    predict = predict or batch_predictor(model)
+    last_values, windows = last_values.copy(), windows.copy()
+    predictions = np.full((len(steps), factors.shape[1]), np.nan)
+    for step in range(factors.shape[1]):
+        active = steps > step
+        if not active.any():
+            break
+        inputs = pd.DataFrame({"attendance_rolling_avg": np.nanmean(windows[active], axis=1),
+                               "attendance_lag_1": last_values[active]}, columns=FEATURES)
+        predicted = predict(scaler.transform(inputs)) * factors[active, step]
+        predictions[active, step] = predicted
+        last_values[active] = predicted
+        windows[active] = np.column_stack([windows[active, 1:], predicted])
+    return predictions
+
+
+@profiled("forecast", rows=len)
+def forecast(history, model, scaler, horizon_end, noise=0.0, seed=None, workers=FORECAST_WORKERS,
+             target=TARGET):
+    """Forecasts every org's months after its last report up to horizon_end.
+
+    Each prediction is scaled by 1 + U(-noise, noise) from a Generator seeded
+    with seed. Returns a frame with org_name, date and Predicted.
+    """
+    orgs, last_dates, last_values, windows = org_states(history, target)
+    last_dates = pd.DatetimeIndex(last_dates).to_period("M")
+    end = pd.Timestamp(horizon_end).to_period("M")
+    steps = np.maximum(end.ordinal - last_dates.asi8, 0)
+    max_steps = int(steps.max()) if len(steps) else 0
+
+    rng = np.random.default_rng(seed)
+    factors = 1 + rng.uniform(-noise, noise, (len(orgs), max_steps)) if noise else np.ones((len(orgs), max_steps))
+
+    if workers > 1 and len(orgs) > 1:
+        blocks = np.array_split(np.arange(len(orgs)), min(workers, len(orgs)))
+        with ProcessPoolExecutor(max_workers=len(blocks)) as pool:
+            parts = pool.map(forecast_block, [model] * len(blocks), [scaler] * len(blocks),
+                             [last_values[b] for b in blocks], [windows[b] for b in blocks],
+                             [steps[b] for b in blocks], [factors[b] for b in blocks])
+            predictions = np.vstack(list(parts))
+    else:
+        predictions = forecast_block(model, scaler, last_values, windows, steps, factors)
+
+    org_idx, step_idx = np.nonzero(np.arange(max_steps) < steps[:, None])
+    months = last_dates.to_numpy()[org_idx] + step_idx + 1
+    return pd.DataFrame({
+        "org_name": orgs[org_idx],
+        "date": pd.PeriodIndex(months, freq="M").to_timestamp(),
+        "Predicted": predictions[org_idx, step_idx],
+    })
+
+
+def prediction_records(history, forecasts, target=TARGET):
+    """predictions.json rows: each org's actuals by date, then its forecasts (orgs sorted by name)."""
+    actuals = history.dropna(subset=["org_name"])
+    actuals = pd.DataFrame({"org_name": actuals["org_name"].astype(str).to_numpy(),
+                            "date": pd.to_datetime(actuals["date"]).to_numpy(),
+                            "value": actuals[target].to_numpy(dtype=float), "kind": 0})
+    predicted = forecasts.rename(columns={"Predicted": "value"}).assign(kind=1)
+    rows = pd.concat([actuals, predicted], ignore_index=True)
+    rows = rows.sort_values(["org_name", "kind", "date"], kind="stable")
+
+    dates = rows["date"].dt.strftime("%Y-%m-%d").tolist()
+    # Missing attendances (kept as NaN by load_ae_csv) are written as null
+    values = [None if np.isnan(value) else int(round(value)) for value in rows["value"].tolist()]
+    return [
+        {"date": date, "org_name": org, "Actual": None if kind else value, "Predicted": value if kind else None}
+        for date, org, kind, value in zip(dates, rows["org_name"].tolist(), rows["kind"].tolist(), values)
+    ]
@@ -0,0 +1,313 @@
+"""Versioned model artifacts that load lazily and are shared between processes.
+
+random_forest_best_model.pkl is a joblib pickle, so every process that
+wants a prediction first unpickles 500 trees into Python objects and
+keeps its own copy of them. The registry stores each model instead as:
+
+    <root>/<name>/<version>/
+        feature.npy threshold.npy left.npy right.npy value.npy   (CompiledForest node arrays)
+        metadata.json   features, target, scaler parameters, metrics, source
+    <root>/<name>/LATEST  the version get() returns by default
+
+The version is a content hash of the arrays and metadata. get() only
+reads metadata.json; the arrays are opened on the first predict, as
+read-only memory maps, so worker processes serving the same model share
+one physical copy of the forest through the page cache. report() gives
+each opened model's load time and resident size.
+
+    python src/modelling/model_registry.py import random_forest_best models/random_forest_best_model.pkl \\
+        --scaler models/scaler.pkl --metrics metrics.json
+    python src/modelling/model_registry.py list
+    python src/modelling/model_registry.py report
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+
+# Make the shared backend modules (src/...) importable when run as a script
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from src.modelling.forecast import FEATURES, TARGET, CompiledForest
+
+REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", os.path.join(BACKEND_DIR, "models", "registry"))
+METADATA_NAME = "metadata.json"
+LATEST_NAME = "LATEST"
+
+
+def resident_bytes(paths):
+    """Bytes of the given mapped files resident in this process (from /proc/self/smaps), or None off Linux."""
+    paths = {os.path.realpath(path) for path in paths}
+    try:
+        smaps = open("/proc/self/smaps")
+    except OSError:
+        return None
+    total, mapped = 0, False
+    with smaps:
+        for line in smaps:
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0].endswith(":"):
+                if mapped and fields[0] == "Rss:":
+                    total += int(fields[1]) * 1024
+            else:
+                # Mapping header: address perms offset dev inode [path]
+                mapped = len(fields) >= 6 and " ".join(fields[5:]) in paths
+    return total
+
+
+class AffineScaler:
+    """A fitted MinMaxScaler or StandardScaler's transform, from its saved parameters.
+
+    Gives the same values as the sklearn scaler without unpickling it.
+    """
+
+    def __init__(self, kind, features, scale, offset, clip=False):
+        self.kind = kind
+        self.features = list(features)
+        self.scale = np.asarray(scale, dtype=float)
+        self.offset = np.asarray(offset, dtype=float)
+        self.clip = clip
+
+    @classmethod
+    def from_sklearn(cls, scaler, features):
+        from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+        if isinstance(scaler, MinMaxScaler):
+            return cls("minmax", features, scaler.scale_, scaler.min_, clip=scaler.clip)
+        if isinstance(scaler, StandardScaler):
+            mean = scaler.mean_ if scaler.with_mean else np.zeros(len(features))
+            scale = scaler.scale_ if scaler.with_std else np.ones(len(features))
+            return cls("standard", features, scale, mean)
+        raise TypeError(f"❌ Unsupported scaler {type(scaler).__name__}; expected MinMaxScaler or StandardScaler")
+
+    @classmethod
+    def from_dict(cls, saved):
+        return cls(saved["kind"], saved["features"], saved["scale"], saved["offset"], saved.get("clip", False))
+
+    def to_dict(self):
+        return {"kind": self.kind, "features": self.features, "scale": self.scale.tolist(),
+                "offset": self.offset.tolist(), "clip": self.clip}
+
+    def transform(self, X):
+        if hasattr(X, "columns"):
+            X = X[self.features]
+        X = np.array(X, dtype=float)
+        if self.kind == "minmax":
+            # Same operations, in the same order, as MinMaxScaler.transform
+            X *= self.scale
+            X += self.offset
+            if self.clip:
+                np.clip(X, 0, 1, out=X)
+            return X
+        X -= self.offset
+        X /= self.scale
+        return X
+
+
+class RegisteredModel:
+    """One registered model version; its forest arrays are memory-mapped on first use."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, METADATA_NAME)) as f:
+            self.metadata = json.load(f)
+        self.name = self.metadata["name"]
+        self.version = self.metadata["version"]
+        self.features = self.metadata["features"]
+        self.metrics = self.metadata.get("metrics") or {}
+        self.scaler = AffineScaler.from_dict(self.metadata["scaler"])
+        self.load_seconds = None
+        self._forest = None
+        self._lock = threading.Lock()
+
+    def array_paths(self):
+        return [os.path.join(self.path, f"{name}.npy") for name in CompiledForest.ARRAYS]
+
+    @property
+    def loaded(self):
+        return self._forest is not None
+
+    def forest(self):
+        """The CompiledForest over the memory-mapped node arrays (mapped on the first call)."""
+        if self._forest is None:
+            with self._lock:
+                if self._forest is None:
+                    start = time.perf_counter()
+                    arrays = {name: np.load(path, mmap_mode="r")
+                              for name, path in zip(CompiledForest.ARRAYS, self.array_paths())}
+                    self._forest = CompiledForest.from_arrays(arrays, self.metadata["n_trees"],
+                                                              self.metadata["depth"])
+                    self.load_seconds = time.perf_counter() - start
+        return self._forest
+
+    def predict(self, X):
+        """Same predictions as the original model's predict on scaled inputs."""
+        return self.forest().predict(X)
+
+    def report(self):
+        paths = self.array_paths()
+        return {
+            "name": self.name,
+            "version": self.version,
+            "loaded": self.loaded,
+            "load_seconds": self.load_seconds,
+            "mapped_bytes": sum(os.path.getsize(path) for path in paths),
+            "resident_bytes": resident_bytes(paths) if self.loaded else 0,
+        }
+
+
+class ModelRegistry:
+    """Registered model versions under root; opened models are kept per (name, version)."""
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def model_dir(self, name, version):
+        return os.path.join(self.root, name, version)
+
+    def latest_path(self, name):
+        """The file naming the current version (watch it to detect a new deployment)."""
+        return os.path.join(self.root, name, LATEST_NAME)
+
+    def names(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.exists(self.latest_path(name)))
+
+    def latest(self, name):
+        try:
+            with open(self.latest_path(name)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def versions(self, name):
+        """Metadata of every version of name, oldest first."""
+        directory = os.path.join(self.root, name)
+        if not os.path.isdir(directory):
+            return []
+        found = []
+        for version in os.listdir(directory):
+            path = os.path.join(directory, version, METADATA_NAME)
+            if os.path.exists(path):
+                with open(path) as f:
+                    found.append(json.load(f))
+        return sorted(found, key=lambda metadata: metadata["registered_at"])
+
+    def register(self, name, model, scaler, features=FEATURES, metrics=None, target=TARGET, source=None):
+        """Stores a fitted forest regressor and its scaler as a new version of name and makes it the latest."""
+        from sklearn.ensemble import ExtraTreesRegressor, RandomForestRegressor
+
+        if not isinstance(model, (RandomForestRegressor, ExtraTreesRegressor)) or model.n_outputs_ != 1:
+            raise TypeError(f"❌ Only single-output random forests can be registered, not {type(model).__name__}")
+        forest = CompiledForest(model)
+        metadata = {
+            "name": name,
+            "model_class": type(model).__name__,
+            "features": list(features),
+            "target": target,
+            "n_trees": forest.n_trees,
+            "depth": forest.depth,
+            "scaler": AffineScaler.from_sklearn(scaler, features).to_dict(),
+            "metrics": metrics or {},
+            "source": source,
+        }
+
+        digest = hashlib.sha256(json.dumps(metadata, sort_keys=True).encode("utf-8"))
+        for array in forest.arrays().values():
+            digest.update(np.ascontiguousarray(array).tobytes())
+        version = digest.hexdigest()[:12]
+        metadata.update(version=version, registered_at=time.time())
+
+        path = self.model_dir(name, version)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.tmp"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            os.makedirs(tmp_path)
+            for array_name, array in forest.arrays().items():
+                np.save(os.path.join(tmp_path, f"{array_name}.npy"), array)
+            with open(os.path.join(tmp_path, METADATA_NAME), "w") as f:
+                json.dump(metadata, f, indent=2)
+            os.replace(tmp_path, path)
+
+        latest = self.latest_path(name)
+        with open(f"{latest}.tmp", "w") as f:
+            f.write(version + "\n")
+        os.replace(f"{latest}.tmp", latest)
+        return version
+
+    def import_pickle(self, name, model_path, scaler_path, features=FEATURES, metrics=None):
+        """Registers a joblib model/scaler pair such as models/random_forest_best_model.pkl."""
+        import joblib
+
+        return self.register(name, joblib.load(model_path), joblib.load(scaler_path), features, metrics,
+                             source=os.path.abspath(model_path))
+
+    def get(self, name, version=None):
+        """The registered model (latest version unless given); nothing is mapped until it predicts."""
+        version = version or self.latest(name)
+        if version is None or not os.path.exists(os.path.join(self.model_dir(name, version), METADATA_NAME)):
+            raise FileNotFoundError(f"❌ Model '{name}' version {version} is not registered in {self.root}")
+        with self._lock:
+            if (name, version) not in self._models:
+                self._models[(name, version)] = RegisteredModel(self.model_dir(name, version))
+            return self._models[(name, version)]
+
+    def report(self):
+        """Load time and mapped/resident size of every model opened in this process."""
+        return [model.report() for model in self._models.values()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Register and inspect memory-mapped model artifacts")
+    parser.add_argument("--root", default=REGISTRY_DIR, help="registry directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("import", help="register a joblib model and scaler")
+    add.add_argument("name")
+    add.add_argument("model", help="joblib pickle of the fitted forest")
+    add.add_argument("--scaler", required=True, help="joblib pickle of the fitted scaler")
+    add.add_argument("--metrics", help="JSON file of evaluation metrics (e.g. the train stage's metrics.json)")
+    add.add_argument("--features", nargs="+", default=FEATURES)
+    commands.add_parser("list", help="show every registered version")
+    commands.add_parser("report", help="open each latest model and show its load time and resident size")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.root)
+    if args.command == "import":
+        metrics = None
+        if args.metrics:
+            with open(args.metrics) as f:
+                metrics = json.load(f)
+        version = registry.import_pickle(args.name, args.model, args.scaler, args.features, metrics)
+        print(f"✅ Registered {args.name} version {version} in {args.root}")
+    elif args.command == "list":
+        for name in registry.names():
+            latest = registry.latest(name)
+            for metadata in registry.versions(name):
+                marker = "*" if metadata["version"] == latest else " "
+                print(f"{marker} {name:<24} {metadata['version']}  {metadata['model_class']} "
+                      f"{metadata['n_trees']} trees  metrics={metadata['metrics']}")
+    else:
+        for name in registry.names():
+            model = registry.get(name)
+            model.predict(np.zeros((1, len(model.features))))
+            entry = model.report()
+            resident = "n/a" if entry["resident_bytes"] is None else f"{entry['resident_bytes'] / 1024 ** 2:6.2f} MB"
+            print(f"{name:<24} {entry['version']}  load {entry['load_seconds'] * 1000:7.1f} ms  "
+                  f"mapped {entry['mapped_bytes'] / 1024 ** 2:6.2f} MB  resident {resident}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Writes forecasts as a small manifest plus one compact shard per org.
+
+predictions.json repeats every org name and a null Actual or Predicted
+on each of its ~27k rows, and the frontend downloads all of it to chart
+one trust. The sharded layout is:
+
+    predictions/manifest.json
+        {"version": 1, "mse": ..., "r2": ..., "dates": ["2018-01-01", ...],
+         "orgs": [{"name": ..., "shard": "orgs/<slug>.json", "first": i, "last": j, "forecast_from": k}, ...]}
+    predictions/orgs/<slug>.json
+        {"org": name, "d": [date indexes], "a": [actuals or null], "p": [predictions or null]}
+
+Dates are indexes into the manifest's date axis and every shard is
+columnar. Each file is written next to precompressed .gz (and .br when
+brotli is installed) copies, so a static host that serves precompressed
+files sends a trust's shard in a few hundred bytes.
+"""
+import gzip
+import json
+import os
+import re
+import shutil
+
+import pandas as pd
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always written
+    brotli = None
+
+SHARD_DIR_NAME = "predictions"
+MANIFEST_NAME = "manifest.json"
+FORMAT_VERSION = 1
+
+
+def shard_slug(name, taken):
+    """A file-name-safe id for an org, unique among taken."""
+    slug = re.sub(r"[^a-z0-9]+", "-", str(name).lower()).strip("-") or "org"
+    candidate, suffix = slug, 2
+    while candidate in taken:
+        candidate, suffix = f"{slug}-{suffix}", suffix + 1
+    taken.add(candidate)
+    return candidate
+
+
+def compact_json(data):
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def write_precompressed(path, payload):
+    """Writes payload plus its .gz (and .br) variants; gzip without a timestamp so reruns are byte-identical."""
+    with open(path, "wb") as f:
+        f.write(payload)
+    with open(f"{path}.gz", "wb") as f:
+        f.write(gzip.compress(payload, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(f"{path}.br", "wb") as f:
+            f.write(brotli.compress(payload, quality=11))
+
+
+def _integers(values):
+    return [None if pd.isna(value) else int(value) for value in values]
+
+
+def write_prediction_shards(records, mse, r2, path):
+    """Writes the manifest and per-org shards for predictions.json rows into path (usually .../predictions).
+
+    The directory is replaced as a whole, so no stale shards are left behind.
+    """
+    rows = pd.DataFrame.from_records(records, columns=["date", "org_name", "Actual", "Predicted"])
+    dates = sorted(rows["date"].unique())
+    rows["d"] = rows["date"].map({date: index for index, date in enumerate(dates)})
+
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(os.path.join(tmp_path, "orgs"))
+
+    orgs, taken = [], set()
+    for org, shard in rows.groupby("org_name", sort=True):
+        shard = shard.sort_values("d", kind="stable")
+        predicted = shard["Predicted"].notna().to_numpy()
+        name = f"orgs/{shard_slug(org, taken)}.json"
+        write_precompressed(os.path.join(tmp_path, name), compact_json({
+            "org": org,
+            "d": shard["d"].tolist(),
+            "a": _integers(shard["Actual"]),
+            "p": _integers(shard["Predicted"]),
+        }))
+        orgs.append({
+            "name": org,
+            "shard": name,
+            "first": int(shard["d"].iloc[0]),
+            "last": int(shard["d"].iloc[-1]),
+            "forecast_from": int(shard["d"].to_numpy()[predicted][0]) if predicted.any() else None,
+        })
+
+    write_precompressed(os.path.join(tmp_path, MANIFEST_NAME), compact_json({
+        "version": FORMAT_VERSION, "mse": mse, "r2": r2, "dates": dates, "orgs": orgs,
+    }))
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_prediction_shards(path):
+    """Reads a directory written by write_prediction_shards back into (predictions.json rows, mse, r2)."""
+    with open(os.path.join(path, MANIFEST_NAME), encoding="utf-8") as f:
+        manifest = json.load(f)
+    dates = manifest["dates"]
+    records = []
+    for org in manifest["orgs"]:
+        with open(os.path.join(path, org["shard"]), encoding="utf-8") as f:
+            shard = json.load(f)
+        records.extend({"date": dates[d], "org_name": org["name"], "Actual": actual, "Predicted": predicted}
+                       for d, actual, predicted in zip(shard["d"], shard["a"], shard["p"]))
+    return records, manifest.get("mse"), manifest.get("r2")
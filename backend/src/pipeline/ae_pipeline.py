@@ -0,0 +1,282 @@
+"""The A&E pipeline as a stage graph, from raw blobs to dashboard JSON.
+
+    ingest ──► synthetic ──► outliers ──► features ──► train ──► predict
+       └──────► statistics
+
+Every stage is cached by a content hash of its inputs, code and
+parameters (see runner.py), so changing one step only reruns the stages
+downstream of it, and statistics runs alongside the modelling chain.
+Outputs are published to where the app, notebooks and frontend read them.
+
+    python src/pipeline/ae_pipeline.py                 # bring everything up to date
+    python src/pipeline/ae_pipeline.py statistics      # only what statistics needs
+    python src/pipeline/ae_pipeline.py --force train   # rebuild train (and anything it changes)
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# Make the shared backend modules (src/...) importable when run as a script
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from src.data_analysis import ae_aggregates
+from src.data_preprocessing import add_synthetic_data, csv_decode, feature_store, gap_fill, load_nhs_data
+from src.data_preprocessing.ae_dataset import write_stage
+from src.modelling import forecast
+from src.modelling.model_registry import ModelRegistry
+from src.modelling.prediction_export import write_prediction_shards
+from src.pipeline.runner import Pipeline, Stage, path_digest
+
+PIPELINE_CACHE_DIR = os.getenv("PIPELINE_CACHE_DIR", os.path.join(BACKEND_DIR, "raw", "pipeline_cache"))
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+
+MODELS_DIR = os.path.join(BACKEND_DIR, "models")
+FRONTEND_DATA_DIR = os.path.abspath(os.path.join(BACKEND_DIR, "..", "final-year-project", "public", "data"))
+
+
+# ------------------------
+# Stages: each reads its input paths and writes every output path
+# ------------------------
+
+def ingest(inputs, outputs, years, merged_csv=None):
+    """Loads the monthly blobs (or an existing merged CSV) into one merged frame."""
+    if merged_csv:
+        nhs_all = pd.read_csv(merged_csv, low_memory=False)
+    else:
+        storage = load_nhs_data.get_storage()
+        nhs_all = load_nhs_data.merge_years(load_nhs_data.load_all_years(storage, years))
+    nhs_all.to_parquet(outputs["merged.parquet"], index=False)
+
+
+def ingest_fingerprint(params):
+    """What ingest reads from outside the pipeline: the merged CSV, or the blob listing."""
+    if params.get("merged_csv"):
+        return path_digest(params["merged_csv"])
+    storage = load_nhs_data.get_storage()
+    return sorted((blob.name, blob.etag, blob.size) for blob in storage.list() if ".csv" in blob.name)
+
+
+def synthetic_fill(inputs, outputs, seed):
+    """Fills the gaps inside each org's history with seeded synthetic rows (never before or after it)."""
+    nhs_all = add_synthetic_data.add_synthetic_data(pd.read_parquet(inputs["merged"]), seed=seed)
+    nhs_all.to_parquet(outputs["filled.parquet"], index=False)
+
+
+def flag_outliers(inputs, outputs, zscore_threshold):
+    """Dates the rows, flags z-score anomalies and replaces them with the median (notebook cells 6-30)."""
+    nhs_data = pd.read_parquet(inputs["filled"])
+    total = "total_a&e_attendances"
+
+    # Clean dates: ordered month names, recovered from 'period' when missing
+    month_order = ae_aggregates.MONTH_ORDER
+    nhs_data["year"] = nhs_data["year"].astype(str)
+    months = nhs_data["month"].astype(str).str.strip().str.capitalize()
+    if "period" in nhs_data:
+        from_period = nhs_data["period"].astype(str).str.extract(r"-(\w+)-")[0].str.capitalize()
+        months = months.where(months.isin(month_order), from_period)
+    nhs_data["month"] = pd.Categorical(months, categories=month_order, ordered=True)
+    nhs_data = nhs_data.dropna(subset=["month"])
+    nhs_data["date"] = pd.to_datetime(nhs_data["year"] + "-" + nhs_data["month"].astype(str),
+                                      format="%Y-%B", errors="coerce")
+    nhs_data = nhs_data.dropna(subset=["date"]).sort_values(by="date", kind="stable")
+
+    # Older releases have no usable total: sum the per-type attendance columns
+    nhs_data[total] = pd.to_numeric(nhs_data.get(total), errors="coerce")
+    if nhs_data[total].isna().all():
+        components = [c for c in ae_aggregates.ATTENDANCE_COMPONENT_COLUMNS if c in nhs_data]
+        nhs_data[total] = nhs_data[components].apply(pd.to_numeric, errors="coerce").sum(axis=1)
+
+    median = nhs_data[total].replace([np.inf, -np.inf], np.nan).median()
+    nhs_data[total] = nhs_data[total].replace([np.inf, -np.inf], np.nan).fillna(median)
+
+    values = nhs_data[total].to_numpy(dtype=float)
+    std = values.std()
+    nhs_data["attendance_zscore"] = np.abs(values - values.mean()) / std if std > 0 else 0.0
+    nhs_data["is_outlier"] = (nhs_data["attendance_zscore"] > zscore_threshold).astype(int)
+    nhs_data["is_anomaly"] = nhs_data["is_outlier"]
+    nhs_data.to_parquet(outputs["outliers_flagged.parquet"], index=False)
+
+    # Remove invalid rows, then replace anomalies with the median of normal rows
+    cleaned = nhs_data[nhs_data[total] > 0].copy()
+    normal_median = cleaned.loc[cleaned["is_anomaly"] == 0, total].median()
+    cleaned.loc[cleaned["is_anomaly"] == 1, total] = normal_median
+    cleaned.to_parquet(outputs["final_for_ml.parquet"], index=False)
+
+
+def build_features(inputs, outputs):
+    """Per-org calendar, lag and rolling features (feature_store), rows kept in date order."""
+    nhs_data = feature_store.build_features(pd.read_parquet(inputs["final_for_ml"]))
+    nhs_data.to_parquet(outputs["features.parquet"], index=False)
+
+
+def train_model(inputs, outputs, test_size, model_params):
+    """Fits the scaler and the tuned random forest on the lag features (notebook cells 36-40)."""
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.metrics import mean_squared_error, r2_score
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import MinMaxScaler
+
+    features = ["attendance_rolling_avg", "attendance_lag_1"]
+    # Each org's first month has no earlier report to build its features from
+    nhs_data = pd.read_parquet(inputs["features"]).dropna(subset=features)
+    X_train, X_test, y_train, y_test = train_test_split(
+        nhs_data[features], nhs_data["total_a&e_attendances"], test_size=test_size, shuffle=False)
+
+    scaler = MinMaxScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+
+    model = RandomForestRegressor(**model_params)
+    model.fit(X_train_scaled, y_train)
+    y_pred = model.predict(X_test_scaled)
+
+    joblib.dump(model, outputs["model.pkl"])
+    joblib.dump(scaler, outputs["scaler.pkl"])
+    with open(outputs["metrics.json"], "w") as f:
+        json.dump({"mse": round(float(mean_squared_error(y_test, y_pred)), 2),
+                   "r2": round(float(r2_score(y_test, y_pred)), 2)}, f, indent=2)
+
+
+def predict(inputs, outputs, horizon_end, noise, seed):
+    """Per-org history plus recursive monthly forecasts to horizon_end, batched across orgs (forecast.py)."""
+    historical_df = pd.read_parquet(inputs["history"],
+                                    columns=["date", "org_name", "total_a&e_attendances", gap_fill.SYNTHETIC_FLAG])
+    model = joblib.load(inputs["model"])
+    scaler = joblib.load(inputs["scaler"])
+    with open(inputs["metrics"]) as f:
+        metrics = json.load(f)
+
+    forecasts = forecast.forecast(historical_df, model, scaler, horizon_end, noise=noise, seed=seed)
+    # Gap-filled months feed the forecast state but are never exported as "Actual"
+    actuals = historical_df[~historical_df[gap_fill.SYNTHETIC_FLAG].astype(bool)]
+    all_predictions = forecast.prediction_records(actuals, forecasts)
+    write_prediction_shards(all_predictions, metrics["mse"], metrics["r2"], outputs["predictions"])
+
+
+def statistics(inputs, outputs):
+    """Every dashboard chart JSON, from one org x month reduction of the merged data."""
+    table = ae_aggregates.OrgMonthTable.from_frame(pd.read_parquet(inputs["merged"]))
+    os.makedirs(outputs["charts"], exist_ok=True)
+    for chart, filename in ae_aggregates.CHART_FILES.items():
+        with open(os.path.join(outputs["charts"], filename), "w") as f:
+            json.dump(table.chart(chart), f, indent=2)
+
+
+# ------------------------
+# The graph
+# ------------------------
+
+def build_stages(merged_csv=None):
+    return [
+        Stage("ingest", ingest, outputs=["merged.parquet"],
+              params={"years": load_nhs_data.YEARS_TO_LOAD, "merged_csv": merged_csv},
+              code=[load_nhs_data, csv_decode], external=ingest_fingerprint),
+        Stage("synthetic", synthetic_fill, inputs={"merged": "ingest.merged.parquet"},
+              outputs=["filled.parquet"],
+              params={"seed": gap_fill.DEFAULT_SEED},
+              code=[add_synthetic_data, gap_fill]),
+        Stage("outliers", flag_outliers, inputs={"filled": "synthetic.filled.parquet"},
+              outputs=["outliers_flagged.parquet", "final_for_ml.parquet"], params={"zscore_threshold": 3.0}),
+        Stage("features", build_features, inputs={"final_for_ml": "outliers.final_for_ml.parquet"},
+              outputs=["features.parquet"], code=[feature_store]),
+        Stage("train", train_model, inputs={"features": "features.features.parquet"},
+              outputs=["model.pkl", "scaler.pkl", "metrics.json"],
+              params={"test_size": 0.2,
+                      "model_params": {"max_depth": 5, "min_samples_leaf": 1, "min_samples_split": 10,
+                                       "n_estimators": 500, "random_state": 42}}),
+        Stage("predict", predict,
+              inputs={"history": "outliers.final_for_ml.parquet", "model": "train.model.pkl",
+                      "scaler": "train.scaler.pkl", "metrics": "train.metrics.json"},
+              outputs=["predictions"],
+              params={"horizon_end": "2026-12-01", "noise": 0.05, "seed": 42},
+              code=[forecast]),
+        Stage("statistics", statistics, inputs={"merged": "ingest.merged.parquet"},
+              outputs=["charts"], code=[ae_aggregates]),
+    ]
+
+
+def _publish_dataset(stage):
+    return lambda path: write_stage(pd.read_parquet(path), stage)
+
+
+def _publish_features(path):
+    feature_store.write_features(pd.read_parquet(path))
+
+
+def _publish_copy(*destinations):
+    def publish(path):
+        for destination in destinations:
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.copyfile(path, destination)
+    return publish
+
+
+def _publish_model(path):
+    """Copies the trained model for the notebook and registers it (with its scaler and metrics) for the API."""
+    _publish_copy(os.path.join(MODELS_DIR, "random_forest_best_model.pkl"))(path)
+    output_dir = os.path.dirname(path)
+    with open(os.path.join(output_dir, "metrics.json")) as f:
+        metrics = json.load(f)
+    ModelRegistry().import_pickle("random_forest_best", path, os.path.join(output_dir, "scaler.pkl"), metrics=metrics)
+
+
+def _publish_tree(*destinations):
+    def publish(path):
+        for destination in destinations:
+            shutil.rmtree(destination, ignore_errors=True)
+            shutil.copytree(path, destination)
+    return publish
+
+
+def _publish_charts(path):
+    os.makedirs(FRONTEND_DATA_DIR, exist_ok=True)
+    for filename in os.listdir(path):
+        shutil.copyfile(os.path.join(path, filename), os.path.join(FRONTEND_DATA_DIR, filename))
+
+
+PUBLISH = {
+    "ingest.merged.parquet": _publish_dataset("merged"),
+    "outliers.outliers_flagged.parquet": _publish_dataset("outliers_flagged"),
+    "outliers.final_for_ml.parquet": _publish_dataset("final_for_ml"),
+    "features.features.parquet": _publish_features,
+    "train.model.pkl": _publish_model,
+    "train.scaler.pkl": _publish_copy(os.path.join(MODELS_DIR, "scaler.pkl")),
+    "predict.predictions": _publish_tree(os.path.join(FRONTEND_DATA_DIR, "predictions"),
+                                         os.path.join(MODELS_DIR, "public", "data", "predictions")),
+    "statistics.charts": _publish_charts,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the A&E pipeline, rebuilding only stale stages")
+    parser.add_argument("targets", nargs="*", help="stages to bring up to date (default: all)")
+    parser.add_argument("--force", action="append", default=[], metavar="STAGE", help="rebuild this stage even if cached")
+    parser.add_argument("--workers", type=int, default=PIPELINE_WORKERS, help="stages run in parallel")
+    parser.add_argument("--merged-csv", help="start from an existing merged CSV instead of blob storage")
+    parser.add_argument("--cache-dir", default=PIPELINE_CACHE_DIR)
+    parser.add_argument("--no-publish", action="store_true", help="leave the app, models and frontend files alone")
+    args = parser.parse_args()
+
+    pipeline = Pipeline(build_stages(args.merged_csv), args.cache_dir, publish=None if args.no_publish else PUBLISH)
+    report = pipeline.run(args.targets or None, force=set(args.force), workers=args.workers)
+
+    print("\n📊 Pipeline report:")
+    for name in pipeline.order():
+        if name in report:
+            entry = report[name]
+            print(f"   {name:<11} {entry['status']:<8} {entry['seconds']:6.1f}s")
+    print(f"✅ Finished in {report['_total_seconds']:.1f}s")
+    if any(entry.get("status") == "failed" for name, entry in report.items() if name != "_total_seconds"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
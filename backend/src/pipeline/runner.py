@@ -0,0 +1,264 @@
+"""Small content-hashed stage runner.
+
+A pipeline is a list of Stage objects. Each stage names the upstream
+outputs it reads, the files it writes and its parameters. Before a stage
+runs, the runner hashes
+
+- the content of every input artifact,
+- the stage's source code (plus any helper modules it lists),
+- its parameters, and
+- an optional fingerprint of outside inputs (e.g. a blob listing),
+
+and reuses ``<cache_dir>/<stage>/<key>/`` when that key has been built
+before. Stages whose inputs are ready run in parallel in worker
+processes. Because downstream keys hash the *content* of upstream
+outputs, a stage that reruns but produces identical files does not
+invalidate anything after it.
+"""
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from src.utils.profiling import profile_stage
+
+DONE_MARKER = "_done.json"
+PUBLISHED_NAME = "published.json"
+
+# Older cached versions kept per stage (so flipping a parameter back is still a cache hit)
+KEEP_VERSIONS = 3
+
+
+@dataclass
+class Stage:
+    """One step of the pipeline.
+
+    func(inputs, outputs, **params) reads the paths in inputs and must write
+    every path in outputs. inputs maps a local name to "stage.output".
+    """
+    name: str
+    func: object
+    inputs: dict = field(default_factory=dict)
+    outputs: list = field(default_factory=list)
+    params: dict = field(default_factory=dict)
+    code: list = field(default_factory=list)  # extra modules whose source is part of the key
+    external: object = None  # callable(params) -> JSON-able fingerprint of outside inputs
+
+    @property
+    def upstream(self):
+        return {reference.split(".", 1)[0] for reference in self.inputs.values()}
+
+
+def path_digest(path):
+    """sha256 of a file, or of every file (name and bytes) under a directory."""
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode())
+                digest.update(path_digest(file_path).encode())
+        return digest.hexdigest()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def code_digest(stage):
+    """Hash of the stage function's source and of the helper modules it depends on."""
+    digest = hashlib.sha256(inspect.getsource(stage.func).encode())
+    for module in stage.code:
+        digest.update(inspect.getsource(module).encode())
+    return digest.hexdigest()
+
+
+def _run_stage(func, inputs, outputs, params, workdir):
+    """Runs one stage in a worker into a scratch directory; returns (seconds, output digests)."""
+    start = time.perf_counter()
+    scratch = {name: os.path.join(workdir, name) for name in outputs}
+    with profile_stage(func.__name__):
+        func(inputs, scratch, **params)
+    missing = [name for name, path in scratch.items() if not os.path.exists(path)]
+    if missing:
+        raise RuntimeError(f"stage did not write {', '.join(missing)}")
+    return time.perf_counter() - start, {name: path_digest(path) for name, path in scratch.items()}
+
+
+class Pipeline:
+    """Runs a stage graph, skipping every stage whose cache key is already built."""
+
+    def __init__(self, stages, cache_dir, publish=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.cache_dir = cache_dir
+        self.publish = publish or {}  # "stage.output" -> callable(path)
+        self._check_graph()
+
+    def _check_graph(self):
+        for stage in self.stages.values():
+            for reference in stage.inputs.values():
+                upstream, _, output = reference.partition(".")
+                if upstream not in self.stages or output not in self.stages[upstream].outputs:
+                    raise ValueError(f"❌ Stage '{stage.name}' reads unknown output '{reference}'")
+        self.order()  # raises on cycles
+
+    def order(self):
+        """Stage names in dependency order."""
+        ordered, visiting = [], set()
+
+        def visit(name):
+            if name in ordered:
+                return
+            if name in visiting:
+                raise ValueError(f"❌ Cycle in pipeline at stage '{name}'")
+            visiting.add(name)
+            for upstream in sorted(self.stages[name].upstream):
+                visit(upstream)
+            visiting.discard(name)
+            ordered.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return ordered
+
+    def stage_dir(self, name, key):
+        return os.path.join(self.cache_dir, name, key)
+
+    def output_path(self, name, key, output):
+        return os.path.join(self.stage_dir(name, key), output)
+
+    def stage_key(self, stage, input_digests):
+        payload = {
+            "stage": stage.name,
+            "code": code_digest(stage),
+            "params": stage.params,
+            "inputs": input_digests,
+            "external": stage.external(stage.params) if stage.external else None,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+    def _cached(self, name, key):
+        marker = os.path.join(self.stage_dir(name, key), DONE_MARKER)
+        if not os.path.exists(marker):
+            return None
+        with open(marker) as f:
+            return json.load(f)
+
+    def _prune(self, name, keep_key):
+        stage_root = os.path.join(self.cache_dir, name)
+        versions = sorted((os.path.join(stage_root, entry) for entry in os.listdir(stage_root)
+                           if entry != keep_key and not entry.endswith(".tmp")),
+                          key=os.path.getmtime, reverse=True)
+        for path in versions[KEEP_VERSIONS - 1:]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def run(self, targets=None, force=(), workers=None):
+        """Brings the targets (default: every stage) up to date.
+
+        force names stages to rebuild even if cached. Returns a report
+        {stage: {"status": "cached"|"ran"|"failed"|"skipped", "seconds", "key"}}.
+        """
+        needed = set()
+
+        def require(name):
+            if name not in needed:
+                needed.add(name)
+                for upstream in self.stages[name].upstream:
+                    require(upstream)
+
+        for name in targets or self.stages:
+            require(name)
+
+        report, keys, digests = {}, {}, {}
+        pending = [name for name in self.order() if name in needed]
+        running = {}
+        start = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=max(1, workers or os.cpu_count() or 1)) as pool:
+            while pending or running:
+                for name in list(pending):
+                    stage = self.stages[name]
+                    if any(upstream in running or upstream in pending for upstream in stage.upstream):
+                        continue
+                    pending.remove(name)
+                    if any(report[upstream]["status"] in ("failed", "skipped") for upstream in stage.upstream):
+                        report[name] = {"status": "skipped", "seconds": 0.0, "key": None}
+                        print(f"⏭️ {name}: skipped (upstream failed)")
+                        continue
+
+                    input_digests = {}
+                    inputs = {}
+                    for local, reference in stage.inputs.items():
+                        upstream, _, output = reference.partition(".")
+                        inputs[local] = self.output_path(upstream, keys[upstream], output)
+                        input_digests[local] = digests[upstream][output]
+                    key = keys[name] = self.stage_key(stage, input_digests)
+
+                    done = self._cached(name, key)
+                    if done is not None and name not in force:
+                        digests[name] = done["outputs"]
+                        report[name] = {"status": "cached", "seconds": 0.0, "key": key}
+                        print(f"♻️ {name}: up to date ({key})")
+                        continue
+
+                    workdir = self.stage_dir(name, key) + ".tmp"
+                    shutil.rmtree(workdir, ignore_errors=True)
+                    os.makedirs(workdir)
+                    print(f"🚀 {name}: running ({key})")
+                    future = pool.submit(_run_stage, stage.func, inputs, stage.outputs, stage.params, workdir)
+                    running[name] = future
+
+                if not running:
+                    continue
+                finished, _ = wait(running.values(), return_when=FIRST_COMPLETED)
+                for name in [name for name, future in running.items() if future in finished]:
+                    future = running.pop(name)
+                    key = keys[name]
+                    workdir = self.stage_dir(name, key) + ".tmp"
+                    try:
+                        seconds, output_digests = future.result()
+                    except Exception as e:
+                        shutil.rmtree(workdir, ignore_errors=True)
+                        report[name] = {"status": "failed", "seconds": 0.0, "key": key, "error": str(e)}
+                        print(f"❌ {name}: failed: {e}")
+                        continue
+                    with open(os.path.join(workdir, DONE_MARKER), "w") as f:
+                        json.dump({"outputs": output_digests, "seconds": seconds}, f, indent=2)
+                    shutil.rmtree(self.stage_dir(name, key), ignore_errors=True)
+                    os.replace(workdir, self.stage_dir(name, key))
+                    self._prune(name, key)
+                    digests[name] = output_digests
+                    report[name] = {"status": "ran", "seconds": seconds, "key": key}
+                    print(f"✅ {name}: done in {seconds:.1f}s")
+
+        self._publish(keys, digests)
+        report["_total_seconds"] = time.perf_counter() - start
+        return report
+
+    def _publish(self, keys, digests):
+        """Hands changed outputs to their publish callbacks (e.g. copy into the frontend)."""
+        published_path = os.path.join(self.cache_dir, PUBLISHED_NAME)
+        published = {}
+        if os.path.exists(published_path):
+            with open(published_path) as f:
+                published = json.load(f)
+
+        for reference, publish in self.publish.items():
+            name, _, output = reference.partition(".")
+            if name not in digests:
+                continue
+            digest = digests[name][output]
+            if published.get(reference) == digest:
+                continue
+            publish(self.output_path(name, keys[name], output))
+            published[reference] = digest
+            print(f"📁 Published {reference}")
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(published_path, "w") as f:
+            json.dump(published, f, indent=2, sort_keys=True)
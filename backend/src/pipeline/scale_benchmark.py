@@ -0,0 +1,377 @@
+"""Benchmarks the whole A&E data path on synthetic data at 1x, 10x, 100x, 1000x the real size.
+
+For each scale, synthetic monthly releases (synthetic_ae) are written to a
+local blob store and pushed through the real code, one step at a time:
+
+    generate     write the Monthly_AE_<Month>_<Year>.csv files
+    ingest       load_nhs_data: list, read, decode, parse and merge every file (empty cache)
+    statistics   get_statistics: read the merged CSV, reduce to org x month, build every chart
+    clean        the pipeline's dating and outlier stage (flag_outliers)
+    features     feature_store.build_features
+    forecast     forecast.forecast for every org with the deployed forest and scaler
+    api          app.py on a local HTTP server: startup, then a request mix sent once
+                 (cold caches, one client) and again (warm caches, concurrent clients)
+
+Each step records seconds, rows, rows/s and how far it pushed peak RSS.
+Every scale runs in a fresh process, so memory does not carry over. The
+report (git commit, machine, one entry per scale) is written as JSON to
+raw/benchmarks/, and --compare prints the change against an earlier report:
+
+    python src/pipeline/scale_benchmark.py                          # 1x and 10x
+    python src/pipeline/scale_benchmark.py --scales 1 10 100 --skip api
+    python src/pipeline/scale_benchmark.py --compare raw/benchmarks/<earlier>.json
+
+100x is about 1.2M rows and 1000x about 12M (around 2 GB of CSV);
+give those plenty of RAM and disk, or skip the api step.
+"""
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# Make the shared backend modules (src/...) importable when run as a script
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from src.data_analysis import get_statistics
+from src.data_preprocessing import feature_store, load_nhs_data
+from src.data_preprocessing.synthetic_ae import DEFAULT_SEED, write_synthetic_months
+from src.modelling import forecast
+from src.modelling.prediction_export import SHARD_DIR_NAME, write_prediction_shards
+from src.pipeline import ae_pipeline
+from src.utils.profiling import peak_rss_bytes, profile_stage
+from src.utils.storage import LocalStorage
+
+BENCHMARK_DIR = os.getenv("BENCHMARK_DIR", os.path.join(BACKEND_DIR, "raw", "benchmarks"))
+DEFAULT_SCALES = [1, 10]
+OPTIONAL_STEPS = ["statistics", "features", "forecast", "api"]
+
+FORECAST_MONTHS = 12
+API_REQUESTS = int(os.getenv("BENCHMARK_API_REQUESTS", "300"))
+API_CONCURRENCY = int(os.getenv("BENCHMARK_API_CONCURRENCY", "8"))
+API_TIMEOUT = 120
+
+# One request of each kind in turn; {org} and {year} are drawn at random from the data
+API_MIX = [
+    "/api/ae_data?org_name={org}&limit=500",
+    "/api/stats/monthly_attendance?org_name={org}",
+    "/api/stats/regional_comparison?from={year}&to={year}",
+    "/api/anomalies?org_name={org}&all=1",
+    "/api/predict?org_name={org}&horizon=12",
+    "/api/hospitals/lookup?org={org}&year={year}",
+]
+
+
+def measure(results, step, func, rows=None):
+    """Runs func() as a profiled stage and records its seconds, rows/s and peak RSS growth under results[step]."""
+    peak_before = peak_rss_bytes()
+    with profile_stage(f"benchmark_{step}") as stage:
+        value = func()
+    count = rows(value) if callable(rows) else rows
+    peak_after = peak_rss_bytes()
+    results[step] = {
+        "seconds": round(stage.seconds, 4),
+        "rows": count,
+        "rows_per_second": round(count / stage.seconds, 1) if count and stage.seconds else None,
+        "peak_rss_growth_mb": None if peak_before is None else round((peak_after - peak_before) / 1e6, 1),
+    }
+    return value
+
+
+# ------------------------
+# One scale (runs in its own process)
+# ------------------------
+
+def run_scale(scale, workdir, skip=(), seed=DEFAULT_SEED, api_requests=API_REQUESTS,
+              api_concurrency=API_CONCURRENCY):
+    """Generates one scale's data in workdir and times every step on it; returns that scale's results."""
+    results = {"scale": scale}
+    blob_dir = os.path.join(workdir, "blobs")
+    generated = measure(results, "generate", lambda: write_synthetic_months(blob_dir, scale, seed),
+                        rows=lambda info: info["rows"])
+    results.update(files=generated["files"], mb=round(generated["bytes"] / 1e6, 1), orgs=generated["orgs"],
+                   years=len(generated["years"]))
+    print(f"📦 {generated['rows']:,} rows in {generated['files']} files ({results['mb']} MB), "
+          f"{generated['orgs']} orgs over {len(generated['years'])} years")
+
+    storage = LocalStorage(blob_dir)
+    merged = measure(results, "ingest", lambda: load_nhs_data.merge_years(load_nhs_data.load_all_years(
+        storage, generated["years"], cache_dir=os.path.join(workdir, "ingest_cache"))), rows=len)
+    results["rows"] = len(merged)
+    merged_csv = os.path.join(workdir, "api", "nhs_ae_merged.csv")
+    os.makedirs(os.path.dirname(merged_csv), exist_ok=True)
+    merged.to_csv(merged_csv, index=False)
+
+    if "statistics" not in skip:
+        def statistics():
+            df = get_statistics.load_statistics_frame(merged_csv, stage=None)
+            get_statistics.build_charts(df, {})
+            return df
+        measure(results, "statistics", statistics, rows=len)
+
+    stage_dir = os.path.join(workdir, "stages")
+    os.makedirs(stage_dir, exist_ok=True)
+    paths = {name: os.path.join(stage_dir, f"{name}.parquet")
+             for name in ("filled", "outliers_flagged", "final_for_ml")}
+    merged.to_parquet(paths["filled"], index=False)
+    measure(results, "clean", lambda: ae_pipeline.flag_outliers(
+        {"filled": paths["filled"]},
+        {"outliers_flagged.parquet": paths["outliers_flagged"], "final_for_ml.parquet": paths["final_for_ml"]},
+        zscore_threshold=3.0), rows=len(merged))
+    del merged
+    final = pd.read_parquet(paths["final_for_ml"])
+
+    if "features" not in skip:
+        measure(results, "features", lambda: feature_store.build_features(final), rows=len)
+
+    # The API serves forecasts and the hospital index from the forecast output, so it needs this step too
+    if "forecast" not in skip or "api" not in skip:
+        history = final[["date", "org_name", forecast.TARGET]]
+        model = joblib.load(os.path.join(ae_pipeline.MODELS_DIR, "random_forest_best_model.pkl"))
+        scaler = joblib.load(os.path.join(ae_pipeline.MODELS_DIR, "scaler.pkl"))
+        horizon_end = pd.Timestamp(history["date"].max()) + pd.DateOffset(months=FORECAST_MONTHS)
+        forecasts = measure(results, "forecast", lambda: forecast.forecast(history, model, scaler, horizon_end),
+                            rows=len)
+        results["forecast"]["orgs"] = int(forecasts["org_name"].nunique())
+
+    if "api" not in skip:
+        api_dir = os.path.dirname(merged_csv)
+        history.to_csv(os.path.join(api_dir, "history.csv"), index=False)
+        write_prediction_shards(forecast.prediction_records(history, forecasts), 0, 0,
+                                os.path.join(api_dir, SHARD_DIR_NAME))
+        results["api"] = run_api(api_dir, workdir, seed, api_requests, api_concurrency)
+    return results
+
+
+def run_api(api_dir, workdir, seed, requests, concurrency):
+    """Starts a fresh interpreter serving app.py from api_dir's files and returns its measurements."""
+    output = os.path.join(workdir, "api_results.json")
+    env = dict(os.environ,
+               AE_DATASET_ROOT=os.path.join(workdir, "datasets"),     # no Parquet stages: read the CSVs here
+               MODEL_REGISTRY_DIR=os.path.join(workdir, "registry"),  # the deployed pickles, not a local registry
+               FORECAST_HISTORY_CSV=os.path.join(api_dir, "history.csv"),
+               PREDICTIONS_DIR=os.path.join(api_dir, SHARD_DIR_NAME))
+    subprocess.run([sys.executable, os.path.abspath(__file__), "--api-worker", output,
+                    "--seed", str(seed), "--api-requests", str(requests), "--api-concurrency", str(concurrency)],
+                   cwd=api_dir, env=env, check=True)
+    with open(output) as f:
+        return json.load(f)
+
+
+# ------------------------
+# API worker (runs in the directory holding nhs_ae_merged.csv)
+# ------------------------
+
+def request_mix(org_names, years, count, seed):
+    rng = np.random.default_rng(seed)
+    # The API splits org_name on commas, so names containing one cannot be asked for
+    orgs = rng.choice(np.asarray([name for name in org_names if "," not in name], dtype=object), count)
+    picked_years = rng.choice(np.asarray(years), count)
+    return [API_MIX[i % len(API_MIX)].format(org=urllib.parse.quote(str(org)), year=year)
+            for i, (org, year) in enumerate(zip(orgs, picked_years))]
+
+
+def fetch(url):
+    """(endpoint, status, seconds) for one GET; error statuses are results, not failures."""
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=API_TIMEOUT) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    return urllib.parse.urlsplit(url).path, status, time.perf_counter() - start
+
+
+def latency_summary(latencies):
+    ms = np.asarray(latencies) * 1000
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 2), "p95_ms": round(float(np.percentile(ms, 95)), 2),
+            "p99_ms": round(float(np.percentile(ms, 99)), 2), "max_ms": round(float(ms.max()), 2)}
+
+
+def run_requests(base_url, paths, concurrency):
+    """Sends every path with concurrency clients; latency percentiles, throughput and status counts."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        responses = list(pool.map(fetch, [base_url + path for path in paths]))
+    seconds = time.perf_counter() - start
+
+    by_endpoint, statuses = {}, {}
+    for endpoint, status, latency in responses:
+        by_endpoint.setdefault(endpoint.rsplit("/", 1)[0] if endpoint.startswith("/api/stats/") else endpoint,
+                               []).append(latency)
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "requests": len(responses),
+        "concurrency": concurrency,
+        "seconds": round(seconds, 4),
+        "requests_per_second": round(len(responses) / seconds, 1),
+        **latency_summary([latency for _, _, latency in responses]),
+        "statuses": statuses,
+        "endpoints": {endpoint: latency_summary(values) for endpoint, values in sorted(by_endpoint.items())},
+    }
+
+
+def api_worker(output, seed, requests, concurrency):
+    """Times app.py's startup, then sends the request mix cold (one client) and warm (concurrent clients)."""
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no access log line per request
+    sys.path.insert(0, os.path.join(BACKEND_DIR, "api"))
+    start = time.perf_counter()
+    import app as ae_app
+    startup = time.perf_counter() - start
+    if ae_app.dataset is None:
+        raise RuntimeError("❌ The API could not load the benchmark dataset")
+
+    server = make_server("127.0.0.1", 0, ae_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    years = sorted(ae_app.dataset.data["year"].dropna().astype(int).unique().tolist())
+    # Orgs with a forecast (the cleaning step drops orgs that never reported any attendances)
+    forecastable = set(map(str, ae_app.forecast_service.current.orgs)) if ae_app.forecast_service.current else None
+    orgs = [name for name in ae_app.dataset.detector.names if forecastable is None or name in forecastable]
+    paths = request_mix(orgs, years, requests, seed)
+    try:
+        results = {"startup_seconds": round(startup, 4),
+                   "cold": run_requests(base_url, paths, 1),
+                   "warm": run_requests(base_url, paths, concurrency)}
+    finally:
+        server.shutdown()
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+# ------------------------
+# Reports
+# ------------------------
+
+def git_commit():
+    """(short commit, whether the tree has uncommitted changes), or (None, None) outside a git checkout."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BACKEND_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(dirty)
+
+
+def step_rows(result):
+    """(step, seconds, rows/s, peak RSS growth) for each timed step of one scale."""
+    rows = [(step, result[step]["seconds"], result[step]["rows_per_second"], result[step]["peak_rss_growth_mb"])
+            for step in ["generate", "ingest", "statistics", "clean", "features", "forecast"] if step in result]
+    if "api" in result:
+        rows.append(("api_startup", result["api"]["startup_seconds"], None, None))
+    return rows
+
+
+def print_scale(result):
+    print(f"\n⏱️ Scale {result['scale']:g}x ({result['rows']:,} rows):")
+    for step, seconds, rate, peak in step_rows(result):
+        rate = f"{rate:>12,.0f} rows/s" if rate else " " * 19
+        peak = f"peak +{peak:,.0f} MB" if peak is not None else ""
+        print(f"   {step:<12} {seconds:9.3f}s {rate}  {peak}")
+    for phase in ("cold", "warm"):
+        if "api" in result:
+            api = result["api"][phase]
+            print(f"   api {phase:<8} {api['requests_per_second']:9.1f} req/s  p50 {api['p50_ms']:.1f} ms  "
+                  f"p95 {api['p95_ms']:.1f} ms  ({api['concurrency']} clients, {api['statuses']})")
+
+
+def print_comparison(previous, report):
+    """The change in each step's seconds (and API p95/throughput) for the scales both reports ran."""
+    print(f"\n📊 Against {previous.get('commit')} ({previous.get('created')}):")
+    for scale, result in report["scales"].items():
+        before = previous["scales"].get(scale)
+        if not before:
+            continue
+        print(f"   {scale}x")
+        old = {step: seconds for step, seconds, _, _ in step_rows(before)}
+        for step, seconds, _, _ in step_rows(result):
+            if old.get(step):
+                print(f"      {step:<12} {old[step]:9.3f}s -> {seconds:9.3f}s  ({seconds / old[step]:.2f}x)")
+        if "api" in result and "api" in before:
+            for phase in ("cold", "warm"):
+                new_api, old_api = result["api"][phase], before["api"][phase]
+                print(f"      api {phase:<8} p95 {old_api['p95_ms']:.1f} -> {new_api['p95_ms']:.1f} ms, "
+                      f"{old_api['requests_per_second']:.1f} -> {new_api['requests_per_second']:.1f} req/s")
+
+
+def save_report(report, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest, statistics, features, forecasting and the "
+                                                 "API on synthetic A&E data at several scales")
+    parser.add_argument("--scales", type=float, nargs="+", default=DEFAULT_SCALES,
+                        help="multiples of the real data's size (default: 1 10)")
+    parser.add_argument("--skip", nargs="+", choices=OPTIONAL_STEPS, default=[], help="steps to leave out")
+    parser.add_argument("--output", help="report path (default: raw/benchmarks/<time>_<commit>.json)")
+    parser.add_argument("--workdir", help="keep each scale's generated data and stages here instead of a temp dir")
+    parser.add_argument("--compare", metavar="REPORT", help="print the change against an earlier report")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--api-requests", type=int, default=API_REQUESTS)
+    parser.add_argument("--api-concurrency", type=int, default=API_CONCURRENCY)
+    parser.add_argument("--api-worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.api_worker:
+        api_worker(args.api_worker, args.seed, args.api_requests, args.api_concurrency)
+        return
+
+    commit, dirty = git_commit()
+    created = datetime.now()
+    report = {"commit": commit, "dirty": dirty, "created": created.isoformat(timespec="seconds"),
+              "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+              "api_requests": args.api_requests, "api_concurrency": args.api_concurrency, "seed": args.seed,
+              "scales": {}}
+    output = args.output or os.path.join(BENCHMARK_DIR, f"{created:%Y%m%d_%H%M%S}_{commit or 'nogit'}.json")
+
+    for scale in args.scales:
+        print(f"\n🚀 Benchmarking {scale:g}x the real data...")
+        workdir = (os.path.join(args.workdir, f"scale_{scale:g}") if args.workdir
+                   else tempfile.mkdtemp(prefix=f"scale_benchmark_{scale:g}x_"))
+        try:
+            # A fresh interpreter per scale, so one scale's memory does not count against the next
+            with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as pool:
+                result = pool.submit(run_scale, scale, workdir, args.skip, args.seed,
+                                     args.api_requests, args.api_concurrency).result()
+        finally:
+            if not args.workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+        report["scales"][f"{scale:g}"] = result
+        print_scale(result)
+        save_report(report, output)  # after every scale, so a run that dies at 1000x keeps the rest
+
+    print(f"\n📁 Benchmark report saved as {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
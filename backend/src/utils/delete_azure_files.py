@@ -1,28 +1,20 @@
-from azure.storage.blob import BlobServiceClient
-from dotenv import load_dotenv
 import os
+import sys
 
-# Load environment variables
-load_dotenv()
+# Make the shared backend modules (src/...) importable when run as a script
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
 
-# Azure Storage details
-AZURE_STORAGE_ACCOUNT_NAME = os.getenv("AZURE_STORAGE_ACCOUNT_NAME")
-AZURE_STORAGE_ACCOUNT_KEY = os.getenv("AZURE_STORAGE_ACCOUNT_KEY")
-AZURE_CONTAINER_NAME = os.getenv("AZURE_CONTAINER_NAME")
+from src.utils.storage import get_storage
 
-# Initialize BlobServiceClient
-blob_service_client = BlobServiceClient(
-    f"https://{AZURE_STORAGE_ACCOUNT_NAME}.blob.core.windows.net",
-    credential=AZURE_STORAGE_ACCOUNT_KEY
-)
+# Storage backend from .env (STORAGE_BACKEND=azure|local)
+storage = get_storage()
 
-# Get container client
-container_client = blob_service_client.get_container_client(AZURE_CONTAINER_NAME)
+# List all blobs and delete them in batches
+blob_names = [blob.name for blob in storage.list()]
+for blob_name in blob_names:
+    print(f"🗑️ Deleting: {blob_name}")
+deleted = storage.delete_many(blob_names)
 
-# List all blobs and delete them
-blobs = container_client.list_blobs()
-for blob in blobs:
-    container_client.delete_blob(blob.name)
-    print(f"🗑️ Deleted: {blob.name}")
-
-print("✅ All blobs deleted successfully!")
+print(f"✅ All blobs deleted successfully! ({deleted} removed)")
@@ -1,37 +1,26 @@
 import chardet
-import io
 import os
-from azure.storage.blob import BlobServiceClient
-from dotenv import load_dotenv
+import sys
 
-# Load environment variables
-load_dotenv()
+# Make the shared backend modules (src/...) importable when run as a script
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
 
-# Azure Storage Account details
-AZURE_CONNECTION_STRING = os.getenv("AZURE_CONNECTION_STRING")
-AZURE_CONTAINER_NAME = os.getenv("AZURE_CONTAINER_NAME")
+from src.utils.storage import get_storage
 
-# Ensure Azure Connection
-if not AZURE_CONNECTION_STRING:
-    raise RuntimeError("❌ Azure Connection String is missing. Check your .env file.")
+# Storage backend from .env (STORAGE_BACKEND=azure|local)
+storage = get_storage()
 
-try:
-    blob_service_client = BlobServiceClient.from_connection_string(AZURE_CONNECTION_STRING)
-    container_client = blob_service_client.get_container_client(AZURE_CONTAINER_NAME)
-    print("✅ Connected to Azure Blob Storage")
-except Exception as e:
-    raise RuntimeError(f"❌ Failed to connect to Azure: {e}")
-
-# Specify the file in Azure
+# Specify the file in storage
 blob_name = "Monthly_AE_July_2021.csv"
 
-# Fetch the file from Azure Blob Storage
+# Fetch only the first 10,000 bytes, which is all the detection needs
 try:
-    blob_client = container_client.get_blob_client(blob_name)
-    blob_data = blob_client.download_blob().readall()
+    sample = storage.get_range(blob_name, 0, 10000)
 
     # Detect encoding using chardet
-    result = chardet.detect(blob_data[:10000])  # Read first 10,000 bytes
+    result = chardet.detect(sample)
     detected_encoding = result["encoding"]
     print(f"🔍 Detected Encoding: {detected_encoding}")
 
@@ -0,0 +1,386 @@
+"""Opt-in stage timing and memory instrumentation for the backend scripts and API.
+
+Nothing is recorded unless AE_PROFILE=1. Then every named stage records
+wall time, CPU time, RSS before and after, how far it pushed the
+process's peak RSS, row counts when given and, with
+AE_PROFILE_TRACEMALLOC=1, the peak Python allocation inside it:
+
+    with profile_stage("read_csv") as stage:
+        df = pd.read_csv(path)
+        stage.rows = len(df)
+
+    @profiled("forecast", rows=len)
+    def forecast(...):
+
+Stages nest ("load/read_csv"). When a process exits its records go to
+AE_PROFILE_DIR/<run>/<pid>.json; worker processes a script starts write
+their own file into the same run directory, and the first process merges
+them into <run>/report.json with per-stage totals. AE_PROFILE_CPROFILE=1
+also runs cProfile on the main thread and dumps <run>/<pid>.prof (open
+it with pstats or snakeviz).
+
+With profiling off a stage still measures its wall time (stage.seconds)
+but records nothing else.
+"""
+import atexit
+import cProfile
+import functools
+import glob
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from multiprocessing import util as mp_util
+
+from dotenv import load_dotenv
+
+try:
+    import resource
+except ImportError:  # Windows has no getrusage
+    resource = None
+
+# Load environment variables (the AE_PROFILE switches may live in .env)
+load_dotenv()
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+
+def _flag(name):
+    return os.getenv(name, "").strip().lower() not in ("", "0", "false", "no")
+
+
+PROFILE_ENABLED = _flag("AE_PROFILE")
+PROFILE_TRACEMALLOC = _flag("AE_PROFILE_TRACEMALLOC")
+PROFILE_CPROFILE = _flag("AE_PROFILE_CPROFILE")
+PROFILE_DIR = os.getenv("AE_PROFILE_DIR", os.path.join(BACKEND_DIR, "raw", "profiles"))
+
+# Set for child processes so their reports land in the parent's run directory
+RUN_ENV = "AE_PROFILE_RUN"
+REPORT_NAME = "report.json"
+
+# Raw records kept per process; past this (a long-running API) only the per-stage totals grow
+MAX_RECORDS = 10000
+
+
+def rss_bytes():
+    """Current resident set size, or None off Linux."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes():
+    """The process's peak resident set size so far, or None where getrusage is missing."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Stage:
+    """One run of a named stage; set rows inside the with block to record them."""
+
+    def __init__(self, name, path, rows=None):
+        self.name = name
+        self.path = path
+        self.rows = rows
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.rss_before = None
+        self.rss_after = None
+        self.peak_rss_growth = None
+        self.tracemalloc_peak = None    # peak traced allocation above what was traced at the start
+        self.traced_start = 0
+        self.traced_peak = 0
+        self.error = None
+
+    def to_dict(self):
+        return {
+            "stage": self.name,
+            "path": self.path,
+            "seconds": round(self.seconds, 6),
+            "cpu_seconds": round(self.cpu_seconds, 6),
+            "rows": self.rows,
+            "rss_before_bytes": self.rss_before,
+            "rss_after_bytes": self.rss_after,
+            "peak_rss_growth_bytes": self.peak_rss_growth,
+            "tracemalloc_peak_bytes": self.tracemalloc_peak,
+            "error": self.error,
+        }
+
+
+def _new_total(path):
+    return {"stage": path, "calls": 0, "seconds": 0.0, "cpu_seconds": 0.0, "rows": 0, "errors": 0,
+            "max_seconds": 0.0, "max_peak_rss_growth_bytes": None, "max_tracemalloc_peak_bytes": None}
+
+
+def _largest(a, b):
+    return a if b is None else b if a is None else max(a, b)
+
+
+def add_total(totals, record):
+    """Folds one stage record (Stage.to_dict) into {path: total}."""
+    total = totals.setdefault(record["path"], _new_total(record["path"]))
+    total["calls"] += 1
+    total["seconds"] += record["seconds"]
+    total["cpu_seconds"] += record["cpu_seconds"]
+    total["rows"] += record["rows"] or 0
+    total["errors"] += record["error"] is not None
+    total["max_seconds"] = max(total["max_seconds"], record["seconds"])
+    total["max_peak_rss_growth_bytes"] = _largest(total["max_peak_rss_growth_bytes"], record["peak_rss_growth_bytes"])
+    total["max_tracemalloc_peak_bytes"] = _largest(total["max_tracemalloc_peak_bytes"],
+                                                   record["tracemalloc_peak_bytes"])
+
+
+def merge_totals(summaries):
+    """Combines per-stage summaries (lists of totals, e.g. one per process) into one, slowest first."""
+    totals = {}
+    for summary in summaries:
+        for other in summary:
+            total = totals.setdefault(other["stage"], _new_total(other["stage"]))
+            for key in ("calls", "seconds", "cpu_seconds", "rows", "errors"):
+                total[key] += other[key]
+            total["max_seconds"] = max(total["max_seconds"], other["max_seconds"])
+            for key in ("max_peak_rss_growth_bytes", "max_tracemalloc_peak_bytes"):
+                total[key] = _largest(total[key], other[key])
+    return sorted(totals.values(), key=lambda total: total["seconds"], reverse=True)
+
+
+class ProfileRun:
+    """This process's stage records and the run directory they are written to."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.main = RUN_ENV not in os.environ
+        if self.main:
+            script = os.path.splitext(os.path.basename(sys.argv[0]))[0].strip("-") or "python"
+            os.environ[RUN_ENV] = f"{script}-{time.strftime('%Y%m%d-%H%M%S')}-{self.pid}"
+        self.run_id = os.environ[RUN_ENV]
+        self.directory = os.path.join(PROFILE_DIR, self.run_id)
+        self.started = time.time()
+        self.records = []
+        self.totals = {}
+        self.finished = False
+        self._lock = threading.Lock()
+
+        if PROFILE_TRACEMALLOC and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.profiler = None
+        if PROFILE_CPROFILE and threading.current_thread() is threading.main_thread():
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        atexit.register(self.finish)
+        # multiprocessing workers leave through os._exit, which skips atexit but runs these finalizers
+        mp_util.Finalize(self, self.finish, exitpriority=0)
+
+    def add(self, stage):
+        record = stage.to_dict()
+        with self._lock:
+            if len(self.records) < MAX_RECORDS:
+                self.records.append(record)
+            add_total(self.totals, record)
+
+    def summary(self):
+        with self._lock:
+            return merge_totals([list(self.totals.values())])
+
+    def process_report(self):
+        with self._lock:
+            records = list(self.records)
+        return {
+            "pid": self.pid,
+            "argv": sys.argv,
+            "started": self.started,
+            "seconds": time.time() - self.started,
+            "rss_bytes": rss_bytes(),
+            "peak_rss_bytes": peak_rss_bytes(),
+            "tracemalloc_peak_bytes": tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None,
+            "stages": records,
+            "summary": self.summary(),
+        }
+
+    def finish(self):
+        """Writes this process's report (and, in the first process, the merged run report)."""
+        if self.finished or os.getpid() != self.pid:
+            return
+        self.finished = True
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if self.profiler is not None:
+                self.profiler.disable()
+                self.profiler.dump_stats(os.path.join(self.directory, f"{self.pid}.prof"))
+            with open(os.path.join(self.directory, f"{self.pid}.json"), "w") as f:
+                json.dump(self.process_report(), f, indent=2)
+            if self.main:
+                path = write_run_report(self.directory)
+                print(f"📊 Profile report saved to {path}")
+        except OSError as e:
+            print(f"❌ Failed to write profile report: {e}")
+
+
+def write_run_report(directory):
+    """Merges every process report in a run directory into report.json."""
+    processes = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        if os.path.basename(path) != REPORT_NAME:
+            with open(path) as f:
+                processes.append(json.load(f))
+    report = {
+        "run": os.path.basename(directory),
+        "processes": [{key: process[key] for key in ("pid", "argv", "seconds", "peak_rss_bytes",
+                                                     "tracemalloc_peak_bytes")} for process in processes],
+        "summary": merge_totals([process["summary"] for process in processes]),
+    }
+    path = os.path.join(directory, REPORT_NAME)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+_run = None
+_run_lock = threading.Lock()
+_local = threading.local()
+
+
+def current_run():
+    """This process's ProfileRun, started on first use (a forked child gets a fresh one)."""
+    global _run
+    if _run is None or _run.pid != os.getpid():
+        with _run_lock:
+            if _run is None or _run.pid != os.getpid():
+                _run = ProfileRun()
+    return _run
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+@contextmanager
+def profile_stage(name, rows=None):
+    """Times the with block as stage name (nested under any enclosing stage on this thread)."""
+    stack = _stack()
+    stage = Stage(name, "/".join([outer.name for outer in stack] + [name]), rows)
+    if not PROFILE_ENABLED:
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.seconds = time.perf_counter() - start
+        return
+
+    run = current_run()
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        # The traced peak is process wide: hand the enclosing stage its peak so far, then measure ours
+        if stack:
+            stack[-1].traced_peak = max(stack[-1].traced_peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        stage.traced_start = stage.traced_peak = tracemalloc.get_traced_memory()[0]
+    stage.rss_before = rss_bytes()
+    peak_before = peak_rss_bytes()
+    stack.append(stage)
+    start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield stage
+    except BaseException as e:
+        stage.error = type(e).__name__
+        raise
+    finally:
+        stage.seconds = time.perf_counter() - start
+        stage.cpu_seconds = time.process_time() - cpu_start
+        stack.pop()
+        stage.rss_after = rss_bytes()
+        peak_after = peak_rss_bytes()
+        stage.peak_rss_growth = None if peak_before is None else peak_after - peak_before
+        if tracing:
+            stage.traced_peak = max(stage.traced_peak, tracemalloc.get_traced_memory()[1])
+            stage.tracemalloc_peak = stage.traced_peak - stage.traced_start
+            if stack:
+                stack[-1].traced_peak = max(stack[-1].traced_peak, stage.traced_peak)
+            tracemalloc.reset_peak()
+        run.add(stage)
+        collected = getattr(_local, "collected", None)
+        if collected is not None:
+            collected.append(stage)
+
+
+def profiled(name=None, rows=None):
+    """Decorator form of profile_stage; rows(result) gives the row count to record."""
+    def decorate(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with profile_stage(stage_name) as stage:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    stage.rows = rows(result)
+                return result
+        return wrapper
+    return decorate
+
+
+# ------------------------
+# Per-request timing (the Flask app)
+# ------------------------
+
+class RequestTiming:
+    """Wall and CPU time of one request plus the stages run on its thread."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        self.seconds = None
+        self.cpu_seconds = None
+        self.stages = []
+        _local.collected = self.stages
+
+    def stop(self):
+        self.seconds = time.perf_counter() - self.start
+        self.cpu_seconds = time.thread_time() - self.cpu_start
+        _local.collected = None
+        return self
+
+    def server_timing(self):
+        """A Server-Timing header value: total, cpu and each top-level stage in milliseconds."""
+        entries = [f"total;dur={self.seconds * 1000:.2f}", f"cpu;dur={self.cpu_seconds * 1000:.2f}"]
+        entries += [f"{stage.path.replace('/', '.')};dur={stage.seconds * 1000:.2f}" for stage in self.stages
+                    if "/" not in stage.path]
+        return ", ".join(entries)
+
+
+class RequestMetrics:
+    """Per-endpoint request counts, latency totals and status codes."""
+
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, status, timing):
+        with self._lock:
+            entry = self._endpoints.setdefault(endpoint, {"requests": 0, "seconds": 0.0, "cpu_seconds": 0.0,
+                                                          "max_seconds": 0.0, "status": {}})
+            entry["requests"] += 1
+            entry["seconds"] += timing.seconds
+            entry["cpu_seconds"] += timing.cpu_seconds
+            entry["max_seconds"] = max(entry["max_seconds"], timing.seconds)
+            entry["status"][str(status)] = entry["status"].get(str(status), 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: dict(entry, status=dict(entry["status"]),
+                                   mean_ms=entry["seconds"] * 1000 / entry["requests"])
+                    for endpoint, entry in sorted(self._endpoints.items())}
+
+
+# Start the run with the process, so cProfile sees everything and child processes join this run
+if PROFILE_ENABLED:
+    current_run()
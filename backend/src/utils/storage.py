@@ -0,0 +1,221 @@
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# "azure" (default) or "local"; the local backend serves a plain directory
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "azure")
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "local_blobs")
+
+# Azure rejects batch deletes of more than 256 blobs
+DELETE_BATCH_SIZE = 256
+UPLOAD_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+@dataclass
+class BlobInfo:
+    """Listing entry shared by every backend."""
+    name: str
+    size: int
+    etag: str = None
+    last_modified: datetime = None
+    metadata: dict = field(default_factory=dict)
+
+
+class Storage:
+    """Minimal blob store interface used by the ingest scripts."""
+
+    def list(self, prefix="", include_metadata=False):
+        """Yields a BlobInfo for every blob whose name starts with prefix."""
+        raise NotImplementedError
+
+    def get(self, name):
+        """Returns the whole blob as bytes."""
+        raise NotImplementedError
+
+    def get_range(self, name, offset, length):
+        """Returns length bytes of the blob starting at offset."""
+        raise NotImplementedError
+
+    def put_stream(self, name, chunks, length=None, metadata=None, overwrite=True):
+        """Writes the blob from an iterable of byte chunks without buffering it all."""
+        raise NotImplementedError
+
+    def delete_many(self, names):
+        """Deletes the given blobs, returning how many were removed."""
+        raise NotImplementedError
+
+    def ensure_container(self):
+        """Creates the underlying container if the backend has one."""
+
+
+class LocalStorage(Storage):
+    """Blob store backed by a local directory, for offline runs and benchmarks.
+
+    Blob metadata lives in a .metadata/ sidecar directory next to the files.
+    """
+
+    METADATA_DIR = ".metadata"
+
+    def __init__(self, root=LOCAL_STORAGE_DIR):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _metadata_path(self, name):
+        return os.path.join(self.root, self.METADATA_DIR, f"{name}.json")
+
+    def _info(self, name, include_metadata):
+        stat = os.stat(self._path(name))
+        metadata = {}
+        if include_metadata and os.path.exists(self._metadata_path(name)):
+            with open(self._metadata_path(name)) as f:
+                metadata = json.load(f)
+        return BlobInfo(
+            name=name,
+            size=stat.st_size,
+            etag=f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+            last_modified=datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+            metadata=metadata,
+        )
+
+    def list(self, prefix="", include_metadata=False):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = sorted(d for d in dirnames if d != self.METADATA_DIR)
+            for filename in sorted(filenames):
+                name = os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    yield self._info(name, include_metadata)
+
+    def get(self, name):
+        with open(self._path(name), "rb") as f:
+            return f.read()
+
+    def get_range(self, name, offset, length):
+        with open(self._path(name), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def put_stream(self, name, chunks, length=None, metadata=None, overwrite=True):
+        path = self._path(name)
+        if not overwrite and os.path.exists(path):
+            raise FileExistsError(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.part"
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+
+        if metadata:
+            os.makedirs(os.path.dirname(self._metadata_path(name)), exist_ok=True)
+            with open(self._metadata_path(name), "w") as f:
+                json.dump(metadata, f)
+
+    def delete_many(self, names):
+        deleted = 0
+        for name in names:
+            for path in (self._path(name), self._metadata_path(name)):
+                if os.path.exists(path):
+                    os.remove(path)
+                    if path == self._path(name):
+                        deleted += 1
+        return deleted
+
+
+def _account_key_connection_string():
+    """Builds a connection string from AZURE_STORAGE_ACCOUNT_NAME/KEY when no full string is set."""
+    account_name = os.getenv("AZURE_STORAGE_ACCOUNT_NAME")
+    account_key = os.getenv("AZURE_STORAGE_ACCOUNT_KEY")
+    if not account_name or not account_key:
+        return None
+    return (f"DefaultEndpointsProtocol=https;AccountName={account_name};"
+            f"AccountKey={account_key};EndpointSuffix=core.windows.net")
+
+
+# One BlobServiceClient (and so one HTTP connection pool) per connection string
+_service_clients = {}
+_service_clients_lock = threading.Lock()
+
+
+def _service_client(connection_string):
+    from azure.storage.blob import BlobServiceClient
+
+    with _service_clients_lock:
+        if connection_string not in _service_clients:
+            _service_clients[connection_string] = BlobServiceClient.from_connection_string(
+                connection_string, max_block_size=UPLOAD_BLOCK_SIZE, max_single_put_size=UPLOAD_BLOCK_SIZE
+            )
+        return _service_clients[connection_string]
+
+
+class AzureStorage(Storage):
+    """Azure Blob Storage container. The client is created on first use, not at import."""
+
+    def __init__(self, connection_string=None, container_name=None):
+        self.connection_string = connection_string or os.getenv("AZURE_CONNECTION_STRING") or _account_key_connection_string()
+        self.container_name = container_name or os.getenv("AZURE_CONTAINER_NAME")
+        self._container_client = None
+
+    @property
+    def container_client(self):
+        if self._container_client is None:
+            if not self.connection_string or "AccountName" not in self.connection_string:
+                raise RuntimeError("❌ Azure Connection String is missing or malformed! Check your .env file.")
+            service = _service_client(self.connection_string)
+            self._container_client = service.get_container_client(self.container_name)
+        return self._container_client
+
+    def ensure_container(self):
+        """Creates the container if it does not exist yet."""
+        from azure.core.exceptions import ResourceExistsError
+
+        try:
+            self.container_client.create_container()
+            print(f"📂 Container '{self.container_name}' created!")
+        except ResourceExistsError:
+            print(f"📂 Container '{self.container_name}' found!")
+
+    def list(self, prefix="", include_metadata=False):
+        include = ["metadata"] if include_metadata else None
+        for blob in self.container_client.list_blobs(name_starts_with=prefix or None, include=include):
+            yield BlobInfo(
+                name=blob.name,
+                size=blob.size,
+                etag=blob.etag,
+                last_modified=blob.last_modified,
+                metadata=blob.metadata or {},
+            )
+
+    def get(self, name):
+        return self.container_client.download_blob(name).readall()
+
+    def get_range(self, name, offset, length):
+        return self.container_client.download_blob(name, offset=offset, length=length).readall()
+
+    def put_stream(self, name, chunks, length=None, metadata=None, overwrite=True):
+        self.container_client.upload_blob(name, chunks, length=length, metadata=metadata, overwrite=overwrite)
+
+    def delete_many(self, names):
+        names = list(names)
+        for start in range(0, len(names), DELETE_BATCH_SIZE):
+            self.container_client.delete_blobs(*names[start:start + DELETE_BATCH_SIZE])
+        return len(names)
+
+
+def get_storage(backend=None, **kwargs):
+    """Returns the storage backend selected by STORAGE_BACKEND (or the backend argument)."""
+    backend = (backend or STORAGE_BACKEND).lower()
+    if backend == "local":
+        return LocalStorage(**kwargs)
+    if backend == "azure":
+        return AzureStorage(**kwargs)
+    raise ValueError(f"Unknown storage backend '{backend}' (expected 'azure' or 'local')")
@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pandas as pd
+
+# Make the shared backend modules (src/...) importable when run from anywhere
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from src.data_preprocessing.add_synthetic_data import PATCHED_MONTHS, add_synthetic_data
+from src.data_preprocessing.gap_fill import MONTH_ORDER, SYNTHETIC_FLAG, fill_gaps
+
+
+def merged_frame():
+    """Two orgs starting in different years, each with one missing month inside its history."""
+    rows = []
+    for code, name, months in [("RA1", "ALPHA TRUST", ["2020-01", "2020-02", "2020-04", "2020-05"]),
+                               ("RB2", "BETA TRUST", ["2021-06", "2021-08", "2021-09"])]:
+        for value, month in enumerate(months, start=1):
+            stamp = pd.Timestamp(month)
+            rows.append({"period": f"MSitAE-{stamp:%B}-{stamp.year}".upper(), "org_code": code,
+                         "parent_org": "NHS ENGLAND", "org_name": name, "year": stamp.year,
+                         "month": MONTH_ORDER[stamp.month - 1], "total_a&e_attendances": 1000 * value})
+    return pd.DataFrame(rows)
+
+
+def months_of(df):
+    """Months since year 0 per row."""
+    return pd.to_numeric(df["year"]).astype(int) * 12 + df["month"].map(MONTH_ORDER.index)
+
+
+def assert_no_fill_before_first_real(filled):
+    synthetic = filled[SYNTHETIC_FLAG].astype(bool)
+    first_real = months_of(filled[~synthetic]).groupby(filled.loc[~synthetic, "org_code"]).min()
+    first_fill = months_of(filled[synthetic]).groupby(filled.loc[synthetic, "org_code"]).min()
+    assert (first_fill >= first_real.reindex(first_fill.index)).all()
+
+
+def test_fill_gaps_fills_only_inside_each_org_history():
+    filled = fill_gaps(merged_frame())
+    synthetic = filled[filled[SYNTHETIC_FLAG]]
+    assert sorted(zip(synthetic["org_code"], synthetic["month"])) == [("RA1", "March"), ("RB2", "July")]
+    assert_no_fill_before_first_real(filled)
+
+
+def test_add_synthetic_data_never_fills_before_an_org_first_real_row():
+    filled = add_synthetic_data(merged_frame())
+    assert_no_fill_before_first_real(filled)
+    assert not (filled["year"] == "2018").any()
+
+
+def test_patched_months_are_opt_in():
+    filled = add_synthetic_data(merged_frame(), months=PATCHED_MONTHS)
+    assert (filled.loc[filled["year"] == "2018", SYNTHETIC_FLAG]).all()
+    assert len(filled[filled["year"] == "2018"]) == 2 * len(PATCHED_MONTHS)
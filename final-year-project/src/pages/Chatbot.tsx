@@ -6,25 +6,13 @@ import {
     IonInput, IonButton, IonFooter, IonList, IonItem, IonLabel
 } from '@ionic/react';
 
-// Interfaces for data structure
-interface Prediction {
-    date: string;            // Format: YYYY-MM-DD
-    org_name: string;        // Hospital trust name
-    Predicted: number;       // Predicted A&E attendance 
-    Actual: number | null;   // Actual attendance (null for future dates)
-}
-
-interface PredictionsData {
-    predictions: Prediction[];  // Array of prediction records
-    mse: number;                // Mean Squared Error of the model
-    r2: number;                 // R-squared score of the model
-}
+import { fetchHospitals, lookupHospital } from '../services/dataService';
 
 const Chatbot: React.FC = () => {
     // State management
     const [messages, setMessages] = useState<{ from: string; text: string }[]>([]); // Chat history
     const [input, setInput] = useState('');                                         // User input
-    const [predictionsData, setPredictionsData] = useState<PredictionsData | null>(null); // Loaded prediction data
+    const [metrics, setMetrics] = useState<{ mse: number; r2: number } | null>(null); // Model performance
     const [hospitalTrusts, setHospitalTrusts] = useState<string[]>([]);             // List of unique hospitals
 
     useEffect(() => {
@@ -35,34 +23,15 @@ const Chatbot: React.FC = () => {
         };
         setMessages([welcomeMessage]);
         
-        // Load prediction data from JSON file
-        // Try multiple paths to handle both development and production environments
+        // Load the trust names and model metrics from the backend's hospital index
+        // (questions are answered server-side, so the predictions file is never downloaded)
         const fetchData = async () => {
             try {
-                const paths = ['./data/predictions.json', '/data/predictions.json', '../data/predictions.json'];
-
-                for (const path of paths) {
-                    try {
-                        const response = await fetch(path);
-                        if (response.ok) {
-                            const data = await response.json();
-                            setPredictionsData(data);
-                            
-                            // Extract unique hospital names (lowercase for case-insensitive matching)
-                            const trusts = Array.from(new Set(data.predictions.map((r: Prediction) => r.org_name.toLowerCase()))) as string[];
-                            setHospitalTrusts(trusts);
-                            console.log(`Successfully loaded data from ${path}`);
-                            console.log("Available hospitals in data:", trusts);
-                            return;
-                        }
-                    } catch (e) {
-                        console.log(`Failed to load from ${path}:`, e);
-                    }
-                }
-
-                throw new Error('Could not load predictions from any path');
+                const data = await fetchHospitals();
+                setMetrics({ mse: data.mse, r2: data.r2 });
+                setHospitalTrusts(data.hospitals.map((hospital) => hospital.org_name));
             } catch (err) {
-                console.error('Failed to load predictions:', err);
+                console.error('Failed to load hospitals:', err);
             }
         };
 
@@ -70,59 +39,43 @@ const Chatbot: React.FC = () => {
     }, []); // Empty dependency array ensures this runs only once on component mount
 
     // Handle sending a message and generating a response
-    const sendMessage = () => {
+    const sendMessage = async () => {
         if (!input.trim()) return; // Don't process empty messages
 
         // Add user message to chat
-        const userMessage = { from: 'user', text: input };
+        const question = input;
+        const userMessage = { from: 'user', text: question };
         setMessages((prev) => [...prev, userMessage]);
+        setInput(''); // Clear input field
 
         // Default bot response if no match is found
         let botText = "🤖 Sorry, I couldn't understand your question. Try asking about A&E attendance predictions for a specific hospital and time period.";
 
-        if (predictionsData) {
-            const lowerInput = input.toLowerCase();
-            
-            // STEP 1: Match hospital name in the query
-            // Improved hospital matching - looks for key words from hospital names
-            const matchedTrust = hospitalTrusts.find(trust => {
-                // Get key words from the trust name (usually first 1-2 words)
-                const trustWords = trust.split(' ');
-                const keyWords = trustWords.slice(0, Math.min(2, trustWords.length));
-                
-                // Check if any key word from the trust is in the input
-                return keyWords.some(word => lowerInput.includes(word.toLowerCase()));
-            });
-            
-            const matchedLocation = matchedTrust || null;
-
-            // STEP 2: Match month and year in the query
-            const monthMap: { [key: string]: string } = {
-                "january": "01", "february": "02", "march": "03", "april": "04", "may": "05", "june": "06",
-                "july": "07", "august": "08", "september": "09", "october": "10", "november": "11", "december": "12"
-            };
-
-            // Extract year from input (2020-2026)
-            const yearMatch = lowerInput.match(/\b(202[0-6])\b/);
-            const matchedYear = yearMatch ? yearMatch[0] : null;
-
-            // Extract month from input
-            const monthPattern = Object.keys(monthMap).join("|");
-            const monthMatch = lowerInput.match(new RegExp(`\\b(${monthPattern})\\b`));
-            const matchedMonth = monthMatch ? monthMap[monthMatch[0].toLowerCase()] : null;
-
-            // Debug logging
-            console.log("Input:", lowerInput);
-            console.log("Matched hospital:", matchedLocation);
-            console.log("Matched year:", matchedYear);
-            console.log("Matched month:", matchedMonth);
-
-            // STEP 3: Generate response based on query type
-            
+        const lowerInput = question.toLowerCase();
+
+        // STEP 1: Match month and year in the query (the hospital is matched by the backend)
+        const monthMap: { [key: string]: string } = {
+            "january": "01", "february": "02", "march": "03", "april": "04", "may": "05", "june": "06",
+            "july": "07", "august": "08", "september": "09", "october": "10", "november": "11", "december": "12"
+        };
+
+        // Extract year from input (2020-2026)
+        const yearMatch = lowerInput.match(/\b(202[0-6])\b/);
+        const matchedYear = yearMatch ? yearMatch[0] : null;
+
+        // Extract month from input
+        const monthPattern = Object.keys(monthMap).join("|");
+        const monthMatch = lowerInput.match(new RegExp(`\\b(${monthPattern})\\b`));
+        const matchedMonth = monthMatch ? monthMap[monthMatch[0].toLowerCase()] : null;
+
+        // STEP 2: Generate response based on query type
+        try {
             // Handle model performance questions
             if (lowerInput.includes("mse") || lowerInput.includes("r2") || lowerInput.includes("performance") || 
                 lowerInput.includes("accuracy") || lowerInput.includes("model")) {
-                botText = `📊 Model Performance:\nMSE: ${predictionsData.mse.toFixed(2)}\nR² Score: ${predictionsData.r2.toFixed(2)}`;
+                if (metrics) {
+                    botText = `📊 Model Performance:\nMSE: ${metrics.mse.toFixed(2)}\nR² Score: ${metrics.r2.toFixed(2)}`;
+                }
             } 
             // Handle help questions
             else if (lowerInput.includes("help") || lowerInput.includes("what can you")) {
@@ -133,50 +86,45 @@ const Chatbot: React.FC = () => {
                      lowerInput.includes("show hospital") || lowerInput.includes("what hospital")) {
                 // Get unique hospital names (first word only for brevity)
                 const uniqueHospitals = Array.from(new Set(
-                  predictionsData.predictions.map((p: Prediction) => {
-                    const nameParts = p.org_name.split(' ');
-                    return nameParts[0]; // Just return the first part of the name
-                  })
+                  hospitalTrusts.map((name) => name.split(' ')[0]) // Just the first part of the name
                 )).sort();
                 
                 botText = `📋 Available hospitals in the dataset:\n\n• ${uniqueHospitals.join('\n• ')}`;
             } 
-            // Handle specific month+year+hospital queries
-            else if (matchedLocation && matchedYear && matchedMonth) {
+            // Handle specific month+year+hospital queries: one index lookup on the backend
+            else if (matchedYear && matchedMonth) {
                 const datePrefix = `${matchedYear}-${matchedMonth}`;
-                const match = predictionsData.predictions.find((p: Prediction) =>
-                    p.date.startsWith(datePrefix) && p.org_name.toLowerCase().includes(matchedLocation.split(' ')[0])
-                );
+                const match = await lookupHospital({ text: question, month: datePrefix });
                 
-                if (match) {
-                    botText = `📈 ${match.org_name} (${datePrefix}):\nPredicted: ${match.Predicted !== null ? match.Predicted.toLocaleString() : 'Not available'}\nActual: ${match.Actual !== null ? match.Actual.toLocaleString() : 'Not available'}`;
-                } else {
-                    botText = `📊 I don't have specific data for ${matchedLocation} in ${monthMatch![0]} ${matchedYear}. Please try a different date or hospital.`;
+                if (match && match.date) {
+                    botText = `📈 ${match.org_name} (${datePrefix}):\nPredicted: ${match.Predicted != null ? match.Predicted.toLocaleString() : 'Not available'}\nActual: ${match.Actual != null ? match.Actual.toLocaleString() : 'Not available'}`;
+                } else if (match) {
+                    botText = `📊 I don't have specific data for ${match.org_name.toLowerCase()} in ${monthMatch![0]} ${matchedYear}. Please try a different date or hospital.`;
                 }
             } 
             // Handle year+hospital queries (without specific month)
-            else if (matchedLocation && matchedYear) {
-                // Find all predictions for the hospital in that year
-                const yearMatches = predictionsData.predictions.filter((p: Prediction) =>
-                    p.date.startsWith(matchedYear) && p.org_name.toLowerCase().includes(matchedLocation.split(' ')[0])
-                );
+            else if (matchedYear) {
+                // All of the hospital's months in that year
+                const match = await lookupHospital({ text: question, year: matchedYear });
+                const yearMatches = match && match.months ? match.months : [];
                 
-                if (yearMatches.length > 0) {
+                if (match && yearMatches.length > 0) {
                     const firstMatch = yearMatches[0];
                     const lastMatch = yearMatches[yearMatches.length - 1];
                     
                     // Calculate average monthly prediction
-                    botText = `📈 ${firstMatch.org_name} (${matchedYear}):\n\nAverage monthly prediction: ${Math.round(yearMatches.reduce((sum, p) => sum + (p.Predicted || 0), 0) / yearMatches.length).toLocaleString()}\n\nRange: ${firstMatch.date.substring(0, 7)} to ${lastMatch.date.substring(0, 7)}`;
-                } else {
-                    botText = `📊 I don't have data for ${matchedLocation} in ${matchedYear}. Please try a different year or hospital.`;
+                    botText = `📈 ${match.org_name} (${matchedYear}):\n\nAverage monthly prediction: ${Math.round(yearMatches.reduce((sum, p) => sum + (p.Predicted || 0), 0) / yearMatches.length).toLocaleString()}\n\nRange: ${firstMatch.date.substring(0, 7)} to ${lastMatch.date.substring(0, 7)}`;
+                } else if (match) {
+                    botText = `📊 I don't have data for ${match.org_name.toLowerCase()} in ${matchedYear}. Please try a different year or hospital.`;
                 }
             }
+        } catch (err) {
+            console.error('Failed to answer question:', err);
         }
 
         // Add bot response to chat with a slight delay for realism
         const botReply = { from: 'bot', text: botText };
         setTimeout(() => setMessages((prev) => [...prev, botReply]), 500);
-        setInput(''); // Clear input field
     };
 
     // UI Rendering
@@ -5,103 +5,129 @@ import Chart from "chart.js/auto";
 import "./Predictions.css";
 import { Link } from "react-router-dom";
 
-// Define type for prediction entries
-type PredictionEntry = {
-  org_name: string;
-  date: string;
-  Actual: number | null;
-  Predicted: number | null;
+// Manifest of the sharded predictions (written by backend/src/modelling/prediction_export.py)
+type PredictionManifest = {
+  mse: number;
+  r2: number;
+  dates: string[];
+  orgs: { name: string; shard: string }[];
 };
 
+// One trust's shard: indexes into manifest.dates, with the actual and predicted columns
+type PredictionShard = {
+  org: string;
+  d: number[];
+  a: (number | null)[];
+  p: (number | null)[];
+};
+
+const PREDICTIONS_DIR = "/data/predictions";
+
 const Predictions: React.FC = () => {
   const chartRef = useRef<Chart | null>(null);
   const [metrics, setMetrics] = useState<{ r2: number; mse: number } | null>(null);
-  const [data, setData] = useState<PredictionEntry[]>([]);
+  const [manifest, setManifest] = useState<PredictionManifest | null>(null);
   const [orgOptions, setOrgOptions] = useState<string[]>([]);
   const [selectedOrg, setSelectedOrg] = useState<string>("");
   const [searchText, setSearchText] = useState<string>("");
 
   useEffect(() => {
-    const fetchData = async () => {
+    const fetchManifest = async () => {
       try {
-        const res = await fetch("/data/predictions.json");
-        const json = await res.json();
+        // ✅ Only the small manifest (trusts, date axis, metrics) is loaded up front
+        const res = await fetch(`${PREDICTIONS_DIR}/manifest.json`);
+        const json: PredictionManifest = await res.json();
 
         setMetrics({ r2: json.r2, mse: json.mse });
+        setManifest(json);
 
-        const predictions: PredictionEntry[] = json.predictions;
-        setData(predictions);
-
-        const orgs = Array.from(new Set(predictions.map((p) => p.org_name)));
+        const orgs = json.orgs.map((org) => org.name);
         setOrgOptions(orgs);
         setSelectedOrg(orgs[0]);
       } catch (err) {
-        console.error("❌ Error loading predictions.json:", err);
+        console.error("❌ Error loading predictions manifest:", err);
       }
     };
 
-    fetchData();
+    fetchManifest();
   }, []);
 
   useEffect(() => {
-    if (!selectedOrg || data.length === 0) return;
-
-    const filtered = data
-      .filter((entry) => entry.org_name === selectedOrg)
-      .sort((a, b) => new Date(a.date).getTime() - new Date(b.date).getTime());
-
-    const labels = filtered.map((entry) => entry.date);
-    const actualData = filtered.map((entry) => entry.Actual);
-    const predictedData = filtered.map((entry) => entry.Predicted);
-
-    const ctx = document.getElementById("predictionChart") as HTMLCanvasElement;
-    if (ctx) {
-      if (chartRef.current) chartRef.current.destroy();
-
-      chartRef.current = new Chart(ctx, {
-        type: "line",
-        data: {
-          labels,
-          datasets: [
-            {
-              label: "Actual Attendances",
-              data: actualData,
-              borderColor: "#3366CC",
-              backgroundColor: "transparent",
-              borderWidth: 2,
-              tension: 0.3,
-            },
-            {
-              label: "Predicted Attendances",
-              data: predictedData,
-              borderColor: "#FF9800",
-              backgroundColor: "transparent",
-              borderDash: [5, 5],
-              borderWidth: 2,
-              tension: 0.3,
-            },
-          ],
-        },
-        options: {
-          responsive: true,
-          maintainAspectRatio: false,
-          plugins: {
-            title: {
-              display: true,
-              text: `A&E Attendance Forecast - ${selectedOrg}`,
-            },
+    if (!selectedOrg || !manifest) return;
+    const entry = manifest.orgs.find((org) => org.name === selectedOrg);
+    if (!entry) return;
+    let cancelled = false;
+
+    const drawChart = async () => {
+      // ✅ Fetch just the selected trust's shard
+      let shard: PredictionShard;
+      try {
+        const res = await fetch(`${PREDICTIONS_DIR}/${entry.shard}`);
+        shard = await res.json();
+      } catch (err) {
+        console.error(`❌ Error loading predictions for ${selectedOrg}:`, err);
+        return;
+      }
+      if (cancelled) return;
+
+      const labels = shard.d.map((index) => manifest.dates[index]);
+      const actualData = shard.a;
+      const predictedData = shard.p;
+
+      const ctx = document.getElementById("predictionChart") as HTMLCanvasElement;
+      if (ctx) {
+        if (chartRef.current) chartRef.current.destroy();
+
+        chartRef.current = new Chart(ctx, {
+          type: "line",
+          data: {
+            labels,
+            datasets: [
+              {
+                label: "Actual Attendances",
+                data: actualData,
+                borderColor: "#3366CC",
+                backgroundColor: "transparent",
+                borderWidth: 2,
+                tension: 0.3,
+              },
+              {
+                label: "Predicted Attendances",
+                data: predictedData,
+                borderColor: "#FF9800",
+                backgroundColor: "transparent",
+                borderDash: [5, 5],
+                borderWidth: 2,
+                tension: 0.3,
+              },
+            ],
           },
-          scales: {
-            y: {
-              ticks: {
-                callback: (val: any) => Number(val).toLocaleString(),
+          options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            plugins: {
+              title: {
+                display: true,
+                text: `A&E Attendance Forecast - ${selectedOrg}`,
+              },
+            },
+            scales: {
+              y: {
+                ticks: {
+                  callback: (val: any) => Number(val).toLocaleString(),
+                },
               },
             },
           },
-        },
-      });
-    }
-  }, [selectedOrg, data]);
+        });
+      }
+    };
+
+    drawChart();
+    return () => {
+      cancelled = true;
+    };
+  }, [selectedOrg, manifest]);
 
   // Filter options based on search text
   const filteredOptions = orgOptions.filter((org) =>
@@ -55,8 +55,8 @@ const Reports: React.FC = () => {
         console.error("Failed to load zscore_anomalies.json:", err)
       );
 
-    // Fetch prediction performance metrics
-    fetch("/data/predictions.json")
+    // Fetch prediction performance metrics (the small predictions manifest carries them)
+    fetch("/data/predictions/manifest.json")
       .then((res) => res.json())
       .then((data) => {
         setPredictionsData({
@@ -65,7 +65,7 @@ const Reports: React.FC = () => {
         });
       })
       .catch((err) =>
-        console.error("Failed to load predictions.json:", err)
+        console.error("Failed to load predictions manifest:", err)
       );
   }, []);
 
@@ -22,3 +22,45 @@ export const fetchAandEData = async (): Promise<AandEData[]> => {
         throw error;
     }
 };
+
+// ✅ Trust as returned by the hospital index
+export interface Hospital {
+    org_name: string;
+    org_code: string | null;
+}
+
+// ✅ One month of a trust's series
+export interface HospitalMonth {
+    date: string;
+    Actual: number | null;
+    Predicted: number | null;
+}
+
+export interface HospitalList {
+    hospitals: Hospital[];
+    mse: number;
+    r2: number;
+}
+
+// ✅ Lists the trusts with predictions (optionally searched by name/code prefix or a free-text question)
+export const fetchHospitals = async (params: { q?: string; text?: string; limit?: number } = {}): Promise<HospitalList> => {
+    const response = await axios.get<HospitalList>(`${API_URL}/hospitals`, { params });
+    return response.data;
+};
+
+// ✅ Looks up one trust's month, year or whole series.
+// Resolves to null when no trust matches, and to the trust without a date when that month has no data.
+export const lookupHospital = async (
+    params: { org?: string; text?: string; month?: string; year?: string }
+): Promise<(Hospital & Partial<HospitalMonth> & { months?: HospitalMonth[] }) | null> => {
+    try {
+        const response = await axios.get(`${API_URL}/hospitals/lookup`, { params });
+        return response.data;
+    } catch (error: any) {
+        if (error.response && error.response.status === 404) {
+            return error.response.data && error.response.data.org_name ? error.response.data : null;
+        }
+        console.error("Error looking up hospital:", error);
+        throw error;
+    }
+};